@@ -0,0 +1,312 @@
+from __future__ import annotations
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+INITIAL_MESSAGE_CAPACITY = 64
+
+
+# Node objects stay as the source of truth: their state is loaded into arrays and written
+# back by `store`, which also happens before reloading after any topology change.
+# Queues are flat arrays of (node index, message slot) entries sorted by node, FIFO within
+# each node, so the heads of all the queues can be popped at once.
+class ArrayFloodingEngine:
+
+    def __init__(self, medium: Medium) -> None:
+        self.medium = medium
+        self.load()
+
+
+    def load(self) -> None:
+        self.nodes: List[Node] = list(self.medium.nodes)
+
+        for node in self.nodes:
+            if not isinstance(node, FloodingNode):
+                raise ValueError(f'{node} is not a flooding node')
+
+            if node.queue_capacity is not None:
+                raise ValueError(f'{node} has a bounded queue, which the arrays engine does not model')
+
+            if type(node.relayed_message_ids) is not ExactFilter or type(node.consumed_message_ids) is not ExactFilter:
+                raise ValueError(f'{node} has an approximate duplicate filter, which the arrays engine does not model')
+
+        node_count = len(self.nodes)
+        self.index_of: Dict[Node, int] = {node: i for i, node in enumerate(self.nodes)}
+
+        self.node_ids = np.array([node.id for node in self.nodes], dtype=np.int64)
+        self.pos_x = np.array([node.pos.x for node in self.nodes], dtype=np.float64)
+        self.pos_y = np.array([node.pos.y for node in self.nodes], dtype=np.float64)
+        self.power = np.array([node.power for node in self.nodes], dtype=np.int64)
+        self.online = np.array([node.online for node in self.nodes], dtype=bool)
+
+        receivers = [[self.index_of[other] for other in self.medium.get_reachable_nodes_of(node)] for node in self.nodes]
+        self.adjacency_indptr = np.zeros(node_count + 1, dtype=np.int64)
+        self.adjacency_indptr[1:] = np.cumsum([len(node_receivers) for node_receivers in receivers])
+        self.adjacency_indices = np.fromiter(
+            (receiver for node_receivers in receivers for receiver in node_receivers),
+            dtype=np.int64,
+            count=int(self.adjacency_indptr[-1]))
+
+        self.messages: List[FloodingMessage] = []
+        self.slot_of: Dict[Tuple[int, int, str, int], int] = {}
+        self.slot_columns = np.zeros(INITIAL_MESSAGE_CAPACITY, dtype=np.int64)
+        self.slot_destinations = np.zeros(INITIAL_MESSAGE_CAPACITY, dtype=np.int64)
+        self.hopped_slots = np.full(INITIAL_MESSAGE_CAPACITY, -1, dtype=np.int64)
+        self.message_ids: List[int] = []
+        self.column_of: Dict[int, int] = {}
+
+        self.relayed = np.zeros((node_count, INITIAL_MESSAGE_CAPACITY), dtype=bool)
+        self.consumed = np.zeros((node_count, INITIAL_MESSAGE_CAPACITY), dtype=bool)
+
+        for i, node in enumerate(self.nodes):
+            for message_id in node.relayed_message_ids:
+                self.relayed[i, self.column_for(message_id)] = True
+
+            for message_id in node.consumed_message_ids:
+                self.consumed[i, self.column_for(message_id)] = True
+
+        self.input_nodes, self.input_slots = self.import_queues([node.input_queue for node in self.nodes])
+        self.output_nodes, self.output_slots = self.import_queues([node.output_queue for node in self.nodes])
+
+        self.topology_version = self.medium.topology_version
+
+
+    def store(self) -> None:
+        for node in self.nodes:
+            node.input_queue.clear()
+            node.output_queue.clear()
+
+        for i, slot in zip(self.input_nodes.tolist(), self.input_slots.tolist()):
+            self.nodes[i].input_queue.append(self.messages[slot])
+
+        for i, slot in zip(self.output_nodes.tolist(), self.output_slots.tolist()):
+            self.nodes[i].output_queue.append(self.messages[slot])
+
+        column_count = len(self.message_ids)
+
+        for i, node in enumerate(self.nodes):
+            node.relayed_message_ids = ExactFilter(self.message_ids[column] for column in np.flatnonzero(self.relayed[i, :column_count]))
+            node.consumed_message_ids = ExactFilter(self.message_ids[column] for column in np.flatnonzero(self.consumed[i, :column_count]))
+
+        self.medium.release_idle_nodes(self.nodes)
+
+        for node in self.nodes:
+            self.medium.mark_busy(node)
+
+
+    def synchronize(self) -> None:
+        if self.topology_version != self.medium.topology_version:
+            self.store()
+            self.load()
+
+
+    # The arrays live in this process, there is nothing to release
+    def close(self) -> None:
+        pass
+
+
+    def inject_message(self, node: FloodingNode) -> FloodingMessage:
+        self.synchronize()
+
+        message = FloodingMessage(
+            message_id=node.next_message_id,
+            destination_id=self.medium.get_highest_node_id(),
+            payload='test')
+
+        node.next_message_id += 1
+
+        if node.online:
+            node_index = self.index_of[node]
+            self.input_nodes, self.input_slots = self.enqueue(
+                self.input_nodes,
+                self.input_slots,
+                np.array([node_index], dtype=np.int64),
+                np.array([self.slot_for(message)], dtype=np.int64))
+
+            if self.medium.trace is not None:
+                self.medium.trace.record(RECEIVED, node.id, message.id)
+
+        return message
+
+
+    def has_consumed(self, node: FloodingNode, message_id: int) -> bool:
+        self.synchronize()
+        column = self.column_of.get(message_id)
+        return column is not None and bool(self.consumed[self.index_of[node], column])
+
+
+    def run_step(self) -> None:
+        self.synchronize()
+        self.process_messages()
+        self.emit_messages()
+
+
+    def is_quiescent(self) -> bool:
+        self.synchronize()
+        return not (self.online[self.input_nodes].any() or self.online[self.output_nodes].any())
+
+
+    def process_messages(self) -> None:
+        heads = self.queue_heads(self.input_nodes)
+        nodes = self.input_nodes[heads]
+        slots = self.input_slots[heads]
+
+        self.input_nodes = self.input_nodes[~heads]
+        self.input_slots = self.input_slots[~heads]
+
+        columns = self.slot_columns[slots]
+        destinations = self.slot_destinations[slots]
+
+        already_seen = self.relayed[nodes, columns] | self.consumed[nodes, columns]
+        consuming = ~already_seen & (destinations == self.node_ids[nodes])
+        relaying = ~already_seen & ~consuming
+
+        self.consumed[nodes[consuming], columns[consuming]] = True
+        self.relayed[nodes[relaying], columns[relaying]] = True
+
+        metrics = self.medium.metrics
+
+        if metrics is not None:
+            metrics.record_duplicates(int(already_seen.sum()))
+
+            for node_index, slot in zip(nodes[consuming].tolist(), slots[consuming].tolist()):
+                metrics.record_delivery(self.messages[slot], self.nodes[node_index].id)
+
+        trace = self.medium.trace
+
+        if trace is not None:
+            message_ids = self.slot_message_ids(slots)
+            trace.record_many(PROCESSED, self.node_ids[nodes], message_ids)
+            trace.record_many(DELIVERED, self.node_ids[nodes[consuming]], message_ids[consuming])
+
+        self.output_nodes, self.output_slots = self.enqueue(
+            self.output_nodes,
+            self.output_slots,
+            nodes[relaying],
+            slots[relaying])
+
+
+    def emit_messages(self) -> None:
+        heads = self.queue_heads(self.output_nodes)
+        emitters = self.output_nodes[heads]
+        slots = self.output_slots[heads]
+
+        self.output_nodes = self.output_nodes[~heads]
+        self.output_slots = self.output_slots[~heads]
+
+        starts = self.adjacency_indptr[emitters]
+        counts = self.adjacency_indptr[emitters + 1] - starts
+        total = int(counts.sum())
+
+        offsets = np.arange(total, dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+        receivers = self.adjacency_indices[np.repeat(starts, counts) + offsets]
+        received_slots = np.repeat(self.hop_slots(slots), counts)
+
+        receiving = self.online[receivers]
+
+        if self.medium.metrics is not None:
+            self.medium.metrics.record_transmissions(len(emitters))
+
+        trace = self.medium.trace
+
+        if trace is not None:
+            message_ids = self.slot_message_ids(slots)
+            trace.record_many(EMITTED, self.node_ids[emitters], message_ids)
+            trace.record_many(RECEIVED, self.node_ids[receivers[receiving]], np.repeat(message_ids, counts)[receiving])
+
+        # Emitters are popped in node order, so a stable merge keeps the same arrival order as the object engine
+        self.input_nodes, self.input_slots = self.enqueue(
+            self.input_nodes,
+            self.input_slots,
+            receivers[receiving],
+            received_slots[receiving])
+
+
+    def get_queue_depths(self) -> Tuple[int, int, int]:
+        input_depths = np.bincount(self.input_nodes[self.online[self.input_nodes]], minlength=1)
+        output_depths = np.bincount(self.output_nodes[self.online[self.output_nodes]], minlength=1)
+        return (int(input_depths.sum()), int(output_depths.sum()), int(max(input_depths.max(), output_depths.max())))
+
+
+    def queue_heads(self, queue_nodes: np.ndarray) -> np.ndarray:
+        heads = np.ones(len(queue_nodes), dtype=bool)
+        heads[1:] = queue_nodes[1:] != queue_nodes[:-1]
+        return heads & self.online[queue_nodes]
+
+
+    def enqueue(self, queue_nodes: np.ndarray, queue_slots: np.ndarray, new_nodes: np.ndarray, new_slots: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if len(new_nodes) <= 0:
+            return (queue_nodes, queue_slots)
+
+        queue_nodes = np.concatenate((queue_nodes, new_nodes))
+        queue_slots = np.concatenate((queue_slots, new_slots))
+        order = np.argsort(queue_nodes, kind='stable')
+        return (queue_nodes[order], queue_slots[order])
+
+
+    def import_queues(self, queues: List[MessageQueue]) -> Tuple[np.ndarray, np.ndarray]:
+        queue_nodes = [i for i, queue in enumerate(queues) for _ in queue]
+        queue_slots = [self.slot_for(message) for queue in queues for message in queue]
+        return (np.array(queue_nodes, dtype=np.int64), np.array(queue_slots, dtype=np.int64))
+
+
+    def hop_slots(self, slots: np.ndarray) -> np.ndarray:
+        for slot in np.unique(slots[self.hopped_slots[slots] < 0]).tolist():
+            hopped_slot = self.slot_for(self.messages[slot].hopped)
+            self.hopped_slots[slot] = hopped_slot
+
+        return self.hopped_slots[slots]
+
+
+    def slot_message_ids(self, slots: np.ndarray) -> np.ndarray:
+        return np.asarray(self.message_ids, dtype=np.int64)[self.slot_columns[slots]]
+
+
+    def slot_for(self, message: FloodingMessage) -> int:
+        key = (message.id, message.destination_id, message.payload, message.hops)
+        slot = self.slot_of.get(key)
+
+        if slot is None:
+            slot = len(self.messages)
+            self.slot_of[key] = slot
+            self.messages.append(message)
+
+            if slot >= len(self.slot_columns):
+                self.slot_columns = np.concatenate((self.slot_columns, np.zeros_like(self.slot_columns)))
+                self.slot_destinations = np.concatenate((self.slot_destinations, np.zeros_like(self.slot_destinations)))
+                self.hopped_slots = np.concatenate((self.hopped_slots, np.full_like(self.hopped_slots, -1)))
+
+            self.slot_columns[slot] = self.column_for(message.id)
+            self.slot_destinations[slot] = message.destination_id
+
+        return slot
+
+
+    def column_for(self, message_id: int) -> int:
+        column = self.column_of.get(message_id)
+
+        if column is None:
+            column = len(self.message_ids)
+            self.column_of[message_id] = column
+            self.message_ids.append(message_id)
+
+            if column >= self.relayed.shape[1]:
+                self.relayed = self.grow_columns(self.relayed)
+                self.consumed = self.grow_columns(self.consumed)
+
+        return column
+
+
+    def grow_columns(self, bitmap: np.ndarray) -> np.ndarray:
+        grown = np.zeros((bitmap.shape[0], bitmap.shape[1] * 2), dtype=bool)
+        grown[:, :bitmap.shape[1]] = bitmap
+        return grown
+
+
+from duplicate_filter import ExactFilter
+from medium import Medium
+from message import FloodingMessage
+from message_queue import MessageQueue
+from node import Node, FloodingNode
+from tracing import RECEIVED, PROCESSED, EMITTED, DELIVERED
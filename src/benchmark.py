@@ -0,0 +1,295 @@
+from __future__ import annotations
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+from simulation import Simulation, ENGINES
+from topologies import TOPOLOGIES, generate_topology
+
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+DEFAULT_MEMORY_SIZES = [1000000]
+DEFAULT_OUTPUT = 'benchmark.json'
+
+# Each case runs in a pool worker, which is daemonic and cannot start the sharded engine's own workers
+POOLED_ENGINES = tuple(engine for engine in ENGINES if engine != 'sharded')
+
+
+class MethodTimer:
+
+    def __init__(self, owner: type, method_name: str) -> None:
+        self.owner = owner
+        self.method_name = method_name
+        self.method = getattr(owner, method_name)
+        self.calls = 0
+        self.seconds = 0.0
+
+
+    def __enter__(self) -> MethodTimer:
+        method = self.method
+
+        def timed_method(*args, **kwargs):
+            started_at = time.perf_counter()
+
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.seconds += time.perf_counter() - started_at
+                self.calls += 1
+
+        setattr(self.owner, self.method_name, timed_method)
+        return self
+
+
+    def __exit__(self, *exc_info) -> None:
+        setattr(self.owner, self.method_name, self.method)
+
+
+def run_until_delivered(simulation: Simulation, max_steps: int) -> Dict:
+    message = simulation.inject_new_message()
+    delivery_steps = None
+    delivery_time = None
+
+    started_at = time.perf_counter()
+
+    while simulation.step < max_steps and not simulation.is_quiescent():
+        simulation.run_step()
+
+        if delivery_steps is None and simulation.is_delivered(message):
+            delivery_steps = simulation.step
+            delivery_time = time.perf_counter() - started_at
+
+    run_time = time.perf_counter() - started_at
+
+    return {
+        'steps': simulation.step,
+        'run_time': run_time,
+        'steps_per_second': simulation.step / run_time if run_time > 0 else None,
+        'delivered': delivery_steps is not None,
+        'delivery_steps': delivery_steps,
+        'delivery_time': delivery_time,
+    }
+
+
+def benchmark_case(kind: str, node_count: int, engine: str, seed: int, max_steps: int, shards: int = None) -> Dict:
+    logging.disable(logging.CRITICAL)
+
+    from medium import Medium
+    from node import FloodingNode
+
+    nodes_definition = generate_topology(kind, node_count, seed=seed)
+
+    started_at = time.perf_counter()
+    simulation = Simulation(engine=engine, nodes_definition=nodes_definition, shards=shards)
+    load_time = time.perf_counter() - started_at
+
+    result = {
+        'topology': kind,
+        'nodes': node_count,
+        'engine': engine,
+        'shards': simulation.shards if engine == 'sharded' else None,
+        'seed': seed,
+        'load_time': load_time,
+    }
+
+    result.update(run_until_delivered(simulation, max_steps))
+
+    # Second run with the hot methods wrapped, so the timers do not skew the throughput figures above
+    simulation = Simulation(engine=engine, nodes_definition=nodes_definition, shards=shards)
+
+    with MethodTimer(Medium, 'propagate_message') as propagate_timer, MethodTimer(FloodingNode, 'process_message') as process_timer:
+        run_until_delivered(simulation, max_steps)
+
+    result['transmissions'] = propagate_timer.calls if engine == 'objects' else None
+    result['propagate_message_time'] = propagate_timer.seconds if engine == 'objects' else None
+    result['process_message_time'] = process_timer.seconds if engine == 'objects' else None
+    result['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return result
+
+
+# Bytes per loaded node (including the medium's indices) and per message sitting in a queue. The
+# nodes definition is generated before tracing starts, so only the simulation's own objects count.
+def memory_case(kind: str, node_count: int, seed: int) -> Dict:
+    logging.disable(logging.CRITICAL)
+
+    from message import FloodingMessage
+
+    nodes_definition = generate_topology(kind, node_count, seed=seed)
+
+    tracemalloc.start()
+    simulation = Simulation(nodes_definition=nodes_definition)
+    node_bytes = tracemalloc.get_traced_memory()[0]
+
+    destination_id = simulation.medium.get_highest_node_id()
+    messages = [FloodingMessage(i, destination_id, 'test') for i in range(node_count)]
+    message_bytes = tracemalloc.get_traced_memory()[0] - node_bytes
+
+    for node, message in zip(simulation.medium.nodes, messages):
+        node.input_queue.append(message)
+
+    queued_bytes = tracemalloc.get_traced_memory()[0] - node_bytes
+    tracemalloc.stop()
+
+    return {
+        'topology': kind,
+        'nodes': node_count,
+        'seed': seed,
+        'bytes_per_node': node_bytes / node_count,
+        'bytes_per_message': message_bytes / node_count,
+        'bytes_per_queued_message': queued_bytes / node_count,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def run_isolated(function: Callable[..., Dict], *args) -> Dict:
+    # Each case runs in a fresh process, so peak RSS belongs to that case alone
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        return pool.apply(function, args)
+
+
+def compare(results: List[Dict], baseline: Dict) -> None:
+    baseline_results = {
+        (result['topology'], result['nodes'], result['engine']): result
+        for result in baseline['results']
+    }
+
+    for result in results:
+        previous = baseline_results.get((result['topology'], result['nodes'], result['engine']))
+
+        if previous is None or not previous['steps_per_second'] or not result['steps_per_second']:
+            continue
+
+        change = result['steps_per_second'] / previous['steps_per_second'] - 1
+        print(f'{result["topology"]:>10} {result["nodes"]:>7} {result["engine"]:>8}: {change:+.1%} steps/s')
+
+
+def run_throughput_cases(args: argparse.Namespace) -> List[Dict]:
+    results = []
+
+    for kind in args.topologies:
+        for node_count in args.sizes or DEFAULT_SIZES:
+            for engine in args.engines:
+                result = run_isolated(benchmark_case, kind, node_count, engine, args.seed, args.max_steps)
+                results.append(result)
+
+                print(
+                    f'{kind:>10} {node_count:>7} {engine:>8}: '
+                    f'{result["steps_per_second"] or 0:>10.1f} steps/s, '
+                    f'{result["peak_rss_kb"] / 1024:>7.1f} MiB, '
+                    f'delivered={result["delivered"]} in {result["delivery_steps"]} steps')
+
+    return results
+
+
+def run_memory_cases(args: argparse.Namespace) -> List[Dict]:
+    results = []
+
+    for kind in args.topologies:
+        for node_count in args.sizes or DEFAULT_MEMORY_SIZES:
+            result = run_isolated(memory_case, kind, node_count, args.seed)
+            results.append(result)
+
+            print(
+                f'{kind:>10} {node_count:>7}: '
+                f'{result["bytes_per_node"]:>7.0f} B/node, '
+                f'{result["bytes_per_message"]:>5.0f} B/message, '
+                f'{result["bytes_per_queued_message"]:>5.0f} B/queued message, '
+                f'{result["peak_rss_kb"] / 1024:>7.1f} MiB')
+
+    return results
+
+
+# Steps/s of the sharded engine from one worker up, and how close each count gets to a linear speedup.
+# Cases run in this process, as pool workers cannot start the shard workers.
+def run_scaling_cases(args: argparse.Namespace) -> List[Dict]:
+    results = []
+
+    for kind in args.topologies:
+        for node_count in args.sizes or DEFAULT_SIZES:
+            single_shard_rate = None
+
+            for shards in args.shards or default_shard_counts():
+                result = benchmark_case(kind, node_count, 'sharded', args.seed, args.max_steps, shards)
+
+                if shards == 1:
+                    single_shard_rate = result['steps_per_second']
+
+                if single_shard_rate and result['steps_per_second']:
+                    result['speedup'] = result['steps_per_second'] / single_shard_rate
+                    result['efficiency'] = result['speedup'] / shards
+                else:
+                    result['speedup'] = None
+                    result['efficiency'] = None
+
+                results.append(result)
+
+                print(
+                    f'{kind:>10} {node_count:>7} {shards:>3} shards: '
+                    f'{result["steps_per_second"] or 0:>10.1f} steps/s, '
+                    f'speedup {result["speedup"] or 0:>5.2f}, '
+                    f'efficiency {result["efficiency"] or 0:>6.1%}')
+
+    return results
+
+
+def default_shard_counts() -> List[int]:
+    core_count = os.cpu_count() or 1
+    shard_counts = [1]
+
+    while shard_counts[-1] * 2 <= core_count:
+        shard_counts.append(shard_counts[-1] * 2)
+
+    if shard_counts[-1] != core_count:
+        shard_counts.append(core_count)
+
+    return shard_counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the simulation over synthetic topologies')
+    parser.add_argument('--topologies', nargs='+', choices=sorted(TOPOLOGIES), default=sorted(TOPOLOGIES))
+    parser.add_argument('--sizes', nargs='+', type=int, default=None, help=f'node counts (default: {DEFAULT_SIZES}, or {DEFAULT_MEMORY_SIZES} with --memory)')
+    parser.add_argument('--engines', nargs='+', choices=POOLED_ENGINES, default=['objects'], help='engines to compare, the sharded engine is measured with --scaling')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-steps', type=int, default=100000)
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help=f'results file (default: {DEFAULT_OUTPUT})')
+    parser.add_argument('--baseline', default=None, help='previous results file to compare steps/s against')
+    parser.add_argument('--memory', action='store_true', help='measure bytes per node and per queued message instead of throughput')
+    parser.add_argument('--scaling', action='store_true', help='measure the sharded engine from 1 to N workers instead of the engines')
+    parser.add_argument('--shards', nargs='+', type=int, default=None, help='worker counts for --scaling (default: powers of two up to the core count, starting at 1)')
+    args = parser.parse_args()
+
+    if args.memory:
+        results = run_memory_cases(args)
+    elif args.scaling:
+        results = run_scaling_cases(args)
+    else:
+        results = run_throughput_cases(args)
+
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+
+    with open(args.output, 'w') as output_file:
+        json.dump(report, output_file, indent=2)
+
+    print(f'Results saved in "{args.output}"')
+
+    if args.baseline is not None and not args.memory and not args.scaling:
+        with open(args.baseline, 'r') as baseline_file:
+            compare(results, json.load(baseline_file))
+
+
+if __name__ == '__main__':
+    main()
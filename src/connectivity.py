@@ -0,0 +1,668 @@
+from __future__ import annotations
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Set, Tuple
+
+
+# Searches the diameter bounds can run before settling for a gap between them
+DIAMETER_SEARCHES = 64
+
+# Largest region around a toggled node searched for proof that its block stays biconnected without it
+LOCAL_BLOCK_LIMIT = 256
+
+
+# Analyses the directed graph of links between online nodes: links go from each emitter to the nodes in its
+# range, so with different powers they can be one way only. Everything is computed for one topology version
+# of the medium and kept up to date on toggles, which the medium reports: each result is first checked
+# around the toggled node, and only recomputed over its component when the local check is not enough.
+# Any other change is recomputed from scratch on the next `refresh`.
+class Connectivity:
+
+    def __init__(self, medium: Medium, source_id: int = 0, destination_id: int = None) -> None:
+        self.medium = medium
+        self.source_id = source_id
+
+        # The highest id at the time of each query when not given
+        self.destination_id = destination_id
+
+        self.version: int = None
+
+        # Links of every node, offline ones included, as toggles do not change them
+        self.predecessors: Dict[Node, List[Node]] = {}
+        self.neighbours: Dict[Node, Dict[Node, None]] = {}
+
+        # Hops from the source to every node it reaches
+        self.hops: Dict[Node, int] = {}
+
+        # Strongly connected components of the online nodes
+        self.component_of: Dict[Node, int] = {}
+        self.components: Dict[int, Set[Node]] = {}
+
+        # Connected components, biconnected blocks and articulation points of the online nodes, ignoring link
+        # directions. Articulation points are the nodes in more than one block.
+        self.undirected_component_of: Dict[Node, int] = {}
+        self.undirected_components: Dict[int, Set[Node]] = {}
+        self.blocks_of: Dict[Node, Set[int]] = {}
+        self.blocks: Dict[int, Set[Node]] = {}
+        self.articulation_points: Set[Node] = set()
+
+        self.next_id = 0
+
+        # Results computed on demand, dropped on every change
+        self.bounds: Tuple[int, int] = None
+        self.critical: List[Node] = None
+
+        self.medium.connectivity = self
+
+
+    def refresh(self) -> None:
+        if self.version == self.medium.topology_version:
+            return
+
+        nodes = list(self.medium.nodes)
+        self.predecessors = {node: [] for node in nodes}
+        self.neighbours = {node: {} for node in nodes}
+
+        for node in nodes:
+            for other in self.medium.get_reachable_nodes_of(node):
+                self.predecessors[other].append(node)
+                self.neighbours[node][other] = None
+                self.neighbours[other][node] = None
+
+        online_nodes = {node for node in nodes if node.online}
+
+        self.update_hops()
+
+        self.component_of = {}
+        self.components = {}
+        self.assign_components(online_nodes)
+
+        self.undirected_component_of = {}
+        self.undirected_components = {}
+        self.assign_undirected_components(online_nodes)
+
+        self.blocks_of = {}
+        self.blocks = {}
+        self.articulation_points = set()
+
+        for block in self.find_blocks(online_nodes):
+            self.add_block(block)
+
+        self.bounds = None
+        self.critical = None
+        self.version = self.medium.topology_version
+
+
+    # Called by the medium before it counts the change, so results that were up to date stay up to date
+    def update_node_status(self, node: Node) -> None:
+        if self.version != self.medium.topology_version or node not in self.predecessors or node.online == (node in self.component_of):
+            return
+
+        if node.online:
+            self.add_online_node(node)
+        else:
+            self.remove_online_node(node)
+
+        self.bounds = None
+        self.critical = None
+        self.version += 1
+
+
+    def add_online_node(self, node: Node) -> None:
+        successors = self.get_successors(node)
+        predecessors = self.get_predecessors(node)
+        neighbours = self.get_neighbours(node)
+
+        # Links only get added, so distances can only shrink from the new node onwards
+        if node is self.get_source():
+            self.relax_hops(node, 0)
+        else:
+            reached_predecessors = [self.hops[other] for other in predecessors if other in self.hops]
+
+            if len(reached_predecessors) > 0:
+                self.relax_hops(node, min(reached_predecessors) + 1)
+
+        # With all its links into one component the node just joins it, otherwise it joins every
+        # component it both reaches and is reached from
+        linked_components = {self.component_of[other] for other in [*successors, *predecessors]}
+
+        if len(successors) <= 0 or len(predecessors) <= 0:
+            self.add_component([node], self.component_of, self.components)
+        elif len(linked_components) == 1:
+            component = linked_components.pop()
+            self.components[component].add(node)
+            self.component_of[node] = component
+        else:
+            merged = self.search(node, self.get_successors).keys() & self.search(node, self.get_predecessors).keys()
+
+            for component in {self.component_of[other] for other in merged if other is not node}:
+                del self.components[component]
+
+            self.add_component(merged, self.component_of, self.components)
+
+        self.merge_undirected_components(node, neighbours)
+
+        # A node linked to two or more nodes of a block makes the block bigger and changes nothing else
+        if len(neighbours) == 1:
+            self.add_block([node, *neighbours])
+        elif len(neighbours) > 1:
+            shared_blocks = set.intersection(*(self.blocks_of.get(other, set()) for other in neighbours))
+
+            if len(shared_blocks) > 0:
+                block = shared_blocks.pop()
+                self.blocks[block].add(node)
+                self.blocks_of[node] = {block}
+            else:
+                members = self.undirected_components[self.undirected_component_of[node]]
+
+                for block in {block for other in members for block in self.blocks_of.get(other, ())}:
+                    self.remove_block(block)
+
+                for block in self.find_blocks(members):
+                    self.add_block(block)
+
+
+    def remove_online_node(self, node: Node) -> None:
+        self.remove_hops(node)
+
+        # Linked as the node was, the rest of its component still is if one of its successors reaches the
+        # others and is reached by all its predecessors without it
+        successors = self.medium.get_receivers_of(node)
+        predecessors = [other for other in self.predecessors[node] if other.online]
+        members = self.components.pop(self.component_of.pop(node))
+        members.discard(node)
+
+        if len(members) > 0:
+            start = next(other for other in successors if other in members)
+
+            if (self.reaches_all(start, self.get_successors, members, successors) and
+                    self.reaches_all(start, self.get_predecessors, members, predecessors)):
+                self.add_component(members, self.component_of, self.components)
+            else:
+                self.assign_components(members)
+
+        neighbours = [other for other in self.neighbours[node] if other.online]
+        members = self.undirected_components.pop(self.undirected_component_of.pop(node))
+        members.discard(node)
+
+        if len(members) > 0:
+            if self.reaches_all(neighbours[0], self.get_neighbours, members, neighbours):
+                self.add_component(members, self.undirected_component_of, self.undirected_components)
+            else:
+                self.assign_undirected_components(members)
+
+        for block in self.blocks_of.pop(node, set()):
+            members = self.blocks[block]
+            members.discard(node)
+
+            if len(members) > 1 and self.is_block_intact(members, node):
+                continue
+
+            self.remove_block(block)
+
+            for new_block in self.find_blocks(members):
+                self.add_block(new_block)
+
+        self.articulation_points.discard(node)
+
+
+    def get_successors(self, node: Node) -> Iterable[Node]:
+        return self.medium.get_receivers_of(node) if node.online else ()
+
+
+    def get_predecessors(self, node: Node) -> List[Node]:
+        return [other for other in self.predecessors[node] if other.online] if node.online else []
+
+
+    def get_neighbours(self, node: Node) -> List[Node]:
+        return [other for other in self.neighbours[node] if other.online] if node.online else []
+
+
+    def get_source(self) -> Node:
+        return self.medium.find_node_by_id(self.source_id)
+
+
+    def get_destination(self) -> Node:
+        destination_id = self.destination_id if self.destination_id is not None else self.medium.get_highest_node_id()
+        return self.medium.find_node_by_id(destination_id)
+
+
+    def update_hops(self) -> None:
+        self.hops = {}
+        source = self.get_source()
+
+        if source is not None and source.online:
+            self.relax_hops(source, 0)
+
+
+    def relax_hops(self, start: Node, start_hops: int) -> None:
+        if self.hops.get(start, start_hops + 1) <= start_hops:
+            return
+
+        self.hops[start] = start_hops
+        pending = deque([start])
+
+        while len(pending) > 0:
+            node = pending.popleft()
+            next_hops = self.hops[node] + 1
+
+            for other in self.get_successors(node):
+                if self.hops.get(other, next_hops + 1) > next_hops:
+                    self.hops[other] = next_hops
+                    pending.append(other)
+
+
+    # Only the nodes left without a predecessor one hop closer, level by level, need their distances again
+    def remove_hops(self, node: Node) -> None:
+        if node not in self.hops:
+            return
+
+        if node is self.get_source():
+            self.hops = {}
+            return
+
+        level = self.hops.pop(node) + 1
+        candidates = [other for other in self.medium.get_receivers_of(node) if self.hops.get(other) == level]
+        orphans: Dict[Node, None] = {}
+
+        while len(candidates) > 0:
+            next_candidates = []
+
+            for other in candidates:
+                if other in orphans or any(self.hops.get(predecessor) == level - 1 and predecessor not in orphans for predecessor in self.get_predecessors(other)):
+                    continue
+
+                orphans[other] = None
+                next_candidates.extend(successor for successor in self.get_successors(other) if self.hops.get(successor) == level + 1)
+
+            candidates = next_candidates
+            level += 1
+
+        for other in orphans:
+            del self.hops[other]
+
+        restarts = []
+
+        for other in orphans:
+            reached_predecessors = [self.hops[predecessor] for predecessor in self.get_predecessors(other) if predecessor in self.hops]
+
+            if len(reached_predecessors) > 0:
+                restarts.append((min(reached_predecessors) + 1, self.medium.node_orders[other], other))
+
+        for other_hops, _, other in sorted(restarts):
+            self.relax_hops(other, other_hops)
+
+
+    def search(self, start: Node, neighbours_of: Callable[[Node], Iterable[Node]], members: Set[Node] = None) -> Dict[Node, int]:
+        found = {start: 0}
+        pending = deque([start])
+
+        while len(pending) > 0:
+            node = pending.popleft()
+
+            for other in neighbours_of(node):
+                if other not in found and (members is None or other in members):
+                    found[other] = found[node] + 1
+                    pending.append(other)
+
+        return found
+
+
+    # Stops as soon as every target is found, which near the start is usually long before the whole component
+    def reaches_all(self, start: Node, neighbours_of: Callable[[Node], Iterable[Node]], members: Set[Node], targets: Iterable[Node]) -> bool:
+        missing = {target for target in targets if target in members}
+        missing.discard(start)
+        found = {start}
+        pending = deque([start])
+
+        while len(pending) > 0 and len(missing) > 0:
+            for other in neighbours_of(pending.popleft()):
+                if other not in found and other in members:
+                    found.add(other)
+                    missing.discard(other)
+                    pending.append(other)
+
+        return len(missing) <= 0
+
+
+    def add_component(self, members: Iterable[Node], component_of: Dict[Node, int], components: Dict[int, Set[Node]]) -> None:
+        component = self.next_id
+        self.next_id += 1
+        components[component] = set(members)
+
+        for node in components[component]:
+            component_of[node] = component
+
+
+    # Tarjan's algorithm restricted to the given nodes, without recursion so that long chains fit
+    def assign_components(self, members: Set[Node]) -> None:
+        index_of: Dict[Node, int] = {}
+        lowlink: Dict[Node, int] = {}
+        stack: List[Node] = []
+        on_stack: Set[Node] = set()
+
+        for root in members:
+            if root in index_of:
+                continue
+
+            index_of[root] = lowlink[root] = len(index_of)
+            stack.append(root)
+            on_stack.add(root)
+            path = [(root, iter(self.get_successors(root)))]
+
+            while len(path) > 0:
+                node, successors = path[-1]
+                descended = False
+
+                for other in successors:
+                    if other not in members:
+                        continue
+
+                    if other not in index_of:
+                        index_of[other] = lowlink[other] = len(index_of)
+                        stack.append(other)
+                        on_stack.add(other)
+                        path.append((other, iter(self.get_successors(other))))
+                        descended = True
+                        break
+
+                    if other in on_stack:
+                        lowlink[node] = min(lowlink[node], index_of[other])
+
+                if descended:
+                    continue
+
+                path.pop()
+
+                if len(path) > 0:
+                    parent = path[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+
+                if lowlink[node] == index_of[node]:
+                    component = []
+
+                    while True:
+                        other = stack.pop()
+                        on_stack.discard(other)
+                        component.append(other)
+
+                        if other is node:
+                            break
+
+                    self.add_component(component, self.component_of, self.components)
+
+
+    def assign_undirected_components(self, members: Set[Node]) -> None:
+        assigned: Set[Node] = set()
+
+        for node in members:
+            if node not in assigned:
+                component = self.search(node, self.get_neighbours, members).keys()
+                assigned.update(component)
+                self.add_component(component, self.undirected_component_of, self.undirected_components)
+
+
+    # The smaller components are folded into the largest one
+    def merge_undirected_components(self, node: Node, neighbours: List[Node]) -> None:
+        linked_components = {self.undirected_component_of[other] for other in neighbours}
+
+        if len(linked_components) <= 0:
+            self.add_component([node], self.undirected_component_of, self.undirected_components)
+            return
+
+        largest = max(linked_components, key=lambda component: len(self.undirected_components[component]))
+        members = self.undirected_components[largest]
+
+        for component in linked_components - {largest}:
+            for other in self.undirected_components.pop(component):
+                self.undirected_component_of[other] = largest
+                members.add(other)
+
+        members.add(node)
+        self.undirected_component_of[node] = largest
+
+
+    # Hopcroft and Tarjan's biconnected blocks over the links in either direction, restricted to the given nodes
+    def find_blocks(self, members: Set[Node]) -> List[List[Node]]:
+        blocks = []
+        index_of: Dict[Node, int] = {}
+        lowlink: Dict[Node, int] = {}
+
+        for root in members:
+            if root in index_of:
+                continue
+
+            index_of[root] = lowlink[root] = len(index_of)
+            stack = [root]
+            path = [(root, iter(self.get_neighbours(root)))]
+
+            while len(path) > 0:
+                node, neighbours = path[-1]
+                descended = False
+
+                for other in neighbours:
+                    if other not in members:
+                        continue
+
+                    if other not in index_of:
+                        index_of[other] = lowlink[other] = len(index_of)
+                        stack.append(other)
+                        path.append((other, iter(self.get_neighbours(other))))
+                        descended = True
+                        break
+
+                    lowlink[node] = min(lowlink[node], index_of[other])
+
+                if descended:
+                    continue
+
+                path.pop()
+
+                if len(path) <= 0:
+                    continue
+
+                parent = path[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+
+                # Nothing below the node reaches above its parent, so they close a block
+                if lowlink[node] >= index_of[parent]:
+                    block = [parent]
+
+                    while True:
+                        other = stack.pop()
+                        block.append(other)
+
+                        if other is node:
+                            break
+
+                    blocks.append(block)
+
+        return blocks
+
+
+    def add_block(self, members: Iterable[Node]) -> None:
+        block = self.next_id
+        self.next_id += 1
+        self.blocks[block] = set(members)
+
+        for node in self.blocks[block]:
+            self.blocks_of.setdefault(node, set()).add(block)
+            self.update_articulation_point(node)
+
+
+    def remove_block(self, block: int) -> None:
+        for node in self.blocks.pop(block):
+            node_blocks = self.blocks_of.get(node)
+
+            if node_blocks is None:
+                continue
+
+            node_blocks.discard(block)
+
+            if len(node_blocks) <= 0:
+                del self.blocks_of[node]
+
+            self.update_articulation_point(node)
+
+
+    def update_articulation_point(self, node: Node) -> None:
+        if len(self.blocks_of.get(node, ())) > 1:
+            self.articulation_points.add(node)
+        else:
+            self.articulation_points.discard(node)
+
+
+    # Every cut the block could have without the node would have to separate some of the node's neighbours,
+    # so a biconnected region of the block that holds all of them proves there is none
+    def is_block_intact(self, members: Set[Node], node: Node) -> bool:
+        region = {other for other in self.neighbours[node] if other in members}
+        frontier = list(region)
+
+        while len(region) <= LOCAL_BLOCK_LIMIT:
+            region_blocks = self.find_blocks(region)
+
+            if len(region_blocks) == 1 and len(region_blocks[0]) == len(region):
+                return True
+
+            frontier = list({other: None for inner in frontier for other in self.get_neighbours(inner) if other in members and other not in region})
+
+            if len(frontier) <= 0:
+                return False
+
+            region.update(frontier)
+
+        return False
+
+
+    def get_largest_component(self) -> Set[Node]:
+        self.refresh()
+        return max(self.components.values(), key=len, default=set())
+
+
+    def is_reachable(self) -> bool:
+        return self.get_min_hops() is not None
+
+
+    def get_min_hops(self) -> int:
+        self.refresh()
+        return self.hops.get(self.get_destination())
+
+
+    def get_shortest_path(self) -> List[Node]:
+        self.refresh()
+        node = self.get_destination()
+
+        if node not in self.hops:
+            return []
+
+        path = [node]
+
+        while self.hops[node] > 0:
+            node = next(other for other in self.get_predecessors(node) if self.hops.get(other) == self.hops[node] - 1)
+            path.append(node)
+
+        return path[::-1]
+
+
+    # Bounds of the diameter of the largest strongly connected component, narrowed as in DiFUB (Crescenzi et al.):
+    # from a central node, the nodes farthest from it or to it are searched until no pair further apart than
+    # the longest distance found can be left. They are the exact diameter when they meet, and only stay apart
+    # when the search budget runs out first.
+    def get_diameter_bounds(self) -> Tuple[int, int]:
+        self.refresh()
+
+        if self.bounds is None:
+            members = self.get_largest_component()
+            self.bounds = (0, 0) if len(members) <= 1 else self.narrow_diameter(members)
+
+        return self.bounds
+
+
+    def narrow_diameter(self, members: Set[Node]) -> Tuple[int, int]:
+        # Half way along a longest path from any node is usually close to the centre
+        start = min(members, key=self.medium.node_orders.__getitem__)
+        forwards = self.search(start, self.get_successors, members)
+        center = self.walk_back(max(forwards, key=forwards.__getitem__), forwards, max(forwards.values()) // 2)
+
+        forwards = self.search(center, self.get_successors, members)
+        backwards = self.search(center, self.get_predecessors, members)
+        searches = 3
+
+        level = max(max(forwards.values()), max(backwards.values()))
+        lower = level
+        upper = 2 * level
+
+        forward_levels: Dict[int, List[Node]] = {}
+        backward_levels: Dict[int, List[Node]] = {}
+
+        for node, distance in forwards.items():
+            forward_levels.setdefault(distance, []).append(node)
+
+        for node, distance in backwards.items():
+            backward_levels.setdefault(distance, []).append(node)
+
+        # Any pair further apart than twice the level has an end beyond it, and those ends have been searched
+        while lower < upper and level > 0:
+            level_searches = [(node, self.get_predecessors) for node in forward_levels.get(level, ())]
+            level_searches += [(node, self.get_successors) for node in backward_levels.get(level, ())]
+
+            if searches + len(level_searches) > DIAMETER_SEARCHES:
+                break
+
+            for node, neighbours_of in level_searches:
+                lower = max(lower, max(self.search(node, neighbours_of, members).values()))
+
+            searches += len(level_searches)
+            level -= 1
+            upper = max(lower, 2 * level)
+
+        return (lower, upper)
+
+
+    # The node at the given distance on a shortest path to `node`, following the distances of a forward search
+    def walk_back(self, node: Node, distances: Dict[Node, int], distance: int) -> Node:
+        while distances[node] > distance:
+            node = next(other for other in self.get_predecessors(node) if distances.get(other) == distances[node] - 1)
+
+        return node
+
+
+    # Nodes every path from the source to the destination goes through, all of them on the shortest one
+    def get_critical_nodes(self) -> List[Node]:
+        self.refresh()
+
+        if self.critical is None:
+            self.critical = []
+            path = self.get_shortest_path()
+
+            for node in path[1:-1]:
+                reached = self.search(path[0], lambda other: [n for n in self.get_successors(other) if n is not node])
+
+                if path[-1] not in reached:
+                    self.critical.append(node)
+
+        return self.critical
+
+
+    def summary(self) -> Dict:
+        self.refresh()
+        lower, upper = self.get_diameter_bounds()
+        destination = self.get_destination()
+
+        return {
+            'online_nodes': len(self.component_of),
+            'source': self.source_id,
+            'destination': destination.id if destination is not None else None,
+            'reachable': self.is_reachable(),
+            'min_hops': self.get_min_hops(),
+            'reached_from_source': len(self.hops),
+            'strong_components': len(self.components),
+            'largest_strong_component': len(self.get_largest_component()),
+            'diameter_lower_bound': lower,
+            'diameter_upper_bound': upper,
+            'articulation_points': len(self.articulation_points),
+            'critical_nodes': [node.id for node in self.get_critical_nodes()],
+        }
+
+
+from medium import Medium
+from node import Node
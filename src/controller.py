@@ -1,12 +1,17 @@
 import logging
 import math
-from typing import Tuple
+from typing import Dict, Iterator, List, Set, Tuple
 
+import numpy as np
 import pygame
 
 from simulation import Simulation
+from connectivity import Connectivity
+from medium import Medium
 from node import Node
 from point import Point
+from replay import Timeline
+from tracing import TRACE_FILE, EMITTED, DELIVERED
 
 
 GRID_SIZE = 20
@@ -34,6 +39,11 @@ LINK_LINE_WIDTH = 2
 LINK_ARROW_HEAD_SIZE = 4
 LINK_COLOR = (50, 50, 150)
 
+# Rings around the nodes that matter for getting from node 0 to the highest id
+CONNECTIVITY_PATH_COLOR = (0, 200, 0)
+CONNECTIVITY_CUT_COLOR = (255, 80, 80)
+CONNECTIVITY_UNREACHED_COLOR = (90, 90, 90)
+
 MESSAGE_SIZE = 3
 MESSAGE_COLORS = [
     (200, 200, 0),
@@ -46,6 +56,21 @@ MESSAGE_COLORS = [
 FONT_FAMILY = 'monospace'
 FONT_SIZE = 12
 
+# Zoom is measured in pixels per world unit, the default view keeps the original fixed geometry
+MIN_ZOOM = 0.05
+MAX_ZOOM = 200
+ZOOM_STEP = 1.25
+
+# Below DETAIL_ZOOM labels, axis ticks and arrowheads are skipped, below DENSITY_ZOOM nodes are aggregated into tiles
+DETAIL_ZOOM = 12
+DENSITY_ZOOM = 3
+NODE_MIN_SIZE = 2
+DENSITY_TILE_SIZE = 6
+DENSITY_SATURATION = 16
+
+# Beyond this many changed nodes it is cheaper to rebuild the whole static layer
+DIRTY_NODE_LIMIT = 50
+
 
 logging.basicConfig(
     format  = '%(asctime)-5s.%(msecs)03d | %(levelname)-7s | %(message)s',
@@ -63,6 +88,28 @@ class Engine:
         self.screen = pygame.display.set_mode(SCREEN_GEOMETRY, 0, 32)
         pygame.display.set_caption('Mesh Viewer')
 
+        self.static_layer = pygame.Surface(SCREEN_GEOMETRY).convert()
+        self.scratch_layer = self.static_layer.copy()
+        self.labels: Dict[int, pygame.Surface] = {}
+
+        self.viewport = Viewport()
+
+        self.rendered_medium: Medium = None
+        self.rendered_version = -1
+        self.rendered_view: Tuple = None
+        self.visible_nodes: List[Node] = []
+        self.rendered_states: Dict[Node, Tuple] = {}
+        self.rendered_max_power = 0
+        self.cell_counts_key: Tuple = None
+        self.cell_counts: Tuple[np.ndarray, np.ndarray, np.ndarray] = None
+        self.overlay_rects: List[pygame.Rect] = []
+        self.full_redraw = True
+
+        self.connectivity: Connectivity = None
+        self.show_connectivity = False
+        self.path_key: Tuple = None
+        self.path_nodes: Set[Node] = set()
+
         self.running = False
 
 
@@ -87,7 +134,13 @@ class Engine:
           - M:                 Inject a new message
           - SPACE:             Run a simulation step
           - R:                 Reset and refresh
+          - I:                 Print simulation metrics
+          - G:                 Show/hide and print connectivity (shortest path, articulation points, unreached nodes)
+          - T:                 Start/stop recording a trace
           - Mouse over a node: Display power range and reached nodes
+          - Mouse-wheel on empty space, +/-: Zoom in/out
+          - Middle-button drag:              Pan
+          - 0:                               Reset view
 
         Edition controls:
           - Left-click on a node: Toggle online/offline
@@ -100,7 +153,7 @@ class Engine:
         Common controls:
           - ESC: Exit
         ''')
-        self.simulation = Simulation()
+        self.simulation = Simulation(collect_metrics=True)
 
 
     def update(self, frame: int) -> None:
@@ -117,14 +170,20 @@ class Engine:
                     self.simulation.inject_new_message()
                 elif event.key == pygame.K_r:
                     self.simulation.refresh()
+                elif event.key == pygame.K_i:
+                    self.print_metrics()
+                elif event.key == pygame.K_g:
+                    self.toggle_connectivity()
+                elif event.key == pygame.K_t:
+                    self.toggle_trace()
                 elif event.key == pygame.K_c and pygame.key.get_mods() & pygame.KMOD_CTRL:
                     self.simulation.clear_all_nodes()
                 elif event.key == pygame.K_s and pygame.key.get_mods() & pygame.KMOD_CTRL:
                     self.simulation.save()
-                elif event.key == pygame.K_PLUS or event.key == pygame.K_KP_PLUS:
-                    print(":D")
                 elif event.key == pygame.K_ESCAPE:
                     self.running = False
+                else:
+                    self.update_viewport(event)
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 left_button = pygame.mouse.get_pressed()[0]
                 right_button = pygame.mouse.get_pressed()[2]
@@ -132,117 +191,447 @@ class Engine:
                 wheel_down = event.button == 5
 
                 mouse_pos = Point.from_mouse_pos(pygame.mouse.get_pos())
-
-                for node in self.simulation.medium.nodes:
-                    if mouse_pos.distance_to(node_to_screen_pos(node)) <= NODE_SIZE:
-                        if left_button:
-                            node.online = not node.online
-                        elif right_button:
-                            self.simulation.remove_node(node)
-                        elif wheel_up:
-                            node.power += 1
-                        elif wheel_down:
-                            node.power -= 1
-
-                        break
+                node = self.find_node_under(mouse_pos)
+
+                if node is not None:
+                    if left_button:
+                        node.online = not node.online
+                    elif right_button:
+                        self.simulation.remove_node(node)
+                    elif wheel_up:
+                        node.power += 1
+                    elif wheel_down:
+                        node.power -= 1
+                elif right_button:
+                    self.simulation.create_node(self.viewport.screen_to_grid_point(mouse_pos))
                 else:
-                    if right_button:
-                        self.simulation.create_node(screen_pos_to_point(mouse_pos))
+                    self.update_viewport(event)
+            else:
+                self.update_viewport(event)
+
+
+    def update_viewport(self, event: pygame.event.Event) -> None:
+        if event.type == pygame.KEYDOWN:
+            screen_center = Point(SCREEN_WIDTH / 2, SCREEN_HEIGHT / 2)
+
+            if event.key in (pygame.K_PLUS, pygame.K_KP_PLUS, pygame.K_EQUALS):
+                self.viewport.zoom_at(screen_center, ZOOM_STEP)
+            elif event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+                self.viewport.zoom_at(screen_center, 1 / ZOOM_STEP)
+            elif event.key in (pygame.K_0, pygame.K_KP0):
+                self.viewport = Viewport()
+        elif event.type == pygame.MOUSEBUTTONDOWN:
+            if event.button == 4:
+                self.viewport.zoom_at(Point.from_mouse_pos(event.pos), ZOOM_STEP)
+            elif event.button == 5:
+                self.viewport.zoom_at(Point.from_mouse_pos(event.pos), 1 / ZOOM_STEP)
+        elif event.type == pygame.MOUSEMOTION and event.buttons[1]:
+            self.viewport.pan(event.rel[0], event.rel[1])
+
+
+    def print_metrics(self) -> None:
+        for name, value in self.simulation.metrics.summary().items():
+            print(f'  {name + ":":<28}{value}')
+
+
+    def toggle_connectivity(self) -> None:
+        self.show_connectivity = not self.show_connectivity
+
+        if self.show_connectivity:
+            for name, value in self.get_connectivity().summary().items():
+                print(f'  {name + ":":<28}{value}')
+
+
+    # Kept across frames so that toggles update it in place, and replaced along with the medium
+    def get_connectivity(self) -> Connectivity:
+        if self.connectivity is None or self.connectivity.medium is not self.medium:
+            self.connectivity = Connectivity(self.medium)
+
+        self.connectivity.refresh()
+        return self.connectivity
+
+
+    def toggle_trace(self) -> None:
+        if self.simulation.trace is None:
+            self.simulation.start_trace(TRACE_FILE)
+        else:
+            self.simulation.stop_trace()
+
+
+    @property
+    def medium(self) -> Medium:
+        return self.simulation.medium
 
 
     def draw(self) -> None:
-        self.screen.fill(BACKGROUND_COLOR)
+        static_rects = self.update_static_layer()
+
+        # Overlays of the previous frame are erased by restoring the static layer below them
+        for rect in self.overlay_rects + static_rects:
+            self.screen.blit(self.static_layer, rect, rect)
+
+        overlay_rects = []
+        medium = self.medium
+
+        hovered_node = self.find_node_under(Point.from_mouse_pos(pygame.mouse.get_pos()))
+
+        if hovered_node is not None and self.viewport.zoom >= DENSITY_ZOOM:
+            overlay_rects.append(self.draw_node_range(hovered_node))
+
+            for other in medium.get_reachable_nodes_of(hovered_node):
+                overlay_rects.append(self.highlight_node(other))
+
+        if self.show_connectivity and self.viewport.zoom >= DENSITY_ZOOM:
+            overlay_rects.extend(self.draw_connectivity())
+
+        for node in self.visible_nodes:
+            if len(node.input_queue) > 0:
+                overlay_rects.extend(self.draw_messages(node))
+
+        if self.full_redraw:
+            pygame.display.update()
+            self.full_redraw = False
+        else:
+            pygame.display.update(self.overlay_rects + static_rects + overlay_rects)
+
+        self.overlay_rects = overlay_rects
+
+
+    # Axes, links and node bodies only change with the topology or the view, so they live on an off-screen
+    # layer where just the regions around changed nodes are repainted
+    def update_static_layer(self) -> List[pygame.Rect]:
+        medium = self.medium
+        view = self.viewport.state
+
+        topology_changed = medium is not self.rendered_medium or medium.topology_version != self.rendered_version
+
+        if not topology_changed and view == self.rendered_view:
+            return []
+
+        changed_nodes = []
+        removed_nodes = []
+        old_states = {}
 
-        self.draw_axis()
+        # A new medium is rendered whole and from then on reports the nodes that change, so neither
+        # topology changes nor panning and zooming visit all the nodes
+        if medium is not self.rendered_medium:
+            self.rendered_states = {node: node_state(node) for node in medium.nodes}
+            medium.changed_nodes = {}
+        elif topology_changed:
+            reported_nodes = medium.changed_nodes
+            medium.changed_nodes = {}
 
-        mouse_pos = Point.from_mouse_pos(pygame.mouse.get_pos())
+            for node in reported_nodes:
+                old_state = self.rendered_states.get(node)
 
-        for node in self.simulation.medium.nodes:
-            if mouse_pos.distance_to(node_to_screen_pos(node)) <= NODE_SIZE:
-                self.draw_node_range(node)
+                if node in medium.node_orders:
+                    new_state = node_state(node)
 
-                for other in self.simulation.medium.nodes:
-                    if node.id != other.id and node.pos.distance_to(other.pos) <= node.power:
-                        self.highlight_node(other)
+                    if new_state != old_state:
+                        self.rendered_states[node] = new_state
+                        old_states[node] = old_state
+                        changed_nodes.append(node)
+                elif old_state is not None:
+                    del self.rendered_states[node]
+                    old_states[node] = old_state
+                    removed_nodes.append(node)
 
-        for node in self.simulation.medium.nodes:
+        full_rebuild = (
+            medium is not self.rendered_medium or
+            view != self.rendered_view or
+            self.viewport.zoom < DENSITY_ZOOM or
+            len(changed_nodes) + len(removed_nodes) > DIRTY_NODE_LIMIT)
+
+        max_power = self.get_max_power()
+
+        self.rendered_medium = medium
+        self.rendered_version = medium.topology_version
+        self.rendered_view = view
+
+        if full_rebuild:
+            self.rendered_max_power = max_power
+            self.rebuild_static_layer()
+            return []
+
+        # Whatever was drawn for a node lies around its old state and whatever is drawn now around its new one
+        dirty_rects = [self.get_dirty_rect(old_states[node], self.rendered_max_power) for node in removed_nodes]
+
+        for node in changed_nodes:
+            if old_states[node] is not None:
+                dirty_rects.append(self.get_dirty_rect(old_states[node], self.rendered_max_power))
+
+            dirty_rects.append(self.get_dirty_rect(self.rendered_states[node], max_power))
+
+        dirty_rects = [rect.clip(self.static_layer.get_rect()) for rect in dirty_rects]
+        dirty_rects = [rect for rect in dirty_rects if rect.width > 0 and rect.height > 0]
+
+        if sum(rect.width * rect.height for rect in dirty_rects) > SCREEN_WIDTH * SCREEN_HEIGHT / 2:
+            self.rendered_max_power = max_power
+            self.rebuild_static_layer()
+            return []
+
+        for rect in dirty_rects:
+            self.repaint_static_region(rect)
+
+        self.rendered_max_power = max_power
+        self.visible_nodes = self.find_visible_nodes()
+        return dirty_rects
+
+
+    def rebuild_static_layer(self) -> None:
+        self.static_layer.fill(BACKGROUND_COLOR)
+
+        if self.viewport.zoom < DENSITY_ZOOM:
+            self.draw_density(self.static_layer)
+            self.draw_axis(self.static_layer)
+            self.visible_nodes = []
+        else:
+            self.draw_axis(self.static_layer)
+
+            # Only nodes close enough to the view to draw anything on it are visited
+            min_pos, max_pos = self.viewport.world_bounds(self.get_draw_margin())
+            nodes = self.sort_nodes(self.medium.grid.query_rect(min_pos, max_pos))
+            self.draw_nodes_and_links(self.static_layer, nodes)
+            self.visible_nodes = self.find_visible_nodes()
+
+        self.screen.blit(self.static_layer, (0, 0))
+        self.overlay_rects = []
+        self.full_redraw = True
+
+
+    # Clipping moves the pixels of clipped lines, so regions are drawn unclipped on a scratch layer and copied
+    def repaint_static_region(self, rect: pygame.Rect) -> None:
+        self.scratch_layer.fill(BACKGROUND_COLOR, rect)
+        self.draw_axis(self.scratch_layer)
+
+        # Any link crossing the region starts at most one power range away from it
+        center = self.viewport.screen_to_world(Point(rect.centerx, rect.centery))
+        radius = math.hypot(rect.width, rect.height) / 2 / self.viewport.zoom + self.get_draw_margin()
+        nodes = self.sort_nodes(self.medium.grid.query(center, radius))
+        self.draw_nodes_and_links(self.scratch_layer, nodes)
+
+        self.static_layer.blit(self.scratch_layer, rect, rect)
+
+
+    def draw_nodes_and_links(self, surface: pygame.Surface, nodes: List[Node]) -> None:
+        for node in nodes:
             if not node.online:
                 continue
 
-            for other in self.simulation.medium.nodes:
-                if node.id != other.id and other.online and node.pos.distance_to(other.pos) <= node.power:
-                    self.draw_link(node, other)
+            for other in self.medium.get_receivers_of(node):
+                self.draw_link(surface, node, other)
+
+        for node in nodes:
+            self.draw_node(surface, node)
+
+
+    def sort_nodes(self, nodes: Iterator[Node]) -> List[Node]:
+        return sorted(nodes, key=self.medium.node_orders.__getitem__)
+
+
+    # World distance from the view at which a node can still draw a link or its body inside it
+    def get_draw_margin(self) -> float:
+        return self.get_max_power() + 2 * self.viewport.node_size / self.viewport.zoom
+
+
+    def find_visible_nodes(self) -> List[Node]:
+        min_pos, max_pos = self.viewport.world_bounds(2 * self.viewport.node_size / self.viewport.zoom)
+        return list(self.medium.grid.query_rect(min_pos, max_pos))
+
+
+    # Links are never longer than the strongest power, so this covers everything drawn for or towards a node
+    def get_dirty_rect(self, state: Tuple, max_power: int) -> pygame.Rect:
+        x, y, _, _, node_id = state
+        center = self.viewport.world_to_screen(Point(x, y))
+        label = self.get_label(node_id)
+        reach = max_power * self.viewport.zoom + self.viewport.node_size
+        half_width = max(reach, label.get_width() / 2) + NODE_BORDER_SIZE
+        half_height = max(reach, label.get_height() / 2) + NODE_BORDER_SIZE
+
+        return pygame.Rect(
+            math.floor(center.x - half_width) - 1,
+            math.floor(center.y - half_height) - 1,
+            math.ceil(half_width * 2) + 3,
+            math.ceil(half_height * 2) + 3)
+
+
+    def get_max_power(self) -> int:
+        return max(max(self.medium.power_counts, default=0), 0)
+
+
+    def get_label(self, node_id: int) -> pygame.Surface:
+        label = self.labels.get(node_id)
+
+        if label is None:
+            label = self.font.render(str(node_id), False, NODE_TEXT_COLOR)
+            self.labels[node_id] = label
+
+        return label
+
+
+    def find_node_under(self, screen_pos: Point) -> Node:
+        return self.medium.find_node_at(self.viewport.screen_to_world(screen_pos), self.viewport.node_size / self.viewport.zoom)
 
-        for node in self.simulation.medium.nodes:
-            self.draw_node(node)
 
-        for node in self.simulation.medium.nodes:
-            self.draw_messages(node)
+    def draw_axis(self, surface: pygame.Surface) -> None:
+        origin = self.viewport.world_to_screen(Point(0, 0))
 
-        pygame.display.update()
-    
+        pygame.draw.line(surface, AXIS_COLOR, (0, origin.y), (SCREEN_WIDTH, origin.y))
+        pygame.draw.line(surface, AXIS_COLOR, (origin.x, 0), (origin.x, SCREEN_HEIGHT))
 
-    def draw_axis(self) -> None:
-        pygame.draw.line(self.screen, AXIS_COLOR, (0, SCREEN_HEIGHT/2), (SCREEN_WIDTH, SCREEN_HEIGHT/2))
-        pygame.draw.line(self.screen, AXIS_COLOR, (SCREEN_WIDTH/2, 0), (SCREEN_WIDTH/2, SCREEN_HEIGHT))
+        if self.viewport.zoom < DETAIL_ZOOM:
+            return
 
-        for i in range(1, int(SCREEN_WIDTH/GRID_SIZE)):
-            pygame.draw.line(
-                self.screen,
-                AXIS_COLOR,
-                (GRID_SIZE * i, SCREEN_HEIGHT/2 - 4),
-                (GRID_SIZE * i, SCREEN_HEIGHT/2 + 4))
+        min_pos, max_pos = self.viewport.world_bounds(0)
 
-        for i in range(1, int(SCREEN_WIDTH/GRID_SIZE)):
-            pygame.draw.line(
-                self.screen,
-                AXIS_COLOR,
-                (SCREEN_WIDTH/2 - 4, GRID_SIZE * i),
-                (SCREEN_WIDTH/2 + 4, GRID_SIZE * i))
+        for x in range(math.ceil(min_pos.x), math.floor(max_pos.x) + 1):
+            screen_x = self.viewport.world_to_screen(Point(x, 0)).x
 
+            if 0 < screen_x < SCREEN_WIDTH:
+                pygame.draw.line(
+                    surface,
+                    AXIS_COLOR,
+                    (screen_x, origin.y - 4),
+                    (screen_x, origin.y + 4))
 
-    def draw_node(self, node: Node) -> None:
-        center = node_to_screen_pos(node)
+        for y in range(math.ceil(min_pos.y), math.floor(max_pos.y) + 1):
+            screen_y = self.viewport.world_to_screen(Point(0, y)).y
+
+            if 0 < screen_y < SCREEN_HEIGHT:
+                pygame.draw.line(
+                    surface,
+                    AXIS_COLOR,
+                    (origin.x - 4, screen_y),
+                    (origin.x + 4, screen_y))
+
+
+    # Each tile groups enough grid cells to be a few pixels wide and is shaded by how many nodes it holds.
+    # Tiles are counted with NumPy over the occupied cells and drawn as one scaled image.
+    def draw_density(self, surface: pygame.Surface) -> None:
+        cell_x, cell_y, counts = self.get_cell_counts()
+
+        cell_size = self.medium.grid.cell_size
+        cells_per_tile = max(1, math.ceil(DENSITY_TILE_SIZE / (cell_size * self.viewport.zoom)))
+        tile_size = cell_size * cells_per_tile
+
+        min_pos, max_pos = self.viewport.world_bounds(0)
+        min_tile_x, max_tile_x = math.floor(min_pos.x / tile_size), math.floor(max_pos.x / tile_size)
+        min_tile_y, max_tile_y = math.floor(min_pos.y / tile_size), math.floor(max_pos.y / tile_size)
+
+        tile_x = cell_x // cells_per_tile
+        tile_y = cell_y // cells_per_tile
+        visible = (tile_x >= min_tile_x) & (tile_x <= max_tile_x) & (tile_y >= min_tile_y) & (tile_y <= max_tile_y)
+
+        # Surface arrays are indexed by (x, y) with y growing downwards
+        tile_counts = np.zeros((max_tile_x - min_tile_x + 1, max_tile_y - min_tile_y + 1))
+        np.add.at(tile_counts, (tile_x[visible] - min_tile_x, max_tile_y - tile_y[visible]), counts[visible])
+
+        density = np.minimum(1, np.log1p(tile_counts) / math.log1p(DENSITY_SATURATION))[..., np.newaxis]
+        background = np.array(BACKGROUND_COLOR)
+        colors = (background + (np.array(NODE_ONLINE_COLOR) - background) * density).astype(np.uint8)
+
+        tile_pixels = tile_size * self.viewport.zoom
+        image = pygame.transform.scale(
+            pygame.surfarray.make_surface(colors),
+            (round(tile_counts.shape[0] * tile_pixels), round(tile_counts.shape[1] * tile_pixels)))
+
+        top_left = self.viewport.world_to_screen(Point(min_tile_x * tile_size, (max_tile_y + 1) * tile_size))
+        surface.blit(image, (math.floor(top_left.x), math.floor(top_left.y)))
+
+
+    # The occupied grid cells as arrays, rebuilt only when the topology changes
+    def get_cell_counts(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        medium = self.medium
+
+        if self.cell_counts_key != (medium, medium.topology_version):
+            cell_counts = list(medium.grid.cell_counts())
+            self.cell_counts = (
+                np.array([cell[0] for cell, _ in cell_counts], dtype=np.int64),
+                np.array([cell[1] for cell, _ in cell_counts], dtype=np.int64),
+                np.array([count for _, count in cell_counts], dtype=np.int64))
+            self.cell_counts_key = (medium, medium.topology_version)
+
+        return self.cell_counts
+
+
+    def draw_node(self, surface: pygame.Surface, node: Node) -> None:
+        node_size = self.viewport.node_size
+        center = self.viewport.world_to_screen(node.pos)
 
         node_color = NODE_ONLINE_COLOR if node.online else NODE_OFFLINE_COLOR
         node_border_color = NODE_ONLINE_BORDER_COLOR if node.online else NODE_OFFLINE_BORDER_COLOR
         
-        pygame.draw.circle(self.screen, node_color, (center.x, center.y), NODE_SIZE - NODE_BORDER_SIZE)
-        pygame.draw.circle(self.screen, node_border_color, (center.x, center.y), NODE_SIZE, NODE_BORDER_SIZE)
+        pygame.draw.circle(surface, node_color, (center.x, center.y), node_size - NODE_BORDER_SIZE)
+        pygame.draw.circle(surface, node_border_color, (center.x, center.y), node_size, NODE_BORDER_SIZE)
+
+        if self.viewport.zoom < DETAIL_ZOOM:
+            return
 
-        text = self.font.render(str(node.id), False, NODE_TEXT_COLOR)
+        text = self.get_label(node.id)
         text_x = center.x - (text.get_rect().width / 2)
         text_y = center.y - (text.get_rect().height / 2)
-        self.screen.blit(text, (text_x, text_y))
+        surface.blit(text, (text_x, text_y))
 
 
-    def draw_messages(self, node: Node) -> None:
-        center = node_to_screen_pos(node)
+    def draw_messages(self, node: Node) -> List[pygame.Rect]:
+        node_size = self.viewport.node_size
+        center = self.viewport.world_to_screen(node.pos)
+        rects = []
 
         for i, message in enumerate(node.input_queue):
-            x = center.x + NODE_SIZE + 4
-            y = center.y - NODE_SIZE + ((MESSAGE_SIZE + 1) * 2 * i)
+            x = center.x + node_size + 4
+            y = center.y - node_size + ((MESSAGE_SIZE + 1) * 2 * i)
             color = MESSAGE_COLORS[message.id % len(MESSAGE_COLORS)]
-            pygame.draw.circle(self.screen, color, (x, y), MESSAGE_SIZE)
+            rects.append(pygame.draw.circle(self.screen, color, (x, y), MESSAGE_SIZE))
+
+        return rects
 
 
-    def draw_node_range(self, node: Node) -> None:
-        center = node_to_screen_pos(node)
-        pygame.draw.circle(self.screen, NODE_POWER_COLOR, (center.x, center.y), node.power * GRID_SIZE, NODE_POWER_BORDER_SIZE)
+    def draw_connectivity(self) -> List[pygame.Rect]:
+        connectivity = self.get_connectivity()
 
+        if self.path_key != (connectivity, connectivity.version):
+            self.path_nodes = set(connectivity.get_shortest_path())
+            self.path_key = (connectivity, connectivity.version)
 
-    def highlight_node(self, node: Node) -> None:
-        center = node_to_screen_pos(node)
-        pygame.draw.circle(self.screen, NODE_POWER_COLOR, (center.x, center.y), NODE_SIZE * 1.5, NODE_POWER_BORDER_SIZE)
+        rects = []
+
+        for node in self.visible_nodes:
+            if node in connectivity.articulation_points:
+                color = CONNECTIVITY_CUT_COLOR
+            elif node in self.path_nodes:
+                color = CONNECTIVITY_PATH_COLOR
+            elif node.online and node not in connectivity.hops:
+                color = CONNECTIVITY_UNREACHED_COLOR
+            else:
+                continue
 
+            center = self.viewport.world_to_screen(node.pos)
+            rects.append(pygame.draw.circle(self.screen, color, (center.x, center.y), self.viewport.node_size * 1.5, NODE_POWER_BORDER_SIZE + 1))
 
-    def draw_link(self, from_node: Node, to_node: Node) -> None:
-        from_pos = (Point(from_node.pos.x, -from_node.pos.y) * GRID_SIZE) + (Point(SCREEN_WIDTH, SCREEN_HEIGHT) / 2)
-        to_pos = (Point(to_node.pos.x, -to_node.pos.y) * GRID_SIZE) + (Point(SCREEN_WIDTH, SCREEN_HEIGHT) / 2)
+        return rects
 
-        from_pos, to_pos = shrink_line(from_pos, to_pos, NODE_SIZE + NODE_BORDER_SIZE * 2)
 
-        pygame.draw.line(self.screen, LINK_COLOR, (from_pos.x, from_pos.y), (to_pos.x, to_pos.y), LINK_LINE_WIDTH)
+    def draw_node_range(self, node: Node) -> pygame.Rect:
+        center = self.viewport.world_to_screen(node.pos)
+        return pygame.draw.circle(self.screen, NODE_POWER_COLOR, (center.x, center.y), node.power * self.viewport.zoom, NODE_POWER_BORDER_SIZE)
+
+
+    def highlight_node(self, node: Node) -> pygame.Rect:
+        center = self.viewport.world_to_screen(node.pos)
+        return pygame.draw.circle(self.screen, NODE_POWER_COLOR, (center.x, center.y), self.viewport.node_size * 1.5, NODE_POWER_BORDER_SIZE)
+
+
+    def draw_link(self, surface: pygame.Surface, from_node: Node, to_node: Node) -> None:
+        from_pos = self.viewport.world_to_screen(from_node.pos)
+        to_pos = self.viewport.world_to_screen(to_node.pos)
+
+        from_pos, to_pos = shrink_line(from_pos, to_pos, self.viewport.node_size + NODE_BORDER_SIZE * 2)
+
+        pygame.draw.line(surface, LINK_COLOR, (from_pos.x, from_pos.y), (to_pos.x, to_pos.y), LINK_LINE_WIDTH)
+
+        if self.viewport.zoom < DETAIL_ZOOM:
+            return
 
         rotation = math.degrees(math.atan2(from_pos.y - to_pos.y, to_pos.x - from_pos.x)) + 90
 
@@ -258,7 +647,122 @@ class Engine:
             to_pos.x + LINK_ARROW_HEAD_SIZE * math.sin(math.radians(rotation + 120)),
             to_pos.y + LINK_ARROW_HEAD_SIZE * math.cos(math.radians(rotation + 120)))
 
-        pygame.draw.polygon(self.screen, LINK_COLOR, (triangle_vertice_0, triangle_vertice_1, triangle_vertice_2))
+        pygame.draw.polygon(surface, LINK_COLOR, (triangle_vertice_0, triangle_vertice_1, triangle_vertice_2))
+
+
+# Maps world positions to the screen: `center` is the world position shown at the middle of the screen
+class Viewport:
+
+    def __init__(self) -> None:
+        self.center = Point(0, 0)
+        self.zoom = GRID_SIZE
+
+
+    @property
+    def state(self) -> Tuple[float, float, float]:
+        return (self.center.x, self.center.y, self.zoom)
+
+
+    @property
+    def node_size(self) -> float:
+        return max(NODE_MIN_SIZE, NODE_SIZE * self.zoom / GRID_SIZE)
+
+
+    def world_to_screen(self, pos: Point) -> Point:
+        return Point((pos.x - self.center.x) * self.zoom + SCREEN_WIDTH / 2, (self.center.y - pos.y) * self.zoom + SCREEN_HEIGHT / 2)
+
+
+    def screen_to_world(self, screen_pos: Point) -> Point:
+        return Point(self.center.x + (screen_pos.x - SCREEN_WIDTH / 2) / self.zoom, self.center.y + (SCREEN_HEIGHT / 2 - screen_pos.y) / self.zoom)
+
+
+    # Nodes are created on whole world coordinates
+    def screen_to_grid_point(self, screen_pos: Point) -> Point:
+        world_pos = self.screen_to_world(screen_pos)
+        return Point(math.floor(world_pos.x + 0.5), math.floor(world_pos.y + 0.5))
+
+
+    def world_bounds(self, margin: float) -> Tuple[Point, Point]:
+        min_pos = self.screen_to_world(Point(0, SCREEN_HEIGHT))
+        max_pos = self.screen_to_world(Point(SCREEN_WIDTH, 0))
+        return (Point(min_pos.x - margin, min_pos.y - margin), Point(max_pos.x + margin, max_pos.y + margin))
+
+
+    def pan(self, screen_dx: int, screen_dy: int) -> None:
+        self.center = Point(self.center.x - screen_dx / self.zoom, self.center.y + screen_dy / self.zoom)
+
+
+    # The world position under `screen_pos` stays in place
+    def zoom_at(self, screen_pos: Point, factor: float) -> None:
+        anchor = self.screen_to_world(screen_pos)
+        self.zoom = max(MIN_ZOOM, min(MAX_ZOOM, self.zoom * factor))
+        new_anchor = self.screen_to_world(screen_pos)
+        self.center = Point(self.center.x + anchor.x - new_anchor.x, self.center.y + anchor.y - new_anchor.y)
+
+
+class ReplayEngine(Engine):
+
+    def __init__(self, timeline: Timeline) -> None:
+        super().__init__()
+        self.timeline = timeline
+        self.playing = False
+
+
+    def init(self) -> None:
+        print('''
+        Replay controls:
+          - SPACE / RIGHT: Next step
+          - LEFT:          Previous step
+          - HOME / END:    First / last step
+          - P:             Play/pause
+          - Mouse-wheel, +/-:   Zoom in/out
+          - Middle-button drag: Pan
+          - 0:                  Reset view
+
+        Common controls:
+          - ESC: Exit
+        ''')
+        self.show_frame(0)
+
+
+    def update(self, frame: int) -> None:
+        if self.playing and frame % 10 == 0:
+            self.show_frame(self.timeline.frame + 1)
+
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                self.running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_SPACE or event.key == pygame.K_RIGHT:
+                    self.show_frame(self.timeline.frame + 1)
+                elif event.key == pygame.K_LEFT:
+                    self.show_frame(self.timeline.frame - 1)
+                elif event.key == pygame.K_HOME:
+                    self.show_frame(0)
+                elif event.key == pygame.K_END:
+                    self.show_frame(self.timeline.frame_count - 1)
+                elif event.key == pygame.K_p:
+                    self.playing = not self.playing
+                elif event.key == pygame.K_ESCAPE:
+                    self.running = False
+                else:
+                    self.update_viewport(event)
+            else:
+                self.update_viewport(event)
+
+
+    def show_frame(self, frame: int) -> None:
+        self.timeline.seek(frame)
+        pygame.display.set_caption(
+            f'Mesh Replay - step {self.timeline.step} '
+            f'({self.timeline.frame + 1}/{self.timeline.frame_count}), '
+            f'{self.timeline.count(EMITTED)} transmissions, '
+            f'{self.timeline.count(DELIVERED)} deliveries')
+
+
+    @property
+    def medium(self) -> Medium:
+        return self.timeline.medium
 
 
 def shrink_line(from_pos: Point, to_pos: Point, reduction: int) -> Tuple[Point, Point]:
@@ -269,18 +773,9 @@ def shrink_line(from_pos: Point, to_pos: Point, reduction: int) -> Tuple[Point,
     return (from_pos, to_pos)
 
 
-def node_to_screen_pos(node: Node) -> Point:
-    return (Point(node.pos.x, -node.pos.y) * GRID_SIZE) + (Point(SCREEN_WIDTH, SCREEN_HEIGHT) / 2)
-
-
-def screen_pos_to_point(screen_pos: Point) -> Point:
-    screen_pos.x += GRID_SIZE // 2
-    screen_pos.y += GRID_SIZE // 2
-
-    offset = Point(GRID_GEOMETRY[0] // 2, GRID_GEOMETRY[1] // 2)
-
-    point_y_inverted = (screen_pos // GRID_SIZE) - offset
-    return Point(point_y_inverted.x, -point_y_inverted.y)
+# Everything the static layer draws for a node
+def node_state(node: Node) -> Tuple:
+    return (node.pos.x, node.pos.y, node.power, node.online, node.id)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,306 @@
+from __future__ import annotations
+from collections import OrderedDict
+from functools import partial
+import math
+from typing import Callable, Hashable, Iterable, Iterator, Set, Tuple
+import zlib
+
+
+MASK_64 = (1 << 64) - 1
+
+# Shared by empty exact filters until their first id, as most nodes of a large network never see one
+NO_MESSAGE_IDS = frozenset()
+
+DUPLICATE_FILTERS = ('exact', 'lru', 'bloom')
+FILTER_CAPACITY = 1024
+FALSE_POSITIVE_RATE = 0.001
+
+
+class DuplicateFilter:
+
+    __slots__ = ()
+
+    kind: str = None
+    exact = True
+    false_positives = 0
+    # Whether the last lookup that found an id got it wrong, only known to audited filters
+    last_lookup_false = False
+
+
+    # States are plain tuples starting with the filter kind, so snapshots can share or save them
+    @classmethod
+    def from_state(cls, state: Tuple) -> DuplicateFilter:
+        raise NotImplementedError()
+
+
+    def get_state(self) -> Tuple:
+        raise NotImplementedError()
+
+
+    def add(self, message_id: Hashable) -> None:
+        raise NotImplementedError()
+
+
+    def __contains__(self, message_id: Hashable) -> bool:
+        raise NotImplementedError()
+
+
+    # Lookups from outside the node, such as delivery checks, which must not change or count as one of its own
+    def peek(self, message_id: Hashable) -> bool:
+        return message_id in self
+
+
+# Every node holds at least two, so the default filter carries no instance dict
+class ExactFilter(DuplicateFilter):
+
+    __slots__ = ('message_ids',)
+
+    kind = 'exact'
+
+
+    def __init__(self, message_ids: Iterable[Hashable] = ()) -> None:
+        self.message_ids: Set[Hashable] = set(message_ids) if message_ids != () else NO_MESSAGE_IDS
+
+
+    @classmethod
+    def from_state(cls, state: Tuple) -> ExactFilter:
+        return cls(state[1])
+
+
+    def get_state(self) -> Tuple:
+        return (self.kind, tuple(self.message_ids))
+
+
+    def add(self, message_id: Hashable) -> None:
+        if self.message_ids is NO_MESSAGE_IDS:
+            self.message_ids = set()
+
+        self.message_ids.add(message_id)
+
+
+    def __contains__(self, message_id: Hashable) -> bool:
+        return message_id in self.message_ids
+
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(self.message_ids)
+
+
+    def __len__(self) -> int:
+        return len(self.message_ids)
+
+
+class LRUFilter(DuplicateFilter):
+
+    kind = 'lru'
+    exact = False
+
+
+    def __init__(self, capacity: int = FILTER_CAPACITY) -> None:
+        self.capacity = capacity
+        self.message_ids: OrderedDict[Hashable, None] = OrderedDict()
+
+
+    @classmethod
+    def from_state(cls, state: Tuple) -> LRUFilter:
+        _, capacity, message_ids = state
+        duplicate_filter = cls(capacity)
+        duplicate_filter.message_ids = OrderedDict.fromkeys(message_ids)
+        return duplicate_filter
+
+
+    def get_state(self) -> Tuple:
+        return (self.kind, self.capacity, tuple(self.message_ids))
+
+
+    def add(self, message_id: Hashable) -> None:
+        self.message_ids[message_id] = None
+        self.message_ids.move_to_end(message_id)
+
+        if len(self.message_ids) > self.capacity:
+            self.message_ids.popitem(last=False)
+
+
+    def __contains__(self, message_id: Hashable) -> bool:
+        if message_id not in self.message_ids:
+            return False
+
+        self.message_ids.move_to_end(message_id)
+        return True
+
+
+    def peek(self, message_id: Hashable) -> bool:
+        return message_id in self.message_ids
+
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(self.message_ids)
+
+
+    def __len__(self) -> int:
+        return len(self.message_ids)
+
+
+# Two generations of `capacity` ids each: once the current one is full it replaces the old one,
+# so memory stays flat and the false positive rate stays bounded on endless runs. A lookup is wrong
+# when either generation is, so each one gets half of the false positive rate.
+class BloomFilter(DuplicateFilter):
+
+    kind = 'bloom'
+    exact = False
+
+
+    def __init__(self, capacity: int = FILTER_CAPACITY, false_positive_rate: float = FALSE_POSITIVE_RATE) -> None:
+        self.capacity = capacity
+        self.false_positive_rate = false_positive_rate
+
+        generation_rate = false_positive_rate / 2
+        self.bit_count = max(8, math.ceil(-capacity * math.log(generation_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.bit_count / capacity * math.log(2)))
+
+        self.current_bits = bytearray((self.bit_count + 7) // 8)
+        self.previous_bits = bytearray(len(self.current_bits))
+        self.current_count = 0
+
+
+    @classmethod
+    def from_state(cls, state: Tuple) -> BloomFilter:
+        _, capacity, false_positive_rate, current_bits, previous_bits, current_count = state
+        duplicate_filter = cls(capacity, false_positive_rate)
+        duplicate_filter.current_bits = bytearray(current_bits)
+        duplicate_filter.previous_bits = bytearray(previous_bits)
+        duplicate_filter.current_count = current_count
+        return duplicate_filter
+
+
+    def get_state(self) -> Tuple:
+        return (
+            self.kind,
+            self.capacity,
+            self.false_positive_rate,
+            bytes(self.current_bits),
+            bytes(self.previous_bits),
+            self.current_count)
+
+
+    def add(self, message_id: Hashable) -> None:
+        if self.current_count >= self.capacity:
+            self.previous_bits = self.current_bits
+            self.current_bits = bytearray(len(self.previous_bits))
+            self.current_count = 0
+
+        for bit in self.bits_of(message_id):
+            self.current_bits[bit >> 3] |= 1 << (bit & 7)
+
+        self.current_count += 1
+
+
+    def __contains__(self, message_id: Hashable) -> bool:
+        bits = list(self.bits_of(message_id))
+        return self.has_bits(self.current_bits, bits) or self.has_bits(self.previous_bits, bits)
+
+
+    def has_bits(self, bitmap: bytearray, bits: Iterable[int]) -> bool:
+        return all(bitmap[bit >> 3] & (1 << (bit & 7)) for bit in bits)
+
+
+    def bits_of(self, message_id: Hashable) -> Iterator[int]:
+        if isinstance(message_id, int):
+            key = message_id & MASK_64
+        else:
+            key = zlib.crc32(str(message_id).encode())
+
+        first_hash = mix_64(key)
+        second_hash = mix_64(first_hash) | 1
+
+        for i in range(self.hash_count):
+            yield ((first_hash + i * second_hash) & MASK_64) % self.bit_count
+
+
+# Keeps an exact shadow of the ids to count how many lookups an approximate filter got wrong
+class AuditedFilter(DuplicateFilter):
+
+    kind = 'audited'
+
+
+    def __init__(self, inner_filter: DuplicateFilter) -> None:
+        self.inner_filter = inner_filter
+        self.exact = inner_filter.exact
+        self.message_ids: Set[Hashable] = set()
+        self.false_positives = 0
+
+
+    @classmethod
+    def from_state(cls, state: Tuple) -> AuditedFilter:
+        _, inner_state, message_ids, false_positives = state
+        duplicate_filter = cls(filter_from_state(inner_state))
+        duplicate_filter.message_ids = set(message_ids)
+        duplicate_filter.false_positives = false_positives
+        return duplicate_filter
+
+
+    def get_state(self) -> Tuple:
+        return (self.kind, self.inner_filter.get_state(), tuple(self.message_ids), self.false_positives)
+
+
+    def add(self, message_id: Hashable) -> None:
+        self.inner_filter.add(message_id)
+        self.message_ids.add(message_id)
+
+
+    def __contains__(self, message_id: Hashable) -> bool:
+        found = message_id in self.inner_filter
+        self.last_lookup_false = found and message_id not in self.message_ids
+
+        if self.last_lookup_false:
+            self.false_positives += 1
+
+        return found
+
+
+    def peek(self, message_id: Hashable) -> bool:
+        return message_id in self.message_ids
+
+
+FILTER_KINDS = {
+    duplicate_filter.kind: duplicate_filter
+    for duplicate_filter in (ExactFilter, LRUFilter, BloomFilter, AuditedFilter)
+}
+
+
+def filter_from_state(state: Tuple) -> DuplicateFilter:
+    if state[0] not in FILTER_KINDS:
+        raise ValueError(f'Unknown duplicate filter kind "{state[0]}"')
+
+    return FILTER_KINDS[state[0]].from_state(state)
+
+
+# Partials rather than lambdas, so the sharded engine can send the factory to its workers
+def filter_factory(
+        kind: str,
+        capacity: int = FILTER_CAPACITY,
+        false_positive_rate: float = FALSE_POSITIVE_RATE) -> Callable[[], DuplicateFilter]:
+
+    if kind == 'exact':
+        return ExactFilter
+    elif kind == 'lru':
+        return partial(LRUFilter, capacity)
+    elif kind == 'bloom':
+        return partial(BloomFilter, capacity, false_positive_rate)
+
+    raise ValueError(f'Unknown duplicate filter "{kind}"')
+
+
+def audited(duplicate_filter: Callable[[], DuplicateFilter]) -> Callable[[], DuplicateFilter]:
+    return partial(build_audited_filter, duplicate_filter)
+
+
+def build_audited_filter(duplicate_filter: Callable[[], DuplicateFilter]) -> DuplicateFilter:
+    return AuditedFilter(duplicate_filter())
+
+
+def mix_64(value: int) -> int:
+    value = (value + 0x9E3779B97F4A7C15) & MASK_64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & MASK_64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & MASK_64
+    return value ^ (value >> 31)
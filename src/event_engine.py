@@ -0,0 +1,206 @@
+from __future__ import annotations
+import heapq
+import math
+from typing import Dict, List, Tuple
+
+
+# Time units, one unit being one step of the step engines
+AIRTIME = 1.0
+PROCESSING_TIME = 1.0
+
+# Extra delay of a link at the very edge of the emitter's range, shorter links take proportionally less
+PROPAGATION_DELAY = 0.5
+
+RECEIVE = 0
+PROCESS = 1
+EMIT = 2
+TIMER = 3
+
+
+# Nodes keep their own queues and logic: the engine only decides when their hooks run. A node
+# processes one message at a time and holds its radio for the airtime of each emission, and every
+# receiver gets the message once it has been fully sent and has travelled the link. Time jumps from
+# one event to the next, so idle nodes and quiet periods cost nothing.
+# Messages still travelling are not part of the node states, so snapshots capture the engine state too.
+class EventEngine:
+
+    def __init__(
+            self,
+            medium: Medium,
+            airtime: float = AIRTIME,
+            processing_time: float = PROCESSING_TIME,
+            propagation_delay: float = PROPAGATION_DELAY) -> None:
+
+        if airtime < 0 or processing_time <= 0 or propagation_delay < 0:
+            raise ValueError('Airtime and propagation delay must not be negative and processing time must be positive')
+
+        self.medium = medium
+        self.airtime = airtime
+        self.processing_time = processing_time
+        self.propagation_delay = propagation_delay
+
+        self.time = 0.0
+        self.events: List[Tuple[float, int, int, Node, Message]] = []
+        self.next_sequence = 0
+
+        # Nodes with a pending event of each kind, and when their processor and radio are free again
+        self.processing: Dict[Node, None] = {}
+        self.emitting: Dict[Node, None] = {}
+        self.waiting: Dict[Node, float] = {}
+        self.processor_free_at: Dict[Node, float] = {}
+        self.radio_free_at: Dict[Node, float] = {}
+
+        # Emitter -> (the receivers the delays were computed for, delay of each link)
+        self.link_delays: Dict[Node, Tuple[List[Node], List[float]]] = {}
+
+        self.medium.event_engine = self
+
+        for node in self.medium.busy_nodes:
+            self.wake(node)
+
+
+    def schedule(self, time: float, kind: int, node: Node, message: Message = None) -> None:
+        # The sequence number keeps events at the same time in the order they were scheduled
+        heapq.heappush(self.events, (time, self.next_sequence, kind, node, message))
+        self.next_sequence += 1
+
+
+    # Called by the medium whenever a node may have work to do
+    def wake(self, node: Node) -> None:
+        if not node.online:
+            return
+
+        # A full output queue holds messages back in the input queue until an emission makes room
+        if node not in self.processing and len(node.input_queue) > 0 and not node.output_queue.is_full:
+            self.processing[node] = None
+            self.schedule(max(self.time, self.processor_free_at.get(node, self.time)), PROCESS, node)
+
+        if node not in self.emitting and len(node.output_queue) > 0:
+            self.emitting[node] = None
+            self.schedule(max(self.time, self.radio_free_at.get(node, self.time)), EMIT, node)
+
+        # Timers that fire with nothing left to do are harmless, so they are never cancelled, only
+        # followed by an earlier one when a node has to wake up sooner
+        wakeup_step = node.get_wakeup_step()
+
+        if wakeup_step is not None and max(self.time, wakeup_step) < self.waiting.get(node, math.inf):
+            self.waiting[node] = max(self.time, wakeup_step)
+            self.schedule(self.waiting[node], TIMER, node)
+
+
+    def schedule_receptions(self, message: Message, emitter: Node, receivers: List[Node]) -> None:
+        cached_receivers, delays = self.link_delays.get(emitter, (None, None))
+
+        # The medium replaces the list of receivers whenever the links of the emitter change
+        if cached_receivers is not receivers:
+            delays = [self.get_link_delay(emitter, receiver) for receiver in receivers]
+            self.link_delays[emitter] = (receivers, delays)
+
+        for receiver, delay in zip(receivers, delays):
+            heapq.heappush(self.events, (self.time + delay, self.next_sequence, RECEIVE, receiver, message))
+            self.next_sequence += 1
+
+
+    def get_link_delay(self, emitter: Node, receiver: Node) -> float:
+        if emitter.power <= 0:
+            return self.airtime
+
+        return self.airtime + self.propagation_delay * emitter.pos.distance_to(receiver.pos) / emitter.power
+
+
+    def run_until(self, end_time: float) -> int:
+        events_run = 0
+
+        while len(self.events) > 0 and self.events[0][0] < end_time:
+            self.run_next_event()
+            events_run += 1
+
+        self.time = max(self.time, end_time)
+        return events_run
+
+
+    def run_next_event(self) -> None:
+        self.time, _, kind, node, message = heapq.heappop(self.events)
+        self.medium.step = int(self.time)
+
+        if kind == PROCESS:
+            del self.processing[node]
+        elif kind == EMIT:
+            del self.emitting[node]
+        elif kind == TIMER and self.waiting.get(node) == self.time:
+            del self.waiting[node]
+
+        # Events left behind by removed nodes
+        if node not in self.medium.node_orders:
+            self.processor_free_at.pop(node, None)
+            self.radio_free_at.pop(node, None)
+            self.link_delays.pop(node, None)
+            return
+
+        # A received message reaches `wake` through the medium and cannot leave the node idle
+        if kind == RECEIVE:
+            node.receive_message(message)
+            return
+
+        if kind == TIMER:
+            node.wake_up()
+        elif kind == PROCESS:
+            self.processor_free_at[node] = self.time + self.processing_time
+            node.process_next_message()
+        else:
+            self.radio_free_at[node] = self.time + self.airtime
+            node.emit_next_message()
+
+        self.wake(node)
+        self.medium.release_idle_nodes((node,))
+
+
+    # Nodes are referenced by their index in the medium, like the node states of snapshots
+    def get_state(self) -> Dict:
+        indices = {node: i for i, node in enumerate(self.medium.nodes)}
+
+        return {
+            'time': self.time,
+            'events': [(time, kind, indices[node], message) for time, _, kind, node, message in sorted(self.events) if node in indices],
+            'processor_free_at': {indices[node]: time for node, time in self.processor_free_at.items() if node in indices},
+            'radio_free_at': {indices[node]: time for node, time in self.radio_free_at.items() if node in indices},
+        }
+
+
+    def set_state(self, state: Dict) -> None:
+        nodes = list(self.medium.nodes)
+
+        self.time = state['time']
+        self.events = []
+        self.processing = {}
+        self.emitting = {}
+        self.waiting = {}
+        self.processor_free_at = {nodes[index]: time for index, time in state['processor_free_at'].items()}
+        self.radio_free_at = {nodes[index]: time for index, time in state['radio_free_at'].items()}
+        self.link_delays = {}
+
+        # Events come sorted, so the new sequence numbers keep their order
+        for time, kind, index, message in state['events']:
+            node = nodes[index]
+
+            if kind == PROCESS:
+                self.processing[node] = None
+            elif kind == EMIT:
+                self.emitting[node] = None
+            elif kind == TIMER:
+                self.waiting[node] = min(time, self.waiting.get(node, math.inf))
+
+            self.schedule(time, kind, node, message)
+
+        # Only does something for states of other engines, which have no events
+        for node in self.medium.busy_nodes:
+            self.wake(node)
+
+
+    def is_quiescent(self) -> bool:
+        return len(self.events) <= 0
+
+
+from medium import Medium
+from message import Message
+from node import Node
@@ -0,0 +1,110 @@
+from __future__ import annotations
+from typing import Dict, Iterator, Tuple
+
+
+Cell = Tuple[int, int]
+
+
+class Grid:
+
+    def __init__(self, cell_size: int) -> None:
+        self.cell_size = cell_size
+        self.cells: Dict[Cell, Dict[Node, None]] = {}
+        self.node_cells: Dict[Node, Cell] = {}
+
+
+    def __contains__(self, node: Node) -> bool:
+        return node in self.node_cells
+
+
+    def __len__(self) -> int:
+        return len(self.node_cells)
+
+
+    def insert(self, node: Node) -> None:
+        cell = self.cell_of(node.pos)
+        self.cells.setdefault(cell, {})[node] = None
+        self.node_cells[node] = cell
+
+
+    def remove(self, node: Node) -> None:
+        cell = self.node_cells.pop(node)
+        cell_nodes = self.cells[cell]
+        del cell_nodes[node]
+
+        if len(cell_nodes) <= 0:
+            del self.cells[cell]
+
+
+    def move(self, node: Node) -> None:
+        if self.node_cells[node] != self.cell_of(node.pos):
+            self.remove(node)
+            self.insert(node)
+
+
+    def clear(self) -> None:
+        self.cells = {}
+        self.node_cells = {}
+
+
+    def cell_of(self, pos: Point) -> Cell:
+        return self.cell_at(pos.x, pos.y)
+
+
+    def cell_at(self, x: float, y: float) -> Cell:
+        return (int(x // self.cell_size), int(y // self.cell_size))
+
+
+    def query(self, center: Point, radius: float) -> Iterator[Node]:
+        if radius < 0:
+            return
+
+        min_cell_x, min_cell_y = self.cell_at(center.x - radius, center.y - radius)
+        max_cell_x, max_cell_y = self.cell_at(center.x + radius, center.y + radius)
+
+        squared_radius = radius * radius
+
+        for _, cell_nodes in self.cells_between(min_cell_x, min_cell_y, max_cell_x, max_cell_y):
+            for node in cell_nodes:
+                dx = node.pos.x - center.x
+                dy = node.pos.y - center.y
+
+                if dx * dx + dy * dy <= squared_radius:
+                    yield node
+
+
+    def query_rect(self, min_pos: Point, max_pos: Point) -> Iterator[Node]:
+        min_cell_x, min_cell_y = self.cell_of(min_pos)
+        max_cell_x, max_cell_y = self.cell_of(max_pos)
+
+        for _, cell_nodes in self.cells_between(min_cell_x, min_cell_y, max_cell_x, max_cell_y):
+            for node in cell_nodes:
+                if min_pos.x <= node.pos.x <= max_pos.x and min_pos.y <= node.pos.y <= max_pos.y:
+                    yield node
+
+
+    def cell_counts(self) -> Iterator[Tuple[Cell, int]]:
+        for cell, cell_nodes in self.cells.items():
+            yield (cell, len(cell_nodes))
+
+
+    def cells_between(self, min_cell_x: int, min_cell_y: int, max_cell_x: int, max_cell_y: int) -> Iterator[Tuple[Cell, Dict[Node, None]]]:
+        cell_count = (max_cell_x - min_cell_x + 1) * (max_cell_y - min_cell_y + 1)
+
+        # Huge ranges over a sparse grid are cheaper to scan through the occupied cells
+        if cell_count > len(self.cells):
+            for cell, cell_nodes in self.cells.items():
+                if min_cell_x <= cell[0] <= max_cell_x and min_cell_y <= cell[1] <= max_cell_y:
+                    yield (cell, cell_nodes)
+            return
+
+        for cell_x in range(min_cell_x, max_cell_x + 1):
+            for cell_y in range(min_cell_y, max_cell_y + 1):
+                cell_nodes = self.cells.get((cell_x, cell_y))
+
+                if cell_nodes is not None:
+                    yield ((cell_x, cell_y), cell_nodes)
+
+
+from node import Node
+from point import Point
@@ -0,0 +1,272 @@
+import time
+
+STARTED_AT = time.perf_counter()
+
+import argparse
+import logging
+from typing import Dict, List
+
+from nodes_file import read_nodes_definition
+from simulation import Simulation, NODES_FILE, ENGINES, RADIO_MODELS
+from duplicate_filter import DUPLICATE_FILTERS, FILTER_CAPACITY, FALSE_POSITIVE_RATE, filter_factory
+from message import FloodingMessage
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Run a mesh simulation without the viewer')
+    parser.add_argument('nodes_file', nargs='?', default=NODES_FILE, help=f'nodes file to load (default: {NODES_FILE})')
+    parser.add_argument('--engine', choices=ENGINES, default='objects', help='simulation engine (default: objects)')
+    parser.add_argument('--airtime', type=float, default=None, help='events engine: time a node holds its radio per emission (default: AIRTIME in event_engine.py)')
+    parser.add_argument('--processing-time', type=float, default=None, help='events engine: time a node takes to process a message (default: PROCESSING_TIME in event_engine.py)')
+    parser.add_argument('--propagation-delay', type=float, default=None, help='events engine: extra delay of a link at the edge of the range (default: PROPAGATION_DELAY in event_engine.py)')
+    parser.add_argument('--shards', type=int, default=None, help='sharded engine: worker processes, one per strip of the plane (default: one per core)')
+    parser.add_argument('--radio', choices=RADIO_MODELS, default='ideal', help='objects engine: drop receptions that collide with other emissions of the step (default: ideal)')
+    parser.add_argument('--sinr-threshold', type=float, default=None, help='sinr radio: ratio over noise and interference a reception needs (default: SINR_THRESHOLD in radio.py)')
+    parser.add_argument('--path-loss-exponent', type=float, default=None, help='sinr radio: exponent of the signal loss with distance (default: PATH_LOSS_EXPONENT in radio.py)')
+    parser.add_argument('--duplicate-filter', choices=DUPLICATE_FILTERS, default='exact', help='how nodes remember the messages they have seen, lru and bloom ones are audited to count false drops (default: exact)')
+    parser.add_argument('--filter-capacity', type=int, default=FILTER_CAPACITY, help=f'lru and bloom filters: message ids remembered per filter (default: {FILTER_CAPACITY})')
+    parser.add_argument('--false-positive-rate', type=float, default=FALSE_POSITIVE_RATE, help=f'bloom filter: share of new messages taken for duplicates (default: {FALSE_POSITIVE_RATE})')
+    parser.add_argument('--mobile-fraction', type=float, default=0, help='share of the nodes moving by random waypoint (default: 0)')
+    parser.add_argument('--speed', type=float, nargs=2, default=[0.5, 1.0], metavar=('MIN', 'MAX'), help='random waypoint: speed range in units per step (default: 0.5 1.0)')
+    parser.add_argument('--pause', type=int, default=0, help='random waypoint: steps waited at each waypoint (default: 0)')
+    parser.add_argument('--mobility-seed', type=int, default=0, help='random waypoint: seed for the mobile nodes and their waypoints (default: 0)')
+    parser.add_argument('--mobility-trace', default=None, help='move nodes along the positions of this CSV file (step,id,x,y)')
+    parser.add_argument('--connectivity', action='store_true', help='print whether node 0 reaches the highest id, in how many hops, and the weak points of the network before simulating')
+    parser.add_argument('--steps', type=int, default=None, help='steps to run (default: until quiescent)')
+    parser.add_argument('--max-steps', type=int, default=100000, help='step limit when running until quiescent (default: 100000)')
+    parser.add_argument('--messages', type=int, default=1, help='messages to inject from node 0 (default: 1)')
+    parser.add_argument('--interval', type=int, default=1, help='steps between injected messages (default: 1)')
+    parser.add_argument('--metrics', default=None, help='save per-step metrics to this .csv or .json file')
+    parser.add_argument('--trace', default=None, help='record a binary trace of every message event to this file')
+    parser.add_argument('--from-snapshot', default=None, help='start from this snapshot instead of from step 0')
+    parser.add_argument('--save-snapshot', default=None, help='save a snapshot of the final state to this file')
+    parser.add_argument('--compare', action='store_true', help='run the nodes file as both a flooding and a routing network and compare them')
+    parser.add_argument('--verbose', action='store_true', help='log every step and delivery')
+    return parser.parse_args()
+
+
+class Runner:
+
+    def __init__(self, simulation: Simulation, messages: int, interval: int) -> None:
+        self.simulation = simulation
+        self.messages_to_inject = messages
+        self.interval = max(1, interval)
+
+        self.injected: List[FloodingMessage] = []
+        self.injected_at: Dict[int, int] = {}
+        self.delivered_at: Dict[int, int] = {}
+        self.pending: List[FloodingMessage] = []
+
+
+    @property
+    def injecting(self) -> bool:
+        return len(self.injected) < self.messages_to_inject
+
+
+    def run_step(self) -> None:
+        step = self.simulation.step
+
+        if self.injecting and step % self.interval == 0:
+            message = self.simulation.inject_new_message()
+            self.injected.append(message)
+            self.injected_at[message.id] = step
+            self.pending.append(message)
+
+        self.simulation.run_step()
+
+        still_pending = []
+
+        for message in self.pending:
+            if self.simulation.is_delivered(message):
+                self.delivered_at[message.id] = self.simulation.step
+            else:
+                still_pending.append(message)
+
+        self.pending = still_pending
+
+
+    def run(self, steps: int, max_steps: int) -> None:
+        if steps is not None:
+            for _ in range(steps):
+                self.run_step()
+        else:
+            while self.simulation.step < max_steps and (self.injecting or not self.simulation.is_quiescent()):
+                self.run_step()
+
+
+    def stats(self) -> Dict:
+        latencies = [self.delivered_at[message_id] - self.injected_at[message_id] for message_id in self.delivered_at]
+        injected_count = len(self.injected)
+        delivered_count = len(self.delivered_at)
+
+        return {
+            'steps': self.simulation.step,
+            'injected': injected_count,
+            'delivered': delivered_count,
+            'delivery_ratio': delivered_count / injected_count if injected_count > 0 else 0,
+            'min_latency': min(latencies) if len(latencies) > 0 else None,
+            'mean_latency': sum(latencies) / len(latencies) if len(latencies) > 0 else None,
+            'max_latency': max(latencies) if len(latencies) > 0 else None,
+            'false_drops': self.simulation.false_drops,
+            'quiescent': self.simulation.is_quiescent(),
+        }
+
+
+    def print_stats(self, startup_time: float, run_time: float) -> None:
+        stats = self.stats()
+        steps = stats['steps']
+
+        print(f'Startup:          {startup_time * 1000:.1f} ms')
+        print(f'Steps:            {steps}')
+        print(f'Run time:         {run_time:.3f} s ({steps / run_time if run_time > 0 else 0:.1f} steps/s)')
+        print(f'Injected:         {stats["injected"]}')
+        print(f'Delivered:        {stats["delivered"]}')
+        print(f'Delivery ratio:   {stats["delivery_ratio"]:.3f}')
+
+        if stats['mean_latency'] is not None:
+            print(f'Latency (steps):  min={stats["min_latency"]} avg={stats["mean_latency"]:.2f} max={stats["max_latency"]}')
+
+        radio = self.simulation.radio
+
+        if radio is not None:
+            print(f'Collisions:       {radio.collisions} of {radio.receptions + radio.collisions} receptions')
+
+        if self.simulation.audit_duplicate_filters:
+            print(f'False drops:      {stats["false_drops"]}')
+
+        print(f'Quiescent:        {stats["quiescent"]}')
+
+
+def compare_network_types(args: argparse.Namespace) -> None:
+    nodes_definition = read_nodes_definition(args.nodes_file)
+
+    print(f'{"Type":<10}{"Delivered":>11}{"Transmissions":>15}{"Per delivery":>14}{"Latency":>9}{"Steps":>8}')
+
+    for network_type in ('flooding', 'routing'):
+        same_topology = [dict(node, type=network_type) for node in nodes_definition]
+        simulation = Simulation(args.nodes_file, nodes_definition=same_topology, collect_metrics=True)
+
+        runner = Runner(simulation, args.messages, args.interval)
+        runner.run(args.steps, args.max_steps)
+
+        stats = runner.stats()
+        summary = simulation.metrics.summary()
+        per_delivery = summary['transmissions_per_delivery']
+        latency = stats['mean_latency']
+
+        print(
+            f'{network_type:<10}'
+            f'{stats["delivered"]:>7}/{stats["injected"]:<3}'
+            f'{summary["transmissions"]:>15}'
+            f'{per_delivery if per_delivery is not None else float("nan"):>14.1f}'
+            f'{latency if latency is not None else float("nan"):>9.1f}'
+            f'{stats["steps"]:>8}')
+
+
+def set_mobility(simulation: Simulation, args: argparse.Namespace) -> None:
+    if args.mobile_fraction <= 0 and args.mobility_trace is None:
+        return
+
+    from mobility import random_waypoints, read_mobility_trace
+
+    min_speed, max_speed = args.speed
+    models = random_waypoints(list(simulation.medium.nodes), args.mobile_fraction, min_speed, max_speed, args.pause, args.mobility_seed)
+
+    if args.mobility_trace is not None:
+        for node_id, model in read_mobility_trace(args.mobility_trace).items():
+            node = simulation.medium.find_node_by_id(node_id)
+
+            if node is None:
+                raise ValueError(f'Node {node_id} of the mobility trace is not in the network')
+
+            models[node] = model
+
+    for node, model in models.items():
+        simulation.set_mobility(node, model)
+
+
+def print_connectivity(simulation: Simulation) -> None:
+    from connectivity import Connectivity
+    connectivity = Connectivity(simulation.medium)
+
+    for name, value in connectivity.summary().items():
+        print(f'  {name + ":":<28}{value}')
+
+    # Nothing is toggled from here on, so the medium need not keep it up to date
+    simulation.medium.connectivity = None
+
+
+def main() -> None:
+    args = parse_args()
+
+    logging.basicConfig(
+        format  = '%(asctime)-5s.%(msecs)03d | %(levelname)-7s | %(message)s',
+        level   = logging.INFO if args.verbose else logging.WARNING,
+        datefmt = '%Y-%m-%d %H:%M:%S')
+
+    if args.compare:
+        compare_network_types(args)
+        return
+
+    # Options left out take the defaults of the engine and the radio model, which are only imported when used
+    event_options = {
+        name: value for name, value in (
+            ('airtime', args.airtime),
+            ('processing_time', args.processing_time),
+            ('propagation_delay', args.propagation_delay))
+        if value is not None
+    }
+
+    radio_options = {
+        name: value for name, value in (
+            ('sinr_threshold', args.sinr_threshold),
+            ('path_loss_exponent', args.path_loss_exponent))
+        if value is not None
+    }
+
+    simulation = Simulation(
+        args.nodes_file,
+        engine=args.engine,
+        duplicate_filter=filter_factory(args.duplicate_filter, args.filter_capacity, args.false_positive_rate),
+        audit_duplicate_filters=args.duplicate_filter != 'exact',
+        collect_metrics=args.metrics is not None,
+        event_options=event_options,
+        shards=args.shards,
+        radio_model=args.radio,
+        radio_options=radio_options)
+
+    if args.from_snapshot is not None:
+        from snapshot import Snapshot
+        simulation.restore(Snapshot.load(args.from_snapshot))
+
+    if args.connectivity:
+        print_connectivity(simulation)
+
+    set_mobility(simulation, args)
+    runner = Runner(simulation, args.messages, args.interval)
+
+    if args.trace is not None:
+        simulation.start_trace(args.trace)
+
+    startup_time = time.perf_counter() - STARTED_AT
+
+    run_started_at = time.perf_counter()
+    runner.run(args.steps, args.max_steps)
+    run_time = time.perf_counter() - run_started_at
+
+    if args.trace is not None:
+        simulation.stop_trace()
+
+    runner.print_stats(startup_time, run_time)
+
+    if args.metrics is not None:
+        simulation.metrics.save(args.metrics)
+        print(f'Metrics saved in "{args.metrics}"')
+
+    if args.save_snapshot is not None:
+        simulation.snapshot().save(args.save_snapshot)
+        print(f'Snapshot saved in "{args.save_snapshot}"')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,59 +1,343 @@
 from __future__ import annotations
-from typing import List
+import heapq
+from typing import Dict, Iterator, KeysView, List
+
+
+GRID_CELL_SIZE = 4
 
 
 class Medium:
 
     def __init__(self) -> None:
-        self.nodes: List[Node] = []
+        self.grid = Grid(GRID_CELL_SIZE)
+        self.power_counts: Dict[int, int] = {}
+
+        self.reachable_nodes: Dict[Node, List[Node]] = {}
+        self.receiving_nodes: Dict[Node, List[Node]] = {}
+        self.topology_version = 0
+
+        self.node_orders: Dict[Node, int] = {}
+        self.next_node_order = 0
+        self.busy_nodes: Dict[Node, None] = {}
+
+        # Id index. Both heaps drop entries lazily: ids in `free_ids` may have been taken again
+        # and ids in `descending_ids` (stored negated) may have been removed since they were pushed.
+        self.nodes_by_id: Dict[int, Node] = {}
+        self.free_ids: List[int] = []
+        self.lowest_unscanned_id = 0
+        self.descending_ids: List[int] = []
+
+        # Simulation step, the only clock nodes can read (for instance to expire cached routes)
+        self.step = 0
+
+        self.metrics: Metrics = None
+        self.trace: TraceRecorder = None
+
+        # Set by the events engine, which then delivers emissions after their link delays
+        self.event_engine: EventEngine = None
+
+        # Set by radio models, which then resolve all the emissions of a step together
+        self.radio: RadioModel = None
+
+        # Set by connectivity analyses, which are told about toggles to update their results in place
+        self.connectivity: Connectivity = None
+
+        # Set by viewers, which take the nodes added, removed, moved, toggled or repowered since they last looked
+        self.changed_nodes: Dict[Node, None] = None
+
+        # Set by the sharded engine, which sends the nodes changed between steps to the workers that own them
+        self.sharded_engine: ShardedEngine = None
+
+
+    # Nodes in the order they were added, kept by `node_orders` so that removing one does not scan a list
+    @property
+    def nodes(self) -> KeysView[Node]:
+        return self.node_orders.keys()
 
 
     def add_node(self, new_node: Node) -> None:
-        self.nodes.append(new_node)
+        self.grid.insert(new_node)
+        self.count_power(new_node.power, 1)
+        self.invalidate_links_to(new_node.pos)
+
+        self.node_orders[new_node] = self.next_node_order
+        self.next_node_order += 1
+        self.mark_busy(new_node)
+        self.record_change(new_node)
+
+        self.nodes_by_id.setdefault(new_node.id, new_node)
+        heapq.heappush(self.descending_ids, -new_node.id)
+
+
+    def remove_node(self, node: Node) -> None:
+        self.grid.remove(node)
+        self.count_power(node.power, -1)
+        self.invalidate_links_to(node.pos)
+        self.invalidate_links_from(node)
+
+        del self.node_orders[node]
+        self.busy_nodes.pop(node, None)
+        self.record_change(node)
+
+        if self.radio is not None:
+            self.radio.forget(node)
+
+        if self.nodes_by_id.get(node.id) is node:
+            del self.nodes_by_id[node.id]
+
+            if 0 <= node.id < self.lowest_unscanned_id:
+                heapq.heappush(self.free_ids, node.id)
+
+
+    def clear(self) -> None:
+        if self.changed_nodes is not None:
+            self.changed_nodes.update(dict.fromkeys(self.node_orders))
+
+        if self.radio is not None:
+            self.radio.clear()
+
+        self.grid.clear()
+        self.power_counts = {}
+        self.reachable_nodes = {}
+        self.receiving_nodes = {}
+        self.topology_version += 1
+
+        self.node_orders = {}
+        self.busy_nodes = {}
+        self.nodes_by_id = {}
+        self.free_ids = []
+        self.lowest_unscanned_id = 0
+        self.descending_ids = []
+
+
+    def update_node_position(self, node: Node, old_pos: Point) -> None:
+        if node in self.grid:
+            self.grid.move(node)
+            self.update_links_to(node, old_pos)
+            self.invalidate_links_from(node)
+            self.record_change(node)
+
+            if self.trace is not None:
+                self.trace.moved_nodes[node] = None
+
+
+    def update_node_power(self, node: Node, old_power: int) -> None:
+        if node in self.grid:
+            self.count_power(old_power, -1)
+            self.count_power(node.power, 1)
+            self.invalidate_links_from(node)
+            self.record_change(node)
+
+            if self.trace is not None:
+                self.trace.edited_nodes[node] = None
+
+
+    def update_node_status(self, node: Node) -> None:
+        if node in self.grid:
+            for emitter in self.get_emitters_reaching(node.pos):
+                self.receiving_nodes.pop(emitter, None)
+
+                if self.sharded_engine is not None:
+                    self.sharded_engine.relinked_nodes[emitter] = None
+
+            if self.connectivity is not None:
+                self.connectivity.update_node_status(node)
+
+            self.topology_version += 1
+            self.record_change(node)
+
+            if self.trace is not None:
+                self.trace.edited_nodes[node] = None
+
+            if node.online:
+                self.mark_busy(node)
+            else:
+                self.busy_nodes.pop(node, None)
+
+
+    def record_change(self, node: Node) -> None:
+        if self.changed_nodes is not None:
+            self.changed_nodes[node] = None
+
+        if self.sharded_engine is not None:
+            self.sharded_engine.changed_nodes[node] = None
+
+
+    def mark_busy(self, node: Node) -> None:
+        if node.online and node in self.node_orders and (len(node.input_queue) > 0 or len(node.output_queue) > 0 or node.get_wakeup_step() is not None):
+            self.busy_nodes[node] = None
+
+            if self.event_engine is not None:
+                self.event_engine.wake(node)
+
+
+    def release_idle_nodes(self, nodes: List[Node]) -> None:
+        for node in nodes:
+            if len(node.input_queue) <= 0 and len(node.output_queue) <= 0 and node.get_wakeup_step() is None:
+                self.busy_nodes.pop(node, None)
+
+
+    def get_busy_nodes(self) -> List[Node]:
+        return sorted(self.busy_nodes, key=self.node_orders.__getitem__)
 
 
     def propagate_message(self, message: Message, emitter: Node) -> None:
-        receiving_nodes = self.get_nodes_in_range_of(emitter)
+        hopped_message = message.hopped
 
-        for node in receiving_nodes:
-            if node.id != emitter.id:
-                node.receive_message(message.clone)
+        if self.metrics is not None:
+            self.metrics.record_transmissions()
+
+        if self.event_engine is not None:
+            self.event_engine.schedule_receptions(hopped_message, emitter, self.get_receivers_of(emitter))
+            return
+
+        if self.radio is not None:
+            self.radio.collect(hopped_message, emitter)
+            return
+
+        for node in self.get_receivers_of(emitter):
+            node.receive_message(hopped_message)
 
 
     def get_nodes_in_range_of(self, central_node: Node) -> List[Node]:
-        for node in self.nodes:
-            if node.pos.distance_to(central_node.pos) <= central_node.power:
+        return self.grid.query(central_node.pos, central_node.power)
+
+
+    def get_reachable_nodes_of(self, emitter: Node) -> List[Node]:
+        reachable_nodes = self.reachable_nodes.get(emitter)
+
+        if reachable_nodes is None:
+            reachable_nodes = [node for node in self.get_nodes_in_range_of(emitter) if node is not emitter]
+            self.reachable_nodes[emitter] = reachable_nodes
+
+        return reachable_nodes
+
+
+    def get_receivers_of(self, emitter: Node) -> List[Node]:
+        receiving_nodes = self.receiving_nodes.get(emitter)
+
+        if receiving_nodes is None:
+            receiving_nodes = [node for node in self.get_reachable_nodes_of(emitter) if node.online]
+            self.receiving_nodes[emitter] = receiving_nodes
+
+        return receiving_nodes
+
+
+    def get_emitters_reaching(self, pos: Point) -> Iterator[Node]:
+        if len(self.power_counts) <= 0:
+            return
+
+        for node in self.grid.query(pos, max(self.power_counts)):
+            if node.power >= 0 and node.pos.squared_distance_to(pos) <= node.power * node.power:
                 yield node
 
 
-    def find_node_by_id(self, node_id: int) -> Node:
-        for node in self.nodes:
-            if node.id == node_id:
-                return node
+    def find_node_at(self, pos: Point, radius: float) -> Node:
+        return next(self.grid.query(pos, radius), None)
+
 
-        return None
+    def invalidate_links_to(self, pos: Point) -> None:
+        # Nothing is cached while a simulation is being loaded, so bulk loads skip the reverse query
+        if len(self.reachable_nodes) > 0:
+            for emitter in self.get_emitters_reaching(pos):
+                self.reachable_nodes.pop(emitter, None)
+                self.receiving_nodes.pop(emitter, None)
 
+        self.topology_version += 1
 
+
+    # Patches the cached links of the emitters around a moved node instead of dropping them, so nodes
+    # moving every step do not make their neighbours query the grid again. Runs once per move, hence inlined.
+    def update_links_to(self, node: Node, old_pos: Point) -> None:
+        if len(self.reachable_nodes) > 0 and len(self.power_counts) > 0:
+            new_pos = node.pos
+            max_power = max(self.power_counts)
+            reachable_by_emitter = self.reachable_nodes
+            patch_delays = self.event_engine is not None or self.radio is not None
+            sharded_engine = self.sharded_engine
+
+            # Every emitter reaching either position is in the cells around both, as far as the highest power
+            min_cell_x, min_cell_y = self.grid.cell_at(min(old_pos.x, new_pos.x) - max_power, min(old_pos.y, new_pos.y) - max_power)
+            max_cell_x, max_cell_y = self.grid.cell_at(max(old_pos.x, new_pos.x) + max_power, max(old_pos.y, new_pos.y) + max_power)
+
+            for _, cell_nodes in self.grid.cells_between(min_cell_x, min_cell_y, max_cell_x, max_cell_y):
+                for emitter in cell_nodes:
+                    reachable_nodes = reachable_by_emitter.get(emitter)
+
+                    if reachable_nodes is None or emitter is node:
+                        continue
+
+                    pos = emitter.pos
+                    power = emitter.power
+                    reached_before = (pos.x - old_pos.x) ** 2 + (pos.y - old_pos.y) ** 2 <= power * power
+                    reached_now = (pos.x - new_pos.x) ** 2 + (pos.y - new_pos.y) ** 2 <= power * power
+
+                    if power < 0 or not (reached_before or reached_now):
+                        continue
+
+                    if reached_before != reached_now:
+                        if reached_now:
+                            reachable_nodes.append(node)
+                        else:
+                            reachable_nodes.remove(node)
+
+                        self.receiving_nodes.pop(emitter, None)
+
+                        if sharded_engine is not None:
+                            sharded_engine.relinked_nodes[emitter] = None
+                    elif patch_delays:
+                        # Same receivers, but the delay and the signal of the link changed
+                        self.receiving_nodes.pop(emitter, None)
+
+        self.topology_version += 1
+
+
+    def invalidate_links_from(self, node: Node) -> None:
+        self.reachable_nodes.pop(node, None)
+        self.receiving_nodes.pop(node, None)
+        self.topology_version += 1
+
+
+    def count_power(self, power: int, delta: int) -> None:
+        count = self.power_counts.get(power, 0) + delta
+
+        if count > 0:
+            self.power_counts[power] = count
+        else:
+            self.power_counts.pop(power, None)
+
+
+    def find_node_by_id(self, node_id: int) -> Node:
+        return self.nodes_by_id.get(node_id)
+
+
+    # Every free id below `lowest_unscanned_id` is in `free_ids`, so the scan upwards only ever passes each id once
     def find_first_free_id(self) -> int:
-        if len(self.nodes) <= 0:
-            return 0
+        while len(self.free_ids) > 0 and self.free_ids[0] in self.nodes_by_id:
+            heapq.heappop(self.free_ids)
 
-        node_ids = sorted([node.id for node in self.nodes])
-        highest_id = max(node_ids)
+        if len(self.free_ids) > 0:
+            return self.free_ids[0]
 
-        for i in range(highest_id + 1):
-            if i != node_ids[i]:
-                return i
+        while self.lowest_unscanned_id in self.nodes_by_id:
+            self.lowest_unscanned_id += 1
 
-        return highest_id + 1
+        return self.lowest_unscanned_id
 
 
     def get_highest_node_id(self) -> int:
-        if len(self.nodes) <= 0:
+        while len(self.descending_ids) > 0 and -self.descending_ids[0] not in self.nodes_by_id:
+            heapq.heappop(self.descending_ids)
+
+        if len(self.descending_ids) <= 0:
             return 0
 
-        return max([node.id for node in self.nodes])
+        return -self.descending_ids[0]
 
 
+from grid import Grid
 from message import Message
+from metrics import Metrics
 from node import Node
+from point import Point
+from tracing import TraceRecorder
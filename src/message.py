@@ -1,41 +1,143 @@
 from __future__ import annotations
-import copy
-from typing import List
+from typing import Any, Dict, Tuple
 
 
+ROUTE_REQUEST = 'RREQ'
+ROUTE_REPLY = 'RREP'
+ROUTE_ERROR = 'RERR'
+DATA = 'DATA'
+ACK = 'ACK'
+
+# Route requests, replies and errors are not numbered like data messages
+CONTROL_MESSAGE_ID = -1
+
+
+# Every emission may leave a copy queued in thousands of nodes, so messages carry no instance dict
 class Message:
 
-    def __init__(self, message_id: int, payload: str) -> None:
+    __slots__ = ('id', 'payload', 'hops')
+
+    # Every slot along the class hierarchy, in declaration order
+    fields: Tuple[str, ...] = __slots__
+
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        cls.fields = cls.fields + cls.__dict__.get('__slots__', ())
+
+
+    def __init__(self, message_id: int, payload: str, hops: int = 0) -> None:
         self.id: int = message_id
         self.payload: str = payload
+        self.hops: int = hops
+
+
+    # Messages are shared by every receiver of an emission, so their fields can only be set once
+    def __setattr__(self, name: str, value: Any) -> None:
+        if hasattr(self, name):
+            raise AttributeError(f'{type(self).__name__}.{name} is read-only, use derive() instead')
+
+        super().__setattr__(name, value)
+
+
+    def derive(self, **changes: Any) -> Message:
+        unknown_fields = changes.keys() - set(self.fields)
+
+        if len(unknown_fields) > 0:
+            raise AttributeError(f'{type(self).__name__} has no fields {sorted(unknown_fields)}')
+
+        fields = self.get_fields()
+        fields.update(changes)
+        return type(self).from_fields(fields)
+
+
+    def get_fields(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.fields}
+
+
+    # Builds a message without going through its constructor, e.g. when loading a snapshot
+    @classmethod
+    def from_fields(cls, fields: Dict[str, Any]) -> Message:
+        message = cls.__new__(cls)
+
+        for name in cls.fields:
+            object.__setattr__(message, name, fields[name])
+
+        return message
+
+
+    @property
+    def hopped(self) -> Message:
+        return self.derive(hops=self.hops + 1)
 
 
     @property
     def clone(self) -> Message:
-        return copy.deepcopy(self)
+        return self
 
 
     def __str__(self) -> str:
-        return f'Message(id={self.id}, destination_id={self.destination_id}, payload={self.payload})'
+        return f'Message(id={self.id}, payload={self.payload})'
 
 
 class FloodingMessage(Message):
 
-    def __init__(self, message_id: int, destination_id: int, payload: str) -> None:
-        super().__init__(message_id, payload)
+    __slots__ = ('destination_id',)
+
+
+    def __init__(self, message_id: int, destination_id: int, payload: str, hops: int = 0) -> None:
+        super().__init__(message_id, payload, hops)
         self.destination_id: int = destination_id
 
 
+    def __str__(self) -> str:
+        return f'Message(id={self.id}, destination_id={self.destination_id}, payload={self.payload})'
+
+
 class RoutingMessage(Message):
 
-    def __init__(self, message_id: int, payload: str) -> None:
-        super().__init__(message_id, payload)
+    __slots__ = ('origin', 'seq', 'route', 'destination', 'next_hop', 'type', 'unreachable', 'two_way', 'sender')
+
+
+    def __init__(
+            self,
+            message_id: int,
+            payload: str,
+            hops: int = 0,
+            origin: int = None,
+            seq: int = None,
+            route: Tuple[int, ...] = None,
+            destination: int = None,
+            next_hop: int = None,
+            message_type: str = None,
+            unreachable: int = None,
+            two_way: bool = None,
+            sender: int = None) -> None:
+
+        super().__init__(message_id, payload, hops)
 
         # TODO ver https://docs.google.com/document/d/16K-tjtF1Ua8tE9iZuNf3dtIShc4IKibH
-        self.origin: int = None
-        self.seq: int = None
-        self.id = f'{self.origin}-{self.seq}'
-        self.route: List[int] = None
-        self.destination: int = None
-        self.next_hop: int = None
-        self.type: str = None
+        self.origin: int = origin
+        self.seq: int = seq
+        self.route: Tuple[int, ...] = route
+        self.destination: int = destination
+        self.next_hop: int = next_hop
+        self.type: str = message_type
+        self.unreachable: int = unreachable
+        self.two_way: bool = two_way
+        self.sender: int = sender
+
+
+    # Forwarded copies of a message and its acknowledgement share its key
+    @property
+    def ack_key(self) -> Tuple[int, int, int, int]:
+        return (self.origin, self.destination, self.id, self.seq)
+
+
+    @property
+    def destination_id(self) -> int:
+        return self.destination
+
+
+    def __str__(self) -> str:
+        return f'Message(type={self.type}, id={self.id}, origin={self.origin}, destination={self.destination}, next_hop={self.next_hop})'
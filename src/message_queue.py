@@ -0,0 +1,121 @@
+from __future__ import annotations
+from collections import deque
+from typing import Deque, Dict, Iterator
+
+
+DROP_TAIL = 'drop-tail'
+DROP_HEAD = 'drop-head'
+DROP_DUPLICATE_FIRST = 'drop-duplicate-first'
+
+DROP_POLICIES = (DROP_TAIL, DROP_HEAD, DROP_DUPLICATE_FIRST)
+
+# Most queues of a large network are empty, and an empty deque already takes a block of 64 slots
+EMPTY_MESSAGES = ()
+
+
+class MessageQueue:
+
+    __slots__ = ('capacity', 'drop_policy', 'messages', 'id_counts', 'duplicates', 'drops', 'high_water_mark', 'evicted')
+
+
+    def __init__(self, capacity: int = None, drop_policy: str = DROP_TAIL) -> None:
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f'Unknown drop policy "{drop_policy}"')
+
+        if capacity is not None and capacity <= 0:
+            raise ValueError(f'Queue capacity must be positive, got {capacity}')
+
+        self.capacity = capacity
+        self.drop_policy = drop_policy
+
+        self.messages: Deque[Message] = EMPTY_MESSAGES
+
+        # Only kept by the policy that evicts duplicates
+        self.id_counts: Dict[int, int] = {} if drop_policy == DROP_DUPLICATE_FIRST else None
+        self.duplicates = 0
+
+        self.drops = 0
+        self.high_water_mark = 0
+
+        # Last message pushed out by `make_room_for`, only meaningful right after an append to a full queue
+        self.evicted: Message = None
+
+
+    def append(self, message: Message) -> bool:
+        if self.is_full and not self.make_room_for(message):
+            self.drops += 1
+            return False
+
+        if self.messages is EMPTY_MESSAGES:
+            self.messages = deque()
+
+        self.messages.append(message)
+
+        if self.drop_policy == DROP_DUPLICATE_FIRST:
+            self.count_id(message.id, 1)
+
+        if len(self.messages) > self.high_water_mark:
+            self.high_water_mark = len(self.messages)
+
+        return True
+
+
+    def popleft(self) -> Message:
+        message = self.messages.popleft()
+
+        if self.drop_policy == DROP_DUPLICATE_FIRST:
+            self.count_id(message.id, -1)
+
+        return message
+
+
+    def clear(self) -> None:
+        self.messages = EMPTY_MESSAGES
+        self.id_counts = {} if self.drop_policy == DROP_DUPLICATE_FIRST else None
+        self.duplicates = 0
+
+
+    @property
+    def is_full(self) -> bool:
+        return self.capacity is not None and len(self.messages) >= self.capacity
+
+
+    def make_room_for(self, message: Message) -> bool:
+        if self.drop_policy == DROP_HEAD:
+            self.evicted = self.popleft()
+            self.drops += 1
+            return True
+
+        if self.drop_policy == DROP_DUPLICATE_FIRST and message.id not in self.id_counts and self.duplicates > 0:
+            for i, queued_message in enumerate(self.messages):
+                if self.id_counts[queued_message.id] > 1:
+                    del self.messages[i]
+                    self.count_id(queued_message.id, -1)
+                    self.evicted = queued_message
+                    self.drops += 1
+                    return True
+
+        return False
+
+
+    def count_id(self, message_id: int, delta: int) -> None:
+        count = self.id_counts.get(message_id, 0)
+        new_count = count + delta
+
+        self.duplicates += max(new_count - 1, 0) - max(count - 1, 0)
+
+        if new_count > 0:
+            self.id_counts[message_id] = new_count
+        else:
+            del self.id_counts[message_id]
+
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+
+    def __iter__(self) -> Iterator[Message]:
+        return iter(self.messages)
+
+
+from message import Message
@@ -0,0 +1,193 @@
+from __future__ import annotations
+import csv
+import json
+from typing import Dict, List, Tuple
+
+
+STEP_COLUMNS = (
+    'step',
+    'in_flight',
+    'input_queue_depth',
+    'output_queue_depth',
+    'max_queue_depth',
+    'transmissions',
+    'duplicates_suppressed',
+    'deliveries',
+    'collisions',
+    'false_drops',
+)
+
+DELIVERY_COLUMNS = (
+    'message_id',
+    'node_id',
+    'injected_step',
+    'delivered_step',
+    'latency',
+    'hops',
+)
+
+
+class Metrics:
+
+    def __init__(self) -> None:
+        self.step = 0
+
+        self.transmissions = 0
+        self.duplicates_suppressed = 0
+        self.deliveries = 0
+        self.collisions = 0
+        self.false_drops = 0
+
+        self.total_transmissions = 0
+        self.total_duplicates_suppressed = 0
+        self.total_collisions = 0
+        self.total_false_drops = 0
+        self.injected_at: Dict[int, int] = {}
+
+        self.step_rows: List[Tuple[int, ...]] = []
+        self.delivery_rows: List[Tuple[int, ...]] = []
+
+
+    @classmethod
+    def from_state(cls, state: Dict) -> Metrics:
+        metrics = cls()
+        metrics.step, metrics.total_transmissions, metrics.total_duplicates_suppressed = state['totals']
+        metrics.total_collisions = state.get('total_collisions', 0)
+        metrics.total_false_drops = state.get('total_false_drops', 0)
+        metrics.injected_at = dict(state['injected_at'])
+        metrics.step_rows = list(state['step_rows'])
+        metrics.delivery_rows = list(state['delivery_rows'])
+        return metrics
+
+
+    # Rows are tuples, so only the containers are copied
+    def get_state(self) -> Dict:
+        return {
+            'totals': (self.step, self.total_transmissions, self.total_duplicates_suppressed),
+            'total_collisions': self.total_collisions,
+            'total_false_drops': self.total_false_drops,
+            'injected_at': dict(self.injected_at),
+            'step_rows': tuple(self.step_rows),
+            'delivery_rows': tuple(self.delivery_rows),
+        }
+
+
+    def begin_step(self, step: int) -> None:
+        self.step = step
+        self.transmissions = 0
+        self.duplicates_suppressed = 0
+        self.deliveries = 0
+        self.collisions = 0
+        self.false_drops = 0
+
+
+    def end_step(self, input_queue_depth: int, output_queue_depth: int, max_queue_depth: int) -> None:
+        self.total_transmissions += self.transmissions
+        self.total_duplicates_suppressed += self.duplicates_suppressed
+        self.total_collisions += self.collisions
+        self.total_false_drops += self.false_drops
+
+        self.step_rows.append((
+            self.step,
+            input_queue_depth + output_queue_depth,
+            input_queue_depth,
+            output_queue_depth,
+            max_queue_depth,
+            self.transmissions,
+            self.duplicates_suppressed,
+            self.deliveries,
+            self.collisions,
+            self.false_drops,
+        ))
+
+
+    def record_injection(self, message: Message, step: int) -> None:
+        self.injected_at[message.id] = step
+
+
+    def record_transmissions(self, count: int = 1) -> None:
+        self.transmissions += count
+
+
+    def record_duplicates(self, count: int = 1) -> None:
+        self.duplicates_suppressed += count
+
+
+    # Receptions lost to other emissions of the same step, when a radio model is set
+    def record_collisions(self, count: int = 1) -> None:
+        self.collisions += count
+
+
+    # New messages an approximate duplicate filter took for duplicates, when the filters are audited
+    def record_false_drops(self, count: int = 1) -> None:
+        self.false_drops += count
+
+
+    # Latency counts the steps run since injection, including the one that delivered the message
+    def record_delivery(self, message: Message, node_id: int) -> None:
+        self.deliveries += 1
+
+        injected_step = self.injected_at.get(message.id)
+        delivered_step = self.step + 1
+        latency = delivered_step - injected_step if injected_step is not None else None
+
+        self.delivery_rows.append((message.id, node_id, injected_step, delivered_step, latency, message.hops))
+
+
+    def summary(self) -> Dict:
+        latencies = [row[4] for row in self.delivery_rows if row[4] is not None]
+        hops = [row[5] for row in self.delivery_rows]
+        delivered_ids = {row[0] for row in self.delivery_rows}
+        injected_count = len(self.injected_at)
+
+        return {
+            'steps': len(self.step_rows),
+            'injected': injected_count,
+            'delivered': len(delivered_ids),
+            'delivery_ratio': len(delivered_ids & self.injected_at.keys()) / injected_count if injected_count > 0 else None,
+            'transmissions': self.total_transmissions,
+            'transmissions_per_delivery': self.total_transmissions / len(delivered_ids) if len(delivered_ids) > 0 else None,
+            'duplicates_suppressed': self.total_duplicates_suppressed,
+            'collisions': self.total_collisions,
+            'false_drops': self.total_false_drops,
+            'mean_latency': sum(latencies) / len(latencies) if len(latencies) > 0 else None,
+            'mean_hops': sum(hops) / len(hops) if len(hops) > 0 else None,
+            'in_flight': self.step_rows[-1][1] if len(self.step_rows) > 0 else 0,
+        }
+
+
+    def save(self, path: str) -> None:
+        if path.endswith('.json'):
+            self.save_json(path)
+        else:
+            self.save_csv(path)
+
+
+    def save_json(self, path: str) -> None:
+        with open(path, 'w') as metrics_file:
+            json.dump({
+                'summary': self.summary(),
+                'steps': [dict(zip(STEP_COLUMNS, row)) for row in self.step_rows],
+                'deliveries': [dict(zip(DELIVERY_COLUMNS, row)) for row in self.delivery_rows],
+            }, metrics_file, indent=2)
+
+
+    # Steps go to the given path and deliveries to a sibling ".deliveries.csv" file
+    def save_csv(self, path: str) -> None:
+        write_csv(path, STEP_COLUMNS, self.step_rows)
+        write_csv(deliveries_path_for(path), DELIVERY_COLUMNS, self.delivery_rows)
+
+
+def write_csv(path: str, columns: Tuple[str, ...], rows: List[Tuple[int, ...]]) -> None:
+    with open(path, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(columns)
+        writer.writerows(rows)
+
+
+def deliveries_path_for(path: str) -> str:
+    base_path = path[:-len('.csv')] if path.endswith('.csv') else path
+    return f'{base_path}.deliveries.csv'
+
+
+from message import Message
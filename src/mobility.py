@@ -0,0 +1,188 @@
+from __future__ import annotations
+import bisect
+import csv
+import math
+import random
+from typing import Dict, Iterable, List, Tuple
+
+
+# Trace files are CSV with one row per known position, linearly interpolated between rows
+TRACE_COLUMNS = ('step', 'id', 'x', 'y')
+
+
+# Models keep exact positions and the simulation rounds them to the grid, so slow nodes only touch
+# the medium on the steps they actually change position
+class MobilityModel:
+
+    # Called once per step, in order
+    def advance(self, step: int) -> Tuple[float, float]:
+        raise NotImplementedError()
+
+
+# Picks a random point of the area and a random speed, goes there in a straight line, waits and repeats
+class RandomWaypoint(MobilityModel):
+
+    def __init__(
+            self,
+            start: Point,
+            min_pos: Point,
+            max_pos: Point,
+            min_speed: float,
+            max_speed: float = None,
+            pause_steps: int = 0,
+            rng: random.Random = None) -> None:
+
+        max_speed = min_speed if max_speed is None else max_speed
+
+        if min_speed <= 0 or max_speed < min_speed or pause_steps < 0:
+            raise ValueError('Speeds must be positive and in order, and pauses must not be negative')
+
+        self.x = float(start.x)
+        self.y = float(start.y)
+        self.min_pos = min_pos
+        self.max_pos = max_pos
+        self.min_speed = min_speed
+        self.max_speed = max_speed
+        self.pause_steps = pause_steps
+        self.rng = rng or random.Random()
+
+        self.pause_left = 0
+        self.choose_waypoint()
+
+
+    def choose_waypoint(self) -> None:
+        self.target_x = self.rng.uniform(self.min_pos.x, self.max_pos.x)
+        self.target_y = self.rng.uniform(self.min_pos.y, self.max_pos.y)
+        self.speed = self.rng.uniform(self.min_speed, self.max_speed)
+
+
+    def advance(self, step: int) -> Tuple[float, float]:
+        if self.pause_left > 0:
+            self.pause_left -= 1
+            return (self.x, self.y)
+
+        self.x, self.y, left = move_towards(self.x, self.y, self.target_x, self.target_y, self.speed)
+
+        if left >= 0:
+            self.pause_left = self.pause_steps
+            self.choose_waypoint()
+
+        return (self.x, self.y)
+
+
+# Follows a polyline at a constant speed, starting at its first point and, if looping, going back to it after the last
+class LinearPath(MobilityModel):
+
+    def __init__(self, waypoints: List[Point], speed: float, loop: bool = True) -> None:
+        if len(waypoints) <= 0 or speed <= 0:
+            raise ValueError('Paths need a waypoint and a positive speed')
+
+        self.waypoints = waypoints
+        self.speed = speed
+        self.loop = loop
+
+        self.x = float(waypoints[0].x)
+        self.y = float(waypoints[0].y)
+        self.next_waypoint = 1
+
+        # A lap without length would never end
+        closing = waypoints[:1] if loop else []
+        self.length = sum(start.distance_to(end) for start, end in zip(waypoints, waypoints[1:] + closing))
+
+
+    def advance(self, step: int) -> Tuple[float, float]:
+        distance = self.speed
+
+        # A fast node may pass several waypoints in one step
+        while distance > 0 and self.next_waypoint < len(self.waypoints):
+            target = self.waypoints[self.next_waypoint]
+            self.x, self.y, distance = move_towards(self.x, self.y, target.x, target.y, distance)
+
+            if distance < 0:
+                break
+
+            self.next_waypoint += 1
+
+            if self.next_waypoint >= len(self.waypoints) and self.loop and self.length > 0:
+                self.next_waypoint = 0
+
+        return (self.x, self.y)
+
+
+# Replays recorded positions: before the first sample the node stays there, and after the last one too
+class TraceMobility(MobilityModel):
+
+    def __init__(self, samples: Iterable[Tuple[int, float, float]]) -> None:
+        samples = sorted(samples)
+
+        if len(samples) <= 0:
+            raise ValueError('Traces need at least one position')
+
+        self.steps = [step for step, _, _ in samples]
+        self.positions = [(float(x), float(y)) for _, x, y in samples]
+
+
+    def advance(self, step: int) -> Tuple[float, float]:
+        i = bisect.bisect_right(self.steps, step)
+
+        if i <= 0:
+            return self.positions[0]
+
+        if i >= len(self.steps):
+            return self.positions[-1]
+
+        start_step = self.steps[i - 1]
+        (start_x, start_y), (end_x, end_y) = self.positions[i - 1], self.positions[i]
+        progress = (step - start_step) / (self.steps[i] - start_step)
+
+        return (start_x + (end_x - start_x) * progress, start_y + (end_y - start_y) * progress)
+
+
+# Returns the new position and the distance left after reaching the target, or minus the distance still to go
+def move_towards(x: float, y: float, target_x: float, target_y: float, distance: float) -> Tuple[float, float, float]:
+    remaining = math.hypot(target_x - x, target_y - y)
+
+    if remaining <= distance:
+        return (target_x, target_y, distance - remaining)
+
+    progress = distance / remaining
+    return (x + (target_x - x) * progress, y + (target_y - y) * progress, distance - remaining)
+
+
+def read_mobility_trace(path: str) -> Dict[int, TraceMobility]:
+    samples: Dict[int, List[Tuple[int, float, float]]] = {}
+
+    with open(path, newline='') as trace_file:
+        reader = csv.DictReader(trace_file)
+
+        if reader.fieldnames is None or any(column not in reader.fieldnames for column in TRACE_COLUMNS):
+            raise ValueError(f'"{path}" is not a mobility trace, its columns must be {", ".join(TRACE_COLUMNS)}')
+
+        for row in reader:
+            samples.setdefault(int(row['id']), []).append((int(row['step']), float(row['x']), float(row['y'])))
+
+    return {node_id: TraceMobility(node_samples) for node_id, node_samples in samples.items()}
+
+
+# Random waypoint models for a random share of the nodes, moving within the bounding box of the network
+def random_waypoints(
+        nodes: List[Node],
+        fraction: float,
+        min_speed: float,
+        max_speed: float = None,
+        pause_steps: int = 0,
+        seed: int = 0) -> Dict[Node, RandomWaypoint]:
+
+    if len(nodes) <= 0:
+        return {}
+
+    rng = random.Random(seed)
+    min_pos = Point(min(node.pos.x for node in nodes), min(node.pos.y for node in nodes))
+    max_pos = Point(max(node.pos.x for node in nodes), max(node.pos.y for node in nodes))
+    mobile_nodes = rng.sample(nodes, round(len(nodes) * fraction))
+
+    return {node: RandomWaypoint(node.pos, min_pos, max_pos, min_speed, max_speed, pause_steps, rng) for node in mobile_nodes}
+
+
+from node import Node
+from point import Point
@@ -1,45 +1,148 @@
 from __future__ import annotations
 import logging
-from typing import Dict, List
+from typing import Callable, Dict, List, Tuple
+
+from duplicate_filter import DuplicateFilter, ExactFilter, filter_from_state
+from message_queue import MessageQueue, DROP_TAIL
+
+
+# Steps a cached route lives without being used
+ROUTE_LIFETIME = 500
+
+# Steps to wait for a route reply before flooding a new request for the same destination. Each retry
+# doubles the wait, so replies crossing networks with longer round trips than this still get back.
+ROUTE_REQUEST_TIMEOUT = 50
+
+# Requests flooded again for a destination that does not reply before its waiting messages are dropped,
+# which only happens once the last one also timed out
+ROUTE_REQUEST_RETRIES = 5
+
+# Sent messages an origin keeps to resend after route errors, older ones are forgotten
+SENT_MESSAGES_LIMIT = 100
+
+# Steps a node waits for its next hop to acknowledge a message before taking the link as broken
+ACK_TIMEOUT = 5
 
 
 class Node:
 
-    def __init__(self, node_id: int, pos: Point, power: int, online: bool, medium: Medium) -> None:
+    # Large networks hold millions of nodes, so neither they nor their queues carry an instance dict
+    __slots__ = ('id', '_pos', '_power', '_online', 'medium', 'input_queue', 'output_queue', 'duplicate_filter')
+
+
+    def __init__(
+            self,
+            node_id: int,
+            pos: Point,
+            power: int,
+            online: bool,
+            medium: Medium,
+            queue_capacity: int = None,
+            drop_policy: str = DROP_TAIL,
+            duplicate_filter: Callable[[], DuplicateFilter] = ExactFilter) -> None:
+
         self.id = node_id
-        self.pos = pos
-        self.power = power
-        self.online = online
+        self._pos = pos
+        self._power = power
+        self._online = online
         self.medium = medium
 
-        self.input_queue: List[Message] = []
-        self.output_queue: List[Message] = []
+        self.input_queue = MessageQueue(queue_capacity, drop_policy)
+        self.output_queue = MessageQueue(queue_capacity, drop_policy)
+
+        self.duplicate_filter = duplicate_filter
+
+
+    @property
+    def pos(self) -> Point:
+        return self._pos
+
+
+    @pos.setter
+    def pos(self, pos: Point) -> None:
+        old_pos = self._pos
+        self._pos = pos
+        self.medium.update_node_position(self, old_pos)
+
+
+    @property
+    def power(self) -> int:
+        return self._power
+
+
+    @power.setter
+    def power(self, power: int) -> None:
+        old_power = self._power
+        self._power = power
+        self.medium.update_node_power(self, old_power)
+
+
+    @property
+    def online(self) -> bool:
+        return self._online
+
+
+    @online.setter
+    def online(self, online: bool) -> None:
+        self._online = online
+        self.medium.update_node_status(self)
 
 
+    # Called once per receiver and transmission, so logging is lazy and tracing is opt-in
     def receive_message(self, message: Message) -> None:
         if self.online:
-            self.input_queue.append(message)
-            logging.info(f'{self} received {message}')
+            trace = self.medium.trace
+            evicting = trace is not None and self.input_queue.is_full
+
+            if self.input_queue.append(message):
+                self.medium.mark_busy(self)
+                logging.debug('%s received %s', self, message)
+
+                if trace is not None:
+                    if evicting:
+                        trace.record(EVICTED, self.id, self.input_queue.evicted.id)
+
+                    trace.record(RECEIVED, self.id, message.id)
+            else:
+                logging.debug('%s dropped received %s', self, message)
+
+                if trace is not None:
+                    trace.record(DROPPED, self.id, message.id)
 
 
     def process_next_message(self) -> None:
-        if self.online and len(self.input_queue) > 0:
-            message = self.input_queue.pop(0)
+        # A full output queue holds messages back in the input queue instead of dropping relays
+        if self.online and len(self.input_queue) > 0 and not self.output_queue.is_full:
+            message = self.input_queue.popleft()
+
+            if self.medium.trace is not None:
+                self.medium.trace.record(PROCESSED, self.id, message.id)
+
             self.process_message(message)
 
 
     def dispatch_message(self, message: Message) -> None:
-        self.output_queue.append(message)
+        if self.output_queue.append(message):
+            self.medium.mark_busy(self)
+        else:
+            logging.debug('%s dropped dispatched %s', self, message)
 
 
-    def emit_next_message(self) -> None:
+    def emit_next_message(self) -> Message:
         if self.online and len(self.output_queue) > 0:
-            message = self.output_queue.pop(0)
+            message = self.output_queue.popleft()
+
+            if self.medium.trace is not None:
+                self.medium.trace.record(EMITTED, self.id, message.id)
+
             self.medium.propagate_message(message, self)
-            logging.debug(f'{self} emitted {message}')
+            logging.debug('%s emitted %s', self, message)
+            return message
 
+        return None
 
-    def create_message(self) -> None:
+
+    def create_message(self) -> Message:
         raise NotImplementedError()
 
 
@@ -47,8 +150,41 @@ class Node:
         raise NotImplementedError()
 
 
-    def to_dict(self) -> Dict:
+    # Step at which a node with nothing queued still has something to do. Until then it stays busy, so
+    # the step engines keep visiting it and the events engine sets a timer for it.
+    def get_wakeup_step(self) -> int:
+        return None
+
+
+    def wake_up(self) -> None:
+        pass
+
+
+    # Messages are immutable, so states share them instead of copying them
+    def get_state(self) -> Dict:
         return {
+            'input_queue': tuple(self.input_queue),
+            'output_queue': tuple(self.output_queue),
+            'drops': (self.input_queue.drops, self.output_queue.drops),
+        }
+
+
+    def set_state(self, state: Dict) -> None:
+        self.input_queue.clear()
+        self.output_queue.clear()
+
+        for message in state['input_queue']:
+            self.input_queue.append(message)
+
+        for message in state['output_queue']:
+            self.output_queue.append(message)
+
+        self.input_queue.drops, self.output_queue.drops = state['drops']
+        self.medium.mark_busy(self)
+
+
+    def to_dict(self) -> Dict:
+        node_dict = {
             'id': self.id,
             'pos': {
                 'x': self.pos.x,
@@ -59,6 +195,32 @@ class Node:
             'type': self.node_type,
         }
 
+        if self.queue_capacity is not None:
+            node_dict['queue_capacity'] = self.queue_capacity
+            node_dict['drop_policy'] = self.drop_policy
+
+        return node_dict
+
+
+    @property
+    def queue_capacity(self) -> int:
+        return self.input_queue.capacity
+
+
+    @property
+    def drop_policy(self) -> str:
+        return self.input_queue.drop_policy
+
+
+    @property
+    def dropped_messages(self) -> int:
+        return self.input_queue.drops + self.output_queue.drops
+
+
+    @property
+    def false_drops(self) -> int:
+        return 0
+
 
     @property
     def status(self) -> str:
@@ -76,52 +238,562 @@ class Node:
 
 class FloodingNode(Node):
 
-    def __init__(self, node_id: int, pos: Point, power: int, online: bool, medium: Medium) -> None:
-        super().__init__(node_id, pos, power, online, medium)
+    __slots__ = ('next_message_id', 'consumed_message_ids', 'relayed_message_ids')
+
+
+    def __init__(self, node_id: int, pos: Point, power: int, online: bool, medium: Medium, **node_options) -> None:
+        super().__init__(node_id, pos, power, online, medium, **node_options)
 
         self.next_message_id = 0
 
-        self.consumed_message_ids: List[int] = []
-        self.relayed_message_ids: List[int] = []
+        self.consumed_message_ids = self.duplicate_filter()
+        self.relayed_message_ids = self.duplicate_filter()
 
 
-    def create_message(self) -> None:
+    def create_message(self) -> Message:
         destination_id = self.medium.get_highest_node_id()
         message = FloodingMessage(message_id=self.next_message_id, destination_id=destination_id, payload='test')
         self.receive_message(message)
         self.next_message_id += 1
+        return message
 
 
     def process_message(self, message: Message) -> None:
+        metrics = self.medium.metrics
+
         if message.id in self.relayed_message_ids:
-            logging.debug(f'{self} ignoring already relayed {message}')
+            logging.debug('%s ignoring already relayed %s', self, message)
+
+            if metrics is not None:
+                metrics.record_duplicates()
+
+                if self.relayed_message_ids.last_lookup_false:
+                    metrics.record_false_drops()
         elif message.id in self.consumed_message_ids:
-            logging.debug(f'{self} ignoring already consumed {message}')
+            logging.debug('%s ignoring already consumed %s', self, message)
+
+            if metrics is not None:
+                metrics.record_duplicates()
+
+                if self.consumed_message_ids.last_lookup_false:
+                    metrics.record_false_drops()
         elif message.destination_id == self.id:
-            logging.info(f'{message} reached final destination')
-            self.consumed_message_ids.append(message.id)
+            logging.info('%s reached final destination', message)
+            self.consumed_message_ids.add(message.id)
+
+            if metrics is not None:
+                metrics.record_delivery(message, self.id)
+
+            if self.medium.trace is not None:
+                self.medium.trace.record(DELIVERED, self.id, message.id)
         else:
-            logging.debug(f'{self} relaying {message}')
+            logging.debug('%s relaying %s', self, message)
             self.dispatch_message(message)
-            self.relayed_message_ids.append(message.id)
+            self.relayed_message_ids.add(message.id)
+
+        logging.debug('%s processed %s', self, message)
+
+
+    def get_state(self) -> Dict:
+        state = super().get_state()
+        state['next_message_id'] = self.next_message_id
+        state['consumed_message_ids'] = self.consumed_message_ids.get_state()
+        state['relayed_message_ids'] = self.relayed_message_ids.get_state()
+        return state
 
-        logging.debug(f'{self} processed {message}')
 
+    def set_state(self, state: Dict) -> None:
+        super().set_state(state)
+        self.next_message_id = state['next_message_id']
+        self.consumed_message_ids = filter_from_state(state['consumed_message_ids'])
+        self.relayed_message_ids = filter_from_state(state['relayed_message_ids'])
 
+
+    @property
+    def false_drops(self) -> int:
+        return self.consumed_message_ids.false_positives + self.relayed_message_ids.false_positives
+
+
+# Source routing in the style of DSR: routes are discovered on demand with flooded route requests,
+# answered by the destination and cached, with every prefix and suffix, by the nodes along them.
+# Powers differ between nodes, so links may work one way only. Nodes only know the links they have
+# seen working: every message heard proves the link from its sender, and hearing a node acknowledge
+# or pass on a message this node sent it proves the link back. A unicast passed on straight away is
+# acknowledged by that, otherwise its receiver acknowledges it as soon as it gets it, like link-layer
+# acknowledgements, so acknowledgements never wait behind the queues.
+# A reply retraces the request path, and a node that gets no acknowledgement for it floods it the
+# rest of the way back. Routes back to the requester are only learnt from requests whose links were
+# all seen working both ways. A data message that is not acknowledged makes its emitter flood a route
+# error, so every node forgets the link and the origin resends.
 class RoutingNode(Node):
 
-    def __init__(self, node_id: int, pos: Point, power: int, online: bool, medium: Medium) -> None:
-        super().__init__(node_id, pos, power, online, medium)
+    __slots__ = (
+        'next_message_id',
+        'next_flood_seq',
+        'routes',
+        'requested_at',
+        'request_retries',
+        'pending_messages',
+        'sent_messages',
+        'heard_from',
+        'heard_by',
+        'unacked',
+        'unsent_acks',
+        'ready_acks',
+        'seen_floods',
+        'consumed_message_ids')
+
+
+    def __init__(self, node_id: int, pos: Point, power: int, online: bool, medium: Medium, **node_options) -> None:
+        super().__init__(node_id, pos, power, online, medium, **node_options)
+
+        self.next_message_id = 0
+        self.next_flood_seq = 0
+
+        # Destination id -> (path starting at this node, step at which it expires)
+        self.routes: Dict[int, Tuple[Tuple[int, ...], int]] = {}
+        self.requested_at: Dict[int, int] = {}
+        self.request_retries: Dict[int, int] = {}
+        self.pending_messages: Dict[int, List[RoutingMessage]] = {}
+        self.sent_messages: Dict[int, RoutingMessage] = {}
+
+        # Node id -> step at which the link from it, or to it, was last seen working
+        self.heard_from: Dict[int, int] = {}
+        self.heard_by: Dict[int, int] = {}
+
+        # Acknowledgement key -> (emitted message, step at which its link is taken as broken)
+        self.unacked: Dict[Tuple[int, int, int, int], Tuple[RoutingMessage, int]] = {}
+
+        # Acknowledgements owed since the last processing, and the ones that processing handed to the next emission.
+        # Acks owed to messages heard while the step engines emit wait for the next step whatever the emission order.
+        self.unsent_acks: List[RoutingMessage] = []
+        self.ready_acks: List[RoutingMessage] = []
+
+        self.seen_floods = self.duplicate_filter()
+        self.consumed_message_ids = self.duplicate_filter()
+
+
+    def create_message(self) -> Message:
+        message = RoutingMessage(
+            message_id=self.next_message_id,
+            payload='test',
+            origin=self.id,
+            destination=self.medium.get_highest_node_id(),
+            message_type=DATA)
+
+        self.next_message_id += 1
+        self.sent_messages[message.id] = message
+
+        if len(self.sent_messages) > SENT_MESSAGES_LIMIT:
+            del self.sent_messages[next(iter(self.sent_messages))]
+
+        self.send_data(message)
+        return message
+
+
+    # Every message in range is overheard, but only broadcasts and messages addressed to this node
+    # are processed. Acknowledgements are done with once overheard.
+    def receive_message(self, message: Message) -> None:
+        if self.online:
+            self.overhear(message)
+
+            # Unicasts that will wait behind others before being processed are acknowledged right away
+            if message.next_hop == self.id and message.type in (DATA, ROUTE_REPLY) and (
+                    message.destination == self.id or len(self.input_queue) > 0):
+                self.acknowledge(message)
+
+        if message.type != ACK and (message.next_hop is None or message.next_hop == self.id):
+            super().receive_message(message)
+
+
+    # Receivers learn their links from the sender of every copy
+    def dispatch_message(self, message: Message) -> None:
+        if message.sender != self.id:
+            message = message.derive(sender=self.id)
+
+        super().dispatch_message(message)
 
 
-    def create_message(self) -> None:
-        pass # TODO
+    # Unicasts wait for their acknowledgement, unless the next hop was never heard and so could not
+    # be heard acknowledging them either
+    def emit_next_message(self) -> Message:
+        self.send_acks(self.ready_acks)
+        self.ready_acks = []
+        message = super().emit_next_message()
+
+        if message is not None and message.type in (DATA, ROUTE_REPLY) and message.next_hop in self.heard_from:
+            self.unacked[message.ack_key] = (message, self.medium.step + ACK_TIMEOUT)
+
+        return message
+
+
+    # The step engines visit waiting nodes every step, which is when their timeouts are handled
+    def process_next_message(self) -> None:
+        if len(self.unsent_acks) > 0:
+            self.ready_acks.extend(self.unsent_acks)
+            self.unsent_acks = []
+
+        if len(self.pending_messages) > 0 or len(self.unacked) > 0:
+            self.handle_timeouts()
+
+        super().process_next_message()
+
+
+    def get_wakeup_step(self) -> int:
+        if len(self.unsent_acks) > 0 or len(self.ready_acks) > 0:
+            return self.medium.step
+
+        wakeup_steps = [
+            self.requested_at.get(destination_id, self.medium.step) + self.get_request_timeout(destination_id)
+            for destination_id in self.pending_messages]
+
+        wakeup_steps.extend(timeout_step for _, timeout_step in self.unacked.values())
+        return min(wakeup_steps, default=None)
+
+
+    def wake_up(self) -> None:
+        self.send_acks(self.ready_acks + self.unsent_acks)
+        self.ready_acks = []
+        self.unsent_acks = []
+        self.handle_timeouts()
+
+
+    # Acknowledgements go out along with the emissions, but without going through the output queue
+    def send_acks(self, acks: List[RoutingMessage]) -> None:
+        if self.online:
+            for ack in acks:
+                self.medium.propagate_message(ack, self)
+
+
+    # Unacknowledged messages give their links up. Requests without a reply are flooded again, and
+    # after the last retry their messages are dropped. A reply to an earlier request arriving in the
+    # meantime still delivers them.
+    def handle_timeouts(self) -> None:
+        if not self.online:
+            return
+
+        for ack_key, (message, timeout_step) in list(self.unacked.items()):
+            if timeout_step <= self.medium.step:
+                del self.unacked[ack_key]
+                self.handle_broken_link(message)
+
+        for destination_id in list(self.pending_messages):
+            if self.medium.step - self.requested_at.get(destination_id, self.medium.step) < self.get_request_timeout(destination_id):
+                continue
+
+            # Routes also get learnt from messages passing by
+            if self.find_route(destination_id) is not None:
+                self.request_retries.pop(destination_id, None)
+
+                for message in self.pending_messages.pop(destination_id):
+                    self.send_data(message)
+            elif self.request_retries.get(destination_id, 0) >= ROUTE_REQUEST_RETRIES:
+                self.request_retries.pop(destination_id, None)
+                messages = self.pending_messages.pop(destination_id)
+                logging.debug('%s dropped %s messages for unreachable node %s', self, len(messages), destination_id)
+            else:
+                self.request_route(destination_id)
+                self.request_retries[destination_id] = self.request_retries.get(destination_id, 0) + 1
 
 
     def process_message(self, message: Message) -> None:
-        pass # TODO
+        if message.next_hop is None and not self.is_first_copy(message):
+            logging.debug('%s ignoring already seen %s', self, message)
+
+            if self.medium.metrics is not None:
+                self.medium.metrics.record_duplicates()
+
+                if self.seen_floods.last_lookup_false:
+                    self.medium.metrics.record_false_drops()
+        elif message.type == ROUTE_REQUEST:
+            self.process_route_request(message)
+        elif message.type == ROUTE_REPLY:
+            self.process_route_reply(message)
+        elif message.type == ROUTE_ERROR:
+            self.process_route_error(message)
+        elif message.type == DATA:
+            self.process_data(message)
+        else:
+            raise ValueError(f'Unknown routing message type "{message.type}"')
+
+        logging.debug('%s processed %s', self, message)
+
+
+    def process_route_request(self, request: RoutingMessage) -> None:
+        route = request.route + (self.id,)
+        two_way = request.two_way and self.can_reach(request.route[-1])
+
+        if two_way:
+            self.learn_route(route[::-1])
+
+        if request.destination != self.id:
+            self.dispatch_message(request.derive(route=route, two_way=two_way))
+        else:
+            self.dispatch_message(RoutingMessage(
+                message_id=CONTROL_MESSAGE_ID,
+                payload=None,
+                origin=self.id,
+                seq=request.seq,
+                route=route,
+                destination=request.origin,
+                next_hop=route[-2],
+                message_type=ROUTE_REPLY,
+                two_way=two_way))
+
+
+    def process_route_reply(self, reply: RoutingMessage) -> None:
+        if self.id in reply.route:
+            position = reply.route.index(self.id)
+            self.learn_route(reply.route[position:])
+
+            if reply.next_hop is not None and reply.two_way:
+                self.learn_route(reply.route[position::-1])
+
+        if reply.destination == self.id:
+            self.request_retries.pop(reply.route[-1], None)
+
+            for message in self.pending_messages.pop(reply.route[-1], []):
+                self.send_data(message)
+        elif reply.next_hop is None:
+            self.dispatch_message(reply)
+        else:
+            self.pass_on(reply, reply.derive(next_hop=reply.route[position - 1]))
+
+
+    # Errors carry the id of the data message that could not be forwarded
+    def process_route_error(self, error: RoutingMessage) -> None:
+        self.forget_link(error.route[0], error.unreachable)
+
+        if error.destination == self.id:
+            message = self.sent_messages.get(error.id)
+
+            if message is not None:
+                self.send_data(message)
+        else:
+            self.dispatch_message(error)
+
+
+    def process_data(self, message: RoutingMessage) -> None:
+        position = message.route.index(self.id)
+        self.learn_route(message.route[position:])
+
+        if message.destination != self.id:
+            self.pass_on(message, message.derive(next_hop=message.route[position + 1]))
+        elif message.id in self.consumed_message_ids:
+            logging.debug('%s ignoring already consumed %s', self, message)
+
+            if self.medium.metrics is not None:
+                self.medium.metrics.record_duplicates()
+
+                if self.consumed_message_ids.last_lookup_false:
+                    self.medium.metrics.record_false_drops()
+        else:
+            logging.info('%s reached final destination', message)
+            self.consumed_message_ids.add(message.id)
+
+            if self.medium.metrics is not None:
+                self.medium.metrics.record_delivery(message, self.id)
+
+            if self.medium.trace is not None:
+                self.medium.trace.record(DELIVERED, self.id, message.id)
+
+
+    def send_data(self, message: RoutingMessage) -> None:
+        route = self.find_route(message.destination)
+
+        if route is None:
+            self.pending_messages.setdefault(message.destination, []).append(message)
+            self.request_route(message.destination)
+        else:
+            self.dispatch_message(message.derive(route=route, next_hop=route[1]))
+
+
+    def request_route(self, destination_id: int) -> None:
+        requested_at = self.requested_at.get(destination_id)
+
+        # One request at a time per destination, a new one is only flooded once the last one timed out
+        if requested_at is not None and self.medium.step - requested_at < self.get_request_timeout(destination_id):
+            return
+
+        self.requested_at[destination_id] = self.medium.step
+        self.flood(ROUTE_REQUEST, CONTROL_MESSAGE_ID, route=(self.id,), destination=destination_id, two_way=True)
+
+
+    def get_request_timeout(self, destination_id: int) -> int:
+        return ROUTE_REQUEST_TIMEOUT << self.request_retries.get(destination_id, 0)
+
+
+    # Hearing a node proves its link to this one. Hearing it pass on a message this node sent it, or
+    # acknowledge it, proves the link back.
+    def overhear(self, message: RoutingMessage) -> None:
+        self.heard_from[message.sender] = self.medium.step
+
+        if message.type == ROUTE_REQUEST and len(message.route) > 1 and message.route[-2] == self.id:
+            self.heard_by[message.sender] = self.medium.step
+
+        unacked = self.unacked.get(message.ack_key)
+
+        if unacked is not None and unacked[0].next_hop == message.sender:
+            del self.unacked[message.ack_key]
+            self.heard_by[message.sender] = self.medium.step
+
+
+    # Passing a unicast on acknowledges it, unless it has to wait behind other emissions
+    def pass_on(self, received: RoutingMessage, message: RoutingMessage) -> None:
+        if len(self.output_queue) > 0:
+            self.acknowledge(received)
+
+        self.dispatch_message(message)
+
+
+    def acknowledge(self, message: RoutingMessage) -> None:
+        self.unsent_acks.append(RoutingMessage(
+            message_id=message.id,
+            payload=None,
+            origin=message.origin,
+            seq=message.seq,
+            destination=message.destination,
+            next_hop=message.sender,
+            message_type=ACK,
+            sender=self.id))
+
+        self.medium.mark_busy(self)
+
+
+    def handle_broken_link(self, message: RoutingMessage) -> None:
+        logging.debug('%s lost its link to node %s', self, message.next_hop)
+        self.heard_by.pop(message.next_hop, None)
+        self.forget_link(self.id, message.next_hop)
+
+        if message.type == ROUTE_REPLY:
+            self.flood(ROUTE_REPLY, CONTROL_MESSAGE_ID, route=message.route, destination=message.destination)
+        elif message.origin == self.id:
+            self.send_data(message)
+        else:
+            self.flood(ROUTE_ERROR, message.id, route=(self.id,), destination=message.origin, unreachable=message.next_hop)
+
+
+    def flood(self, message_type: str, message_id: int, **fields) -> None:
+        message = RoutingMessage(
+            message_id=message_id,
+            payload=None,
+            origin=self.id,
+            seq=self.next_flood_seq,
+            message_type=message_type,
+            **fields)
+
+        self.next_flood_seq += 1
+        self.is_first_copy(message)
+        self.dispatch_message(message)
+
+
+    def is_first_copy(self, message: RoutingMessage) -> bool:
+        flood_key = (message.origin, message.seq)
+
+        if flood_key in self.seen_floods:
+            return False
+
+        self.seen_floods.add(flood_key)
+        return True
+
+
+    def find_route(self, destination_id: int) -> Tuple[int, ...]:
+        cached_route = self.routes.get(destination_id)
+
+        if cached_route is None:
+            return None
+
+        route, expires_at = cached_route
+
+        if expires_at < self.medium.step:
+            del self.routes[destination_id]
+            return None
+
+        # Routes in use stay alive
+        self.routes[destination_id] = (route, self.medium.step + ROUTE_LIFETIME)
+        return route
+
+
+    # Every prefix of a path starting at this node is also a route, shorter or fresher ones win
+    def learn_route(self, path: Tuple[int, ...]) -> None:
+        expires_at = self.medium.step + ROUTE_LIFETIME
+
+        for length in range(2, len(path) + 1):
+            destination_id = path[length - 1]
+            cached_route = self.routes.get(destination_id)
+
+            if cached_route is None or length <= len(cached_route[0]) or cached_route[1] < self.medium.step:
+                self.routes[destination_id] = (path[:length], expires_at)
+
+
+    def forget_link(self, from_id: int, to_id: int) -> None:
+        for destination_id, (route, _) in list(self.routes.items()):
+            if any(hop == (from_id, to_id) for hop in zip(route, route[1:])):
+                del self.routes[destination_id]
+
+
+    # Links back to a node are trusted for as long as routes through them
+    def can_reach(self, node_id: int) -> bool:
+        heard_at = self.heard_by.get(node_id)
+        return heard_at is not None and self.medium.step - heard_at <= ROUTE_LIFETIME
+
+
+    def get_state(self) -> Dict:
+        state = super().get_state()
+        state['next_message_id'] = self.next_message_id
+        state['next_flood_seq'] = self.next_flood_seq
+        state['routes'] = dict(self.routes)
+        state['requested_at'] = dict(self.requested_at)
+        state['request_retries'] = dict(self.request_retries)
+        state['pending_messages'] = tuple(message for messages in self.pending_messages.values() for message in messages)
+        state['sent_messages'] = tuple(self.sent_messages.values())
+        state['heard_from'] = dict(self.heard_from)
+        state['heard_by'] = dict(self.heard_by)
+        state['unacked_messages'] = tuple(message for message, _ in self.unacked.values())
+        state['ack_timeouts'] = tuple(timeout_step for _, timeout_step in self.unacked.values())
+        state['unsent_acks'] = tuple(self.unsent_acks)
+        state['ready_acks'] = tuple(self.ready_acks)
+        state['seen_floods'] = self.seen_floods.get_state()
+        state['consumed_message_ids'] = self.consumed_message_ids.get_state()
+        return state
+
+
+    def set_state(self, state: Dict) -> None:
+        super().set_state(state)
+        self.next_message_id = state['next_message_id']
+        self.next_flood_seq = state['next_flood_seq']
+        self.routes = dict(state['routes'])
+        self.requested_at = dict(state['requested_at'])
+        self.request_retries = dict(state.get('request_retries', {}))
+        self.pending_messages = {}
+
+        for message in state['pending_messages']:
+            self.pending_messages.setdefault(message.destination, []).append(message)
+
+        self.sent_messages = {message.id: message for message in state['sent_messages']}
+        self.heard_from = dict(state.get('heard_from', {}))
+        self.heard_by = dict(state.get('heard_by', {}))
+
+        self.unacked = {
+            message.ack_key: (message, timeout_step)
+            for message, timeout_step in zip(state.get('unacked_messages', ()), state.get('ack_timeouts', ()))}
+
+        self.unsent_acks = list(state.get('unsent_acks', ()))
+        self.ready_acks = list(state.get('ready_acks', ()))
+
+        self.seen_floods = filter_from_state(state['seen_floods'])
+        self.consumed_message_ids = filter_from_state(state['consumed_message_ids'])
+
+        # Waiting for a route or an acknowledgement keeps the node busy even with empty queues
+        self.medium.mark_busy(self)
+
+
+    @property
+    def false_drops(self) -> int:
+        return self.seen_floods.false_positives + self.consumed_message_ids.false_positives
 
 
 from medium import Medium
-from message import Message, FloodingMessage, RoutingMessage
+from message import Message, FloodingMessage, RoutingMessage, ROUTE_REQUEST, ROUTE_REPLY, ROUTE_ERROR, DATA, ACK, CONTROL_MESSAGE_ID
 from point import Point
+from tracing import RECEIVED, DROPPED, EVICTED, PROCESSED, EMITTED, DELIVERED
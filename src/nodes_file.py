@@ -0,0 +1,351 @@
+from __future__ import annotations
+import argparse
+import hashlib
+import io
+import os
+import re
+import struct
+from typing import Dict, List, Tuple
+
+import yaml
+
+from message_queue import DROP_TAIL, DROP_POLICIES
+
+
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+YAML_DUMPER = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+# Nodes files with this extension hold a NumPy structured array, stored row by row with one fixed-size
+# record per node, which loads in bulk or memory-mapped. Any other extension is read as YAML.
+RECORDS_EXTENSION = '.npy'
+
+NODE_TYPES = ('flooding', 'routing')
+
+# Unbounded queues are stored with a zero capacity
+UNBOUNDED_QUEUE = 0
+
+# From <sys/inotify.h>. The directory is watched because editors usually save by replacing the file.
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_NONBLOCK = 0o4000
+
+WATCHED_EVENTS = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+INOTIFY_EVENT = struct.Struct('iIII')
+
+# Lines other than list items and their indented fields, e.g. comments or document markers
+UNSPLITTABLE_LINE = re.compile(r'^(?!- |\s|$)', re.MULTILINE)
+ITEM_START = re.compile(r'^(?=- )', re.MULTILINE)
+
+
+# Tells whether the contents of a file changed since the last call. Inotify says when to look and
+# polling the file status is the fallback; either way the contents are hashed before reporting a change.
+class FileWatcher:
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.status: Tuple = None
+        self.contents_hash: str = None
+        self.inotify_fd: int = None
+        self.pending = True
+
+
+    def poll(self) -> bytes:
+        # Opened on the first poll, so simulations that never watch the file do not hold a descriptor
+        if self.pending and self.inotify_fd is None:
+            self.inotify_fd = open_inotify(self.path)
+
+        if self.inotify_fd is not None:
+            self.pending = self.read_events() or self.pending
+
+            if not self.pending:
+                return None
+
+        self.pending = False
+        status = file_status(self.path)
+
+        if status is None or status == self.status:
+            return None
+
+        with open(self.path, 'rb') as watched_file:
+            contents = watched_file.read()
+
+        self.status = status
+        contents_hash = hashlib.sha1(contents).hexdigest()
+
+        if contents_hash == self.contents_hash:
+            return None
+
+        self.contents_hash = contents_hash
+        return contents
+
+
+    # Contents read or written by the owner do not count as changes
+    def mark_read(self, contents: bytes) -> None:
+        self.status = file_status(self.path)
+        self.contents_hash = hashlib.sha1(contents).hexdigest()
+
+
+    def read_events(self) -> bool:
+        file_name = os.fsencode(os.path.basename(self.path))
+        touched = False
+
+        while True:
+            try:
+                data = os.read(self.inotify_fd, 4096)
+            except BlockingIOError:
+                return touched
+
+            offset = 0
+
+            while offset < len(data):
+                _, _, _, name_size = INOTIFY_EVENT.unpack_from(data, offset)
+                name = data[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + name_size].rstrip(b'\0')
+                touched = touched or name == file_name
+                offset += INOTIFY_EVENT.size + name_size
+
+
+    def close(self) -> None:
+        if self.inotify_fd is not None:
+            os.close(self.inotify_fd)
+            self.inotify_fd = None
+
+
+    def __del__(self) -> None:
+        self.close()
+
+
+def open_inotify(path: str) -> int:
+    # Looking for the C library loads subprocess and friends, which only the viewer needs
+    import ctypes
+    import ctypes.util
+
+    library = ctypes.util.find_library('c')
+
+    if library is None:
+        return None
+
+    libc = ctypes.CDLL(library, use_errno=True)
+
+    if not hasattr(libc, 'inotify_init1'):
+        return None
+
+    inotify_fd = libc.inotify_init1(IN_NONBLOCK)
+
+    if inotify_fd < 0:
+        return None
+
+    directory = os.path.dirname(os.path.abspath(path))
+
+    if libc.inotify_add_watch(inotify_fd, os.fsencode(directory), WATCHED_EVENTS) < 0:
+        os.close(inotify_fd)
+        return None
+
+    return inotify_fd
+
+
+def file_status(path: str) -> Tuple:
+    try:
+        status = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    return (status.st_ino, status.st_size, status.st_mtime_ns)
+
+
+# Keeps the parsed nodes by the text of their list item, so reading an edited file only parses the
+# items that changed. Files that are not a plain list of block items are parsed as a whole.
+class NodesFileReader:
+
+    def __init__(self) -> None:
+        self.parsed_items: Dict[str, Dict] = {}
+
+
+    def read(self, contents: bytes) -> List[Dict]:
+        text = contents.decode('utf-8')
+        items = split_items(text)
+
+        if items is None:
+            self.parsed_items = {}
+            return yaml.load(text, Loader=YAML_LOADER)
+
+        parsed_items: Dict[str, Dict] = {}
+        nodes_definition = []
+
+        for item in items:
+            node = parsed_items.get(item) or self.parsed_items.get(item)
+
+            if node is None:
+                parsed = yaml.load(item, Loader=YAML_LOADER)
+
+                if not isinstance(parsed, list) or len(parsed) != 1:
+                    self.parsed_items = {}
+                    return yaml.load(text, Loader=YAML_LOADER)
+
+                node = parsed[0]
+
+            parsed_items[item] = node
+            nodes_definition.append(node)
+
+        self.parsed_items = parsed_items
+        return nodes_definition
+
+
+def split_items(text: str) -> List[str]:
+    if UNSPLITTABLE_LINE.search(text) is not None:
+        return None
+
+    items = ITEM_START.split(text)
+
+    if items[0].strip() != '':
+        return None
+
+    return items[1:]
+
+
+def is_records_file(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() == RECORDS_EXTENSION
+
+
+def node_dtype() -> np.dtype:
+    import numpy as np
+
+    return np.dtype([
+        ('id', '<i8'),
+        ('x', '<i4'),
+        ('y', '<i4'),
+        ('power', '<i4'),
+        ('online', 'u1'),
+        ('type', 'u1'),
+        ('queue_capacity', '<i4'),
+        ('drop_policy', 'u1'),
+    ])
+
+
+def read_columns(path: str) -> np.ndarray:
+    import numpy as np
+
+    return check_columns(np.load(path, mmap_mode='r'), path)
+
+
+# The records are a view over the contents, which are only copied when a node is created from them
+def columns_from_bytes(contents: bytes, path: str) -> np.ndarray:
+    import numpy as np
+
+    contents_file = io.BytesIO(contents)
+    version = np.lib.format.read_magic(contents_file)
+    read_array_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+    shape, fortran_order, dtype = read_array_header(contents_file)
+
+    if len(shape) != 1 or fortran_order:
+        raise ValueError(f'"{path}" is not a nodes file')
+
+    return check_columns(np.frombuffer(contents, dtype=dtype, count=shape[0], offset=contents_file.tell()), path)
+
+
+def check_columns(columns: np.ndarray, path: str) -> np.ndarray:
+    if columns.dtype != node_dtype():
+        raise ValueError(f'"{path}" is not a nodes file')
+
+    return columns
+
+
+def columns_to_bytes(columns: np.ndarray) -> bytes:
+    import numpy as np
+
+    contents_file = io.BytesIO()
+    np.save(contents_file, columns, allow_pickle=False)
+    return contents_file.getvalue()
+
+
+def definition_to_columns(nodes_definition: List[Dict]) -> np.ndarray:
+    import numpy as np
+
+    columns = np.zeros(len(nodes_definition), dtype=node_dtype())
+
+    for i, node in enumerate(nodes_definition):
+        if node['type'] not in NODE_TYPES:
+            raise ValueError(f'Unknown node type "{node["type"]}"')
+
+        if node['status'] not in ('online', 'offline'):
+            raise ValueError(f'Unknown node status "{node["status"]}"')
+
+        drop_policy = node.get('drop_policy', DROP_TAIL)
+
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f'Unknown drop policy "{drop_policy}"')
+
+        columns[i] = (
+            int(node['id']),
+            int(node['pos']['x']),
+            int(node['pos']['y']),
+            int(node['power']),
+            node['status'] == 'online',
+            NODE_TYPES.index(node['type']),
+            int(node.get('queue_capacity', UNBOUNDED_QUEUE)),
+            DROP_POLICIES.index(drop_policy))
+
+    return columns
+
+
+def columns_to_definition(columns: np.ndarray) -> List[Dict]:
+    nodes_definition = []
+
+    for node_id, x, y, power, online, node_type, queue_capacity, drop_policy in columns.tolist():
+        node = {
+            'id': node_id,
+            'pos': {
+                'x': x,
+                'y': y,
+            },
+            'power': power,
+            'status': 'online' if online else 'offline',
+            'type': NODE_TYPES[node_type],
+        }
+
+        if queue_capacity != UNBOUNDED_QUEUE:
+            node['queue_capacity'] = queue_capacity
+            node['drop_policy'] = DROP_POLICIES[drop_policy]
+
+        nodes_definition.append(node)
+
+    return nodes_definition
+
+
+def read_nodes_definition(path: str) -> List[Dict]:
+    if is_records_file(path):
+        return columns_to_definition(read_columns(path))
+
+    with open(path, 'rb') as nodes_file:
+        return NodesFileReader().read(nodes_file.read())
+
+
+def dump_yaml(nodes_definition: List[Dict]) -> bytes:
+    return yaml.dump(nodes_definition, Dumper=YAML_DUMPER).encode('utf-8')
+
+
+def write_nodes_definition(path: str, nodes_definition: List[Dict]) -> None:
+    if is_records_file(path):
+        contents = columns_to_bytes(definition_to_columns(nodes_definition))
+    else:
+        contents = dump_yaml(nodes_definition)
+
+    with open(path, 'wb') as nodes_file:
+        nodes_file.write(contents)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=f'Convert a nodes file between YAML and the binary format with one record per node (*{RECORDS_EXTENSION})')
+    parser.add_argument('input_file', help='nodes file to read')
+    parser.add_argument('output_file', help='nodes file to write, in the format given by its extension')
+    args = parser.parse_args()
+
+    nodes_definition = read_nodes_definition(args.input_file)
+    write_nodes_definition(args.output_file, nodes_definition)
+    print(f'{len(nodes_definition)} nodes written to "{args.output_file}"')
+
+
+if __name__ == '__main__':
+    main()
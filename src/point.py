@@ -3,8 +3,12 @@ from typing import Tuple
 import math
 
 
+# Nodes hold one each and the viewer creates them per frame, so they carry no instance dict
 class Point:
 
+    __slots__ = ('x', 'y')
+
+
     @classmethod
     def from_mouse_pos(cls, mouse_pos: Tuple[int, int]) -> Point:
         return Point(mouse_pos[0], mouse_pos[1])
@@ -31,6 +35,10 @@ class Point:
         return math.sqrt((self.x - other.x) ** 2 + (self.y - other.y) ** 2)
 
 
+    def squared_distance_to(self, other: Point) -> float:
+        return (self.x - other.x) ** 2 + (self.y - other.y) ** 2
+
+
     @property
     def modulus(self)-> float:
         return math.hypot(self.x, self.y)
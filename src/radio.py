@@ -0,0 +1,142 @@
+from __future__ import annotations
+from itertools import compress
+from typing import Dict, List, Tuple
+
+
+# Linear ratio a reception needs over noise plus interference, about 6 dB
+SINR_THRESHOLD = 4.0
+
+# Received power falls with the distance to this exponent
+PATH_LOSS_EXPONENT = 3.0
+
+# Closer receivers get the signal of this fraction of the range, so nothing divides by zero
+NEAR_FIELD = 0.05
+
+COLLISIONS = 'collisions'
+SINR = 'sinr'
+
+
+# Emissions of a step are collected and resolved together once every node has emitted, over the pairs
+# of emitters and receivers in range. With collisions, a receiver only gets a message when nobody else
+# in range emitted in the same step. With SINR, signals are normalized so that a link at the edge of
+# the range with no interference is exactly at the threshold, and the other emissions a receiver hears
+# add up as interference. Either way a lone emission is received as by the ideal medium.
+class RadioModel:
+
+    def __init__(
+            self,
+            medium: Medium,
+            model: str = COLLISIONS,
+            sinr_threshold: float = SINR_THRESHOLD,
+            path_loss_exponent: float = PATH_LOSS_EXPONENT) -> None:
+
+        if model not in (COLLISIONS, SINR):
+            raise ValueError(f'Unknown radio model "{model}"')
+
+        if sinr_threshold <= 0 or path_loss_exponent <= 0:
+            raise ValueError('The SINR threshold and the path loss exponent must be positive')
+
+        self.medium = medium
+        self.model = model
+        self.sinr_threshold = sinr_threshold
+        self.path_loss_exponent = path_loss_exponent
+
+        self.emissions: List[Tuple[Message, Node]] = []
+
+        # Emitter -> (the receivers the arrays were computed for, their node orders, the signal of each link)
+        self.links: Dict[Node, Tuple[List[Node], np.ndarray, np.ndarray]] = {}
+
+        self.receptions = 0
+        self.collisions = 0
+
+        self.medium.radio = self
+
+
+    def collect(self, message: Message, emitter: Node) -> None:
+        self.emissions.append((message, emitter))
+
+
+    def get_links(self, emitter: Node) -> Tuple[List[Node], np.ndarray, np.ndarray]:
+        receivers = self.medium.get_receivers_of(emitter)
+        links = self.links.get(emitter)
+
+        # The medium replaces the list of receivers whenever the links of the emitter change
+        if links is None or links[0] is not receivers:
+            import numpy as np
+
+            orders = np.array([self.medium.node_orders[receiver] for receiver in receivers], dtype=np.int64)
+            signals = np.ones(len(receivers), dtype=np.float64)
+
+            if emitter.power > 0 and len(receivers) > 0:
+                positions = np.array([(receiver.pos.x, receiver.pos.y) for receiver in receivers], dtype=np.float64)
+                distances = np.hypot(positions[:, 0] - emitter.pos.x, positions[:, 1] - emitter.pos.y) / emitter.power
+                signals = np.maximum(distances, NEAR_FIELD) ** -self.path_loss_exponent
+
+            links = (receivers, orders, signals)
+            self.links[emitter] = links
+
+        return links
+
+
+    def resolve(self) -> None:
+        if len(self.emissions) <= 0:
+            return
+
+        import numpy as np
+
+        emissions = self.emissions
+        self.emissions = []
+
+        links = [self.get_links(emitter) for _, emitter in emissions]
+        orders = np.concatenate([link[1] for link in links])
+
+        # Node orders are dense enough to count over directly, which avoids sorting the pairs
+        if self.model == COLLISIONS:
+            heard = np.bincount(orders, minlength=self.medium.next_node_order)
+            received = heard[orders] == 1
+        else:
+            signals = np.concatenate([link[2] for link in links])
+            heard = np.bincount(orders, weights=signals, minlength=self.medium.next_node_order)
+            interference = heard[orders] - signals
+
+            # Signal / (noise + interference) >= threshold with a noise of 1 / threshold, without the divisions
+            received = signals >= 1 + self.sinr_threshold * interference
+
+        received = received.tolist()
+        collisions = len(received) - sum(received)
+        self.receptions += len(received) - collisions
+        self.collisions += collisions
+
+        if self.medium.metrics is not None:
+            self.medium.metrics.record_collisions(collisions)
+
+        trace = self.medium.trace
+        offset = 0
+
+        for (message, _), (receivers, _, _) in zip(emissions, links):
+            receiver_count = len(receivers)
+            link_received = received[offset:offset + receiver_count]
+            offset += receiver_count
+
+            for receiver in compress(receivers, link_received):
+                receiver.receive_message(message)
+
+            if trace is not None:
+                for receiver, was_received in zip(receivers, link_received):
+                    if not was_received:
+                        trace.record(COLLIDED, receiver.id, message.id)
+
+
+    def forget(self, emitter: Node) -> None:
+        self.links.pop(emitter, None)
+
+
+    def clear(self) -> None:
+        self.emissions = []
+        self.links = {}
+
+
+from medium import Medium
+from message import Message
+from node import Node
+from tracing import COLLIDED
@@ -0,0 +1,186 @@
+from __future__ import annotations
+import argparse
+import os
+from typing import Dict
+
+import numpy as np
+
+from medium import Medium
+from message import Message
+from message_queue import MessageQueue
+from node import Node
+from point import Point
+from tracing import (
+    HEADER, RECORD, TRACE_FILE, TRACE_MAGIC, TRACE_VERSION, EVENT_NAMES, record_dtype,
+    STEP, SNAPSHOT, NODE_X, NODE_Y, NODE_POWER, NODE_STATUS, QUEUED, INJECTED, RECEIVED, DROPPED, EVICTED, PROCESSED, EMITTED, DELIVERED, COLLIDED,
+    MOVED_X, MOVED_Y, POWER_CHANGED, STATUS_CHANGED)
+
+
+TIMELINE_EVENTS = (INJECTED, RECEIVED, DROPPED, EVICTED, PROCESSED, EMITTED, DELIVERED, COLLIDED)
+
+
+def read_trace(path: str) -> np.ndarray:
+    with open(path, 'rb') as trace_file:
+        magic, version, record_size = HEADER.unpack(trace_file.read(HEADER.size))
+
+    if magic != TRACE_MAGIC:
+        raise ValueError(f'"{path}" is not a trace file')
+
+    if version > TRACE_VERSION or record_size != RECORD.size:
+        raise ValueError(f'"{path}" has an unsupported trace version {version}')
+
+    # A recorder killed mid-write may leave a partial record at the end, which is ignored
+    record_count = (os.path.getsize(path) - HEADER.size) // RECORD.size
+
+    if record_count <= 0:
+        return np.zeros(0, dtype=record_dtype())
+
+    return np.memmap(path, dtype=record_dtype(), mode='r', offset=HEADER.size, shape=(record_count,))
+
+
+# Rebuilds the network and its input queues from the records alone, without running any step.
+# Frame i shows the network right before the i-th recorded step ran and the last frame shows the final state.
+class Timeline:
+
+    def __init__(self, records: np.ndarray) -> None:
+        self.records = records
+        self.events = records['event']
+
+        self.step_indices = np.flatnonzero(self.events == STEP)
+        self.snapshot_indices = np.flatnonzero(self.events == SNAPSHOT)
+        self.frame_ends = np.append(self.step_indices, len(records))
+
+        self.reset()
+        self.seek(0)
+
+
+    @property
+    def frame_count(self) -> int:
+        return len(self.frame_ends)
+
+
+    @property
+    def step(self) -> int:
+        if self.frame < len(self.step_indices):
+            return int(self.records['step'][self.step_indices[self.frame]])
+
+        return int(self.records['step'][self.step_indices[-1]]) + 1 if len(self.step_indices) > 0 else 0
+
+
+    def reset(self) -> None:
+        self.medium = Medium()
+        self.nodes_by_id: Dict[int, Node] = {}
+        self.messages: Dict[int, Message] = {}
+        self.new_node: Dict[str, int] = {}
+        self.moved_x = 0
+        self.position = 0
+        self.frame = 0
+
+
+    def seek(self, frame: int) -> None:
+        frame = max(0, min(frame, self.frame_count - 1))
+        end = int(self.frame_ends[frame])
+
+        # Going back starts over from the latest snapshot before the target instead of from the beginning
+        if end < self.position:
+            snapshot = np.searchsorted(self.snapshot_indices, end) - 1
+            self.reset()
+            self.position = int(self.snapshot_indices[snapshot]) if snapshot >= 0 else 0
+
+        self.apply(self.position, end)
+        self.position = end
+        self.frame = frame
+
+
+    def apply(self, start: int, end: int) -> None:
+        records = self.records[start:end]
+
+        for event, node_id, value in zip(records['event'].tolist(), records['node_id'].tolist(), records['value'].tolist()):
+            if event == SNAPSHOT:
+                self.medium = Medium()
+                self.nodes_by_id = {}
+            elif event == NODE_X:
+                self.new_node = {'x': value}
+            elif event == NODE_Y:
+                self.new_node['y'] = value
+            elif event == NODE_POWER:
+                self.new_node['power'] = value
+            elif event == NODE_STATUS:
+                # The status is the last field of each node in a snapshot
+                node = Node(node_id, Point(self.new_node['x'], self.new_node['y']), self.new_node['power'], value == 1, self.medium)
+                self.medium.add_node(node)
+                self.nodes_by_id[node_id] = node
+            elif event == MOVED_X:
+                self.moved_x = value
+            elif event == MOVED_Y:
+                # Through the node setters, so viewers repaint only the nodes that changed
+                self.nodes_by_id[node_id].pos = Point(self.moved_x, value)
+            elif event == POWER_CHANGED:
+                self.nodes_by_id[node_id].power = value
+            elif event == STATUS_CHANGED:
+                self.nodes_by_id[node_id].online = value == 1
+            elif event == QUEUED or event == RECEIVED:
+                self.nodes_by_id[node_id].input_queue.append(self.message(value))
+            elif event == PROCESSED:
+                self.nodes_by_id[node_id].input_queue.popleft()
+            elif event == EVICTED:
+                remove_first(self.nodes_by_id[node_id].input_queue, value)
+
+
+    def message(self, message_id: int) -> Message:
+        message = self.messages.get(message_id)
+
+        if message is None:
+            message = Message(message_id, None)
+            self.messages[message_id] = message
+
+        return message
+
+
+    def count(self, event: int) -> int:
+        return int(np.count_nonzero(self.events[:self.position] == event))
+
+
+def remove_first(queue: MessageQueue, message_id: int) -> None:
+    for i, message in enumerate(queue.messages):
+        if message.id == message_id:
+            del queue.messages[i]
+            return
+
+
+def print_timeline(records: np.ndarray) -> None:
+    if len(records) <= 0:
+        return
+
+    steps = records['step'].astype(np.int64)
+    step_count = int(steps.max()) + 1
+    counts = np.bincount(steps * len(EVENT_NAMES) + records['event'], minlength=step_count * len(EVENT_NAMES))
+    counts = counts.reshape(step_count, len(EVENT_NAMES))[:, TIMELINE_EVENTS]
+
+    print(f'{"step":>8}' + ''.join(f'{EVENT_NAMES[event]:>11}' for event in TIMELINE_EVENTS))
+
+    for step in np.flatnonzero(counts.any(axis=1)).tolist():
+        print(f'{step:>8}' + ''.join(f'{count:>11}' for count in counts[step].tolist()))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Replay a recorded trace without running the simulation')
+    parser.add_argument('trace_file', nargs='?', default=TRACE_FILE, help=f'trace to replay (default: {TRACE_FILE})')
+    parser.add_argument('--print', dest='print_only', action='store_true', help='print the events per step instead of opening the viewer')
+    args = parser.parse_args()
+
+    records = read_trace(args.trace_file)
+
+    if args.print_only:
+        print_timeline(records)
+        return
+
+    from controller import ReplayEngine
+
+    engine = ReplayEngine(Timeline(records))
+    engine.loop()
+
+
+if __name__ == '__main__':
+    main()
+
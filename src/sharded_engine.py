@@ -0,0 +1,560 @@
+from __future__ import annotations
+import math
+import multiprocessing
+import pickle
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Connection
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Tuple
+
+from medium import Medium
+
+
+INITIAL_OUTBOX_SIZE = 1 << 20
+
+# Share of the nodes that may move out of their strips before the plane is cut again. They keep
+# working from their own worker, only with more emissions crossing between workers.
+REBALANCE_SHARE = 0.25
+
+# Emitter order, emitted message and the indices of its receivers within the receiving shard
+Emission = Tuple[int, 'Message', Tuple[int, ...]]
+
+
+# The plane is cut into vertical strips holding the same number of nodes, and every strip is
+# stepped by its own worker process. Node objects stay as the source of truth: their state is
+# loaded into the workers and written back by `store`, which also happens before restarting the
+# workers when nodes are added or removed. Nodes moved, toggled or repowered are sent to the
+# workers that own them instead, along with the links of every emitter around them.
+#
+# Within a step nodes only touch their own queues while processing and emitting, and receiving
+# only appends to the receiver's input queue. So each worker processes and emits its nodes, then
+# the emissions are exchanged in bulk through the workers' shared memory outboxes, and every worker
+# applies the receptions of its nodes in the global order of the emitters, as `run_step` does.
+class ShardedEngine:
+
+    def __init__(self, medium: Medium, shard_count: int) -> None:
+        if shard_count < 1:
+            raise ValueError(f'Shard count must be positive, got {shard_count}')
+
+        self.medium = medium
+        self.shard_count = shard_count
+        self.workers: List[Tuple[multiprocessing.Process, Connection]] = []
+
+        # Filled by the medium: nodes changed since the workers last saw them, and other emitters that gained or lost receivers
+        self.changed_nodes: Dict[Node, None] = {}
+        self.relinked_nodes: Dict[Node, None] = {}
+        self.medium.sharded_engine = self
+        self.load()
+
+
+    # Workers are started on first use, so restoring a snapshot right after creating the engine starts them once
+    def load(self) -> None:
+        self.close()
+        self.topology_version = None
+
+
+    def start(self) -> None:
+        self.nodes: List[Node] = list(self.medium.nodes)
+        self.shards = partition(self.nodes, self.shard_count)
+        self.location_of: Dict[Node, Tuple[int, int]] = {}
+
+        for shard, shard_nodes in enumerate(self.shards):
+            for index, node in enumerate(shard_nodes):
+                self.location_of[node] = (shard, index)
+
+        self.strips = get_strips(self.shards)
+        self.stray_nodes: Dict[Node, None] = {}
+
+        order_of = {node: order for order, node in enumerate(self.nodes)}
+        context = multiprocessing.get_context()
+
+        # Workers share this process' tracker, otherwise each would start its own and report the others' outboxes as leaked
+        resource_tracker.ensure_running()
+
+        for shard, shard_nodes in enumerate(self.shards):
+            connection, worker_connection = context.Pipe()
+            worker = context.Process(target=run_worker, args=(worker_connection,), daemon=True)
+            worker.start()
+            worker_connection.close()
+
+            connection.send((
+                shard,
+                self.medium.get_highest_node_id(),
+                self.medium.metrics is not None,
+                [(order_of[node], type(node), node.id, node.pos, node.power, node.online, node.queue_capacity, node.drop_policy, node.duplicate_filter, node.get_state()) for node in shard_nodes],
+                [[self.location_of[receiver] + (receiver.id, receiver.online) for receiver in self.medium.get_reachable_nodes_of(node)] for node in shard_nodes]))
+
+            self.workers.append((worker, connection))
+
+        self.busy_counts = [sum(1 for node in shard_nodes if node in self.medium.busy_nodes) for shard_nodes in self.shards]
+        self.queue_depths = [(0, 0, 0)] * self.shard_count
+        self.changed_nodes = {}
+        self.relinked_nodes = {}
+        self.topology_version = self.medium.topology_version
+
+
+    def store(self) -> None:
+        if len(self.workers) <= 0:
+            return
+
+        for shard_nodes, shard_states in zip(self.shards, self.request_all(('store',))):
+            for node, state in zip(shard_nodes, shard_states):
+                node.set_state(state)
+
+        self.medium.release_idle_nodes(self.nodes)
+
+
+    def synchronize(self) -> None:
+        if self.topology_version == self.medium.topology_version:
+            return
+
+        if self.keeps_partition():
+            self.send_changes()
+        else:
+            self.store()
+            self.close()
+            self.start()
+
+
+    # Only nodes added or removed, or too many of them out of their strips, call for a new partition
+    def keeps_partition(self) -> bool:
+        if len(self.workers) <= 0 or len(self.medium.node_orders) != len(self.nodes):
+            return False
+
+        for node in self.changed_nodes:
+            if node not in self.location_of or node not in self.medium.node_orders:
+                return False
+
+            low_x, high_x = self.strips[self.location_of[node][0]]
+
+            if low_x <= node.pos.x <= high_x:
+                self.stray_nodes.pop(node, None)
+            else:
+                self.stray_nodes[node] = None
+
+        return len(self.stray_nodes) <= len(self.nodes) * REBALANCE_SHARE
+
+
+    # Every worker learns the status of the changed nodes, as it may hold them as receivers of its own emitters
+    def send_changes(self) -> None:
+        node_rows: List[List[Tuple[int, Point, int, bool]]] = [[] for _ in self.workers]
+        statuses: List[Tuple[int, int, bool]] = []
+
+        for node in self.changed_nodes:
+            shard, index = self.location_of[node]
+            node_rows[shard].append((index, node.pos, node.power, node.online))
+            statuses.append((shard, index, node.online))
+
+        link_rows: List[List[Tuple[int, List[Tuple[int, int, int, bool]]]]] = [[] for _ in self.workers]
+
+        for emitter in {**self.changed_nodes, **self.relinked_nodes}:
+            shard, index = self.location_of[emitter]
+            link_rows[shard].append((index, [self.location_of[receiver] + (receiver.id, receiver.online) for receiver in self.medium.get_reachable_nodes_of(emitter)]))
+
+        for shard, (_, connection) in enumerate(self.workers):
+            connection.send(('update', node_rows[shard], statuses, link_rows[shard]))
+
+        for shard, (_, connection) in enumerate(self.workers):
+            self.busy_counts[shard] = connection.recv()
+
+        self.changed_nodes = {}
+        self.relinked_nodes = {}
+        self.topology_version = self.medium.topology_version
+
+
+    def inject_message(self, node: Node) -> Message:
+        self.synchronize()
+        shard, index = self.location_of[node]
+        message, self.busy_counts[shard] = self.request(shard, ('inject', index, self.medium.step))
+        return message
+
+
+    def has_consumed(self, node: Node, message_id: int) -> bool:
+        self.synchronize()
+        shard, index = self.location_of[node]
+        return self.request(shard, ('consumed', index, message_id))
+
+
+    def run_step(self) -> None:
+        self.synchronize()
+
+        # Where every worker wrote the emissions for each other shard: (outbox name, {shard: (offset, size)})
+        outboxes = self.request_all(('emit', self.medium.step))
+
+        for shard, (_, connection) in enumerate(self.workers):
+            connection.send(('receive', [(source, name, *sections[shard]) for source, (name, sections) in enumerate(outboxes) if shard in sections]))
+
+        transmissions = 0
+        duplicates = 0
+        false_drops = 0
+        deliveries = []
+
+        for shard, (_, connection) in enumerate(self.workers):
+            self.busy_counts[shard], self.queue_depths[shard], metrics_totals = connection.recv()
+
+            if metrics_totals is not None:
+                transmissions += metrics_totals[0]
+                duplicates += metrics_totals[1]
+                false_drops += metrics_totals[2]
+                deliveries.extend(metrics_totals[3])
+
+        metrics = self.medium.metrics
+
+        if metrics is not None:
+            metrics.record_transmissions(transmissions)
+            metrics.record_duplicates(duplicates)
+            metrics.record_false_drops(false_drops)
+
+            # Recorded in the order the nodes were processed
+            for _, message, node_id in sorted(deliveries, key=lambda delivery: delivery[0]):
+                metrics.record_delivery(message, node_id)
+
+
+    def is_quiescent(self) -> bool:
+        if len(self.workers) <= 0:
+            return len(self.medium.busy_nodes) <= 0
+
+        self.synchronize()
+        return sum(self.busy_counts) <= 0
+
+
+    def get_queue_depths(self) -> Tuple[int, int, int]:
+        return (
+            sum(depths[0] for depths in self.queue_depths),
+            sum(depths[1] for depths in self.queue_depths),
+            max(depths[2] for depths in self.queue_depths))
+
+
+    def request(self, shard: int, command: Tuple):
+        connection = self.workers[shard][1]
+        connection.send(command)
+        return connection.recv()
+
+
+    def request_all(self, command: Tuple) -> List:
+        for _, connection in self.workers:
+            connection.send(command)
+
+        return [connection.recv() for _, connection in self.workers]
+
+
+    def close(self) -> None:
+        for worker, connection in self.workers:
+            try:
+                connection.send(('close',))
+                connection.recv()
+            except (BrokenPipeError, EOFError):
+                pass
+
+            connection.close()
+            worker.join()
+
+        self.workers = []
+
+
+    def __del__(self) -> None:
+        self.close()
+
+
+def partition(nodes: List[Node], shard_count: int) -> List[List[Node]]:
+    nodes_by_x = sorted(nodes, key=lambda node: (node.pos.x, node.pos.y))
+    shards = [nodes_by_x[len(nodes) * shard // shard_count:len(nodes) * (shard + 1) // shard_count] for shard in range(shard_count)]
+
+    # Every worker keeps its nodes in the global order, which decides the order they are stepped in
+    order_of = {node: order for order, node in enumerate(nodes)}
+    return [sorted(shard_nodes, key=order_of.__getitem__) for shard_nodes in shards]
+
+
+# The range of x each shard owns: its strip and half of the gaps to the strips next to it
+def get_strips(shards: List[List[Node]]) -> List[Tuple[float, float]]:
+    x_ranges = [(min(node.pos.x for node in shard_nodes), max(node.pos.x for node in shard_nodes)) if len(shard_nodes) > 0 else None for shard_nodes in shards]
+    occupied = [shard for shard, x_range in enumerate(x_ranges) if x_range is not None]
+    strips = [(-math.inf, math.inf)] * len(shards)
+
+    for i, shard in enumerate(occupied):
+        low_x = (x_ranges[occupied[i - 1]][1] + x_ranges[shard][0]) / 2 if i > 0 else -math.inf
+        high_x = (x_ranges[shard][1] + x_ranges[occupied[i + 1]][0]) / 2 if i + 1 < len(occupied) else math.inf
+        strips[shard] = (low_x, high_x)
+
+    return strips
+
+
+# Stands for a node stepped by another worker, which only receives what this worker sends it
+class RemoteNode:
+
+    __slots__ = ('id', 'online', 'shard', 'index')
+
+
+    def __init__(self, node_id: int, online: bool, shard: int, index: int) -> None:
+        self.id = node_id
+        self.online = online
+        self.shard = shard
+        self.index = index
+
+
+# What a worker records of a step for the metrics of the whole simulation
+class ShardMetrics:
+
+    def __init__(self, medium: ShardMedium) -> None:
+        self.medium = medium
+        self.transmissions = 0
+        self.duplicates = 0
+        self.false_drops = 0
+        self.deliveries: List[Tuple[int, Message, int]] = []
+
+
+    def record_transmissions(self, count: int = 1) -> None:
+        self.transmissions += count
+
+
+    def record_duplicates(self, count: int = 1) -> None:
+        self.duplicates += count
+
+
+    def record_false_drops(self, count: int = 1) -> None:
+        self.false_drops += count
+
+
+    def record_delivery(self, message: Message, node_id: int) -> None:
+        self.deliveries.append((self.medium.order_of[self.medium.find_node_by_id(node_id)], message, node_id))
+
+
+# Links and the highest node id come from the whole network, and emissions wait for the exchange
+class ShardMedium(Medium):
+
+    def __init__(self, highest_node_id: int) -> None:
+        super().__init__()
+        self.highest_node_id = highest_node_id
+        self.order_of: Dict[Node, int] = {}
+        self.emissions: List[Tuple[Node, Message]] = []
+
+
+    def propagate_message(self, message: Message, emitter: Node) -> None:
+        if self.metrics is not None:
+            self.metrics.record_transmissions()
+
+        self.emissions.append((emitter, message.hopped))
+
+
+    def get_highest_node_id(self) -> int:
+        return self.highest_node_id
+
+
+class ShardWorker:
+
+    def __init__(self, connection: Connection) -> None:
+        self.connection = connection
+        self.shard, highest_node_id, collect_metrics, node_rows, receiver_rows = connection.recv()
+
+        self.medium = ShardMedium(highest_node_id)
+        self.nodes: List[Node] = []
+
+        for order, node_class, node_id, pos, power, online, queue_capacity, drop_policy, duplicate_filter, state in node_rows:
+            node = node_class(node_id, pos, power, online, self.medium, queue_capacity=queue_capacity, drop_policy=drop_policy, duplicate_filter=duplicate_filter)
+            self.medium.add_node(node)
+            node.set_state(state)
+            self.medium.order_of[node] = order
+            self.nodes.append(node)
+
+        self.remote_nodes: Dict[Tuple[int, int], RemoteNode] = {}
+
+        for node, receivers in zip(self.nodes, receiver_rows):
+            self.medium.reachable_nodes[node] = self.get_reachable_nodes(receivers)
+
+        self.collect_metrics = collect_metrics
+        self.outbox = SharedMemory(create=True, size=INITIAL_OUTBOX_SIZE)
+        self.inboxes: Dict[int, SharedMemory] = {}
+        self.busy_nodes: List[Node] = []
+        self.local_emissions: List[Tuple[int, Message, List[Node]]] = []
+
+
+    def run(self) -> None:
+        while True:
+            command = self.connection.recv()
+
+            if command[0] == 'emit':
+                self.connection.send(self.emit(command[1]))
+            elif command[0] == 'receive':
+                self.connection.send(self.receive(command[1]))
+            elif command[0] == 'inject':
+                _, index, step = command
+                self.medium.step = step
+                message = self.nodes[index].create_message()
+                self.connection.send((message, len(self.medium.busy_nodes)))
+            elif command[0] == 'consumed':
+                _, index, message_id = command
+                self.connection.send(self.nodes[index].consumed_message_ids.peek(message_id))
+            elif command[0] == 'update':
+                _, node_rows, statuses, link_rows = command
+                self.connection.send(self.update(node_rows, statuses, link_rows))
+            elif command[0] == 'store':
+                self.connection.send([node.get_state() for node in self.nodes])
+            elif command[0] == 'close':
+                self.close()
+                self.connection.send(None)
+                return
+
+
+    def get_reachable_nodes(self, receivers: List[Tuple[int, int, int, bool]]) -> List[Node | RemoteNode]:
+        reachable_nodes = []
+
+        for shard, index, node_id, online in receivers:
+            if shard == self.shard:
+                reachable_nodes.append(self.nodes[index])
+            else:
+                reachable_nodes.append(self.remote_nodes.setdefault((shard, index), RemoteNode(node_id, online, shard, index)))
+
+        return reachable_nodes
+
+
+    # The local grid only holds this worker's nodes, so the links of the emitters around the changed
+    # nodes are dropped before the nodes change and replaced by the ones sent afterwards
+    def update(self, node_rows: List[Tuple[int, Point, int, bool]], statuses: List[Tuple[int, int, bool]], link_rows: List[Tuple[int, List]]) -> int:
+        for index, _ in link_rows:
+            self.medium.reachable_nodes.pop(self.nodes[index], None)
+
+        for index, pos, power, online in node_rows:
+            node = self.nodes[index]
+
+            if node.pos.x != pos.x or node.pos.y != pos.y:
+                node.pos = pos
+
+            if node.power != power:
+                node.power = power
+
+            if node.online != online:
+                node.online = online
+
+        for shard, index, online in statuses:
+            remote_node = self.remote_nodes.get((shard, index))
+
+            if remote_node is not None:
+                remote_node.online = online
+
+        for index, receivers in link_rows:
+            emitter = self.nodes[index]
+            self.medium.reachable_nodes[emitter] = self.get_reachable_nodes(receivers)
+            self.medium.receiving_nodes.pop(emitter, None)
+
+        return len(self.medium.busy_nodes)
+
+
+    def emit(self, step: int) -> Tuple[str, Dict[int, Tuple[int, int]]]:
+        self.medium.step = step
+        self.medium.metrics = ShardMetrics(self.medium) if self.collect_metrics else None
+        self.busy_nodes = self.medium.get_busy_nodes()
+
+        for node in self.busy_nodes:
+            node.process_next_message()
+
+        for node in self.busy_nodes:
+            node.emit_next_message()
+
+        remote_emissions: Dict[int, List[Emission]] = {}
+        self.local_emissions = []
+
+        for emitter, message in self.medium.emissions:
+            order = self.medium.order_of[emitter]
+            local_receivers = []
+            remote_receivers: Dict[int, List[int]] = {}
+
+            for receiver in self.medium.get_receivers_of(emitter):
+                if type(receiver) is RemoteNode:
+                    remote_receivers.setdefault(receiver.shard, []).append(receiver.index)
+                else:
+                    local_receivers.append(receiver)
+
+            self.local_emissions.append((order, message, local_receivers))
+
+            for shard, indices in remote_receivers.items():
+                remote_emissions.setdefault(shard, []).append((order, message, tuple(indices)))
+
+        self.medium.emissions = []
+        return self.write_outbox(remote_emissions)
+
+
+    def write_outbox(self, remote_emissions: Dict[int, List[Emission]]) -> Tuple[str, Dict[int, Tuple[int, int]]]:
+        payloads = {shard: pickle.dumps(emissions, protocol=pickle.HIGHEST_PROTOCOL) for shard, emissions in remote_emissions.items()}
+        total_size = sum(len(payload) for payload in payloads.values())
+
+        if total_size > self.outbox.size:
+            self.outbox.close()
+            self.outbox.unlink()
+            self.outbox = SharedMemory(create=True, size=max(total_size, 2 * self.outbox.size))
+
+        sections = {}
+        offset = 0
+
+        for shard, payload in payloads.items():
+            self.outbox.buf[offset:offset + len(payload)] = payload
+            sections[shard] = (offset, len(payload))
+            offset += len(payload)
+
+        return (self.outbox.name, sections)
+
+
+    def receive(self, sections: List[Tuple[int, str, int, int]]) -> Tuple[int, Tuple[int, int, int], Tuple]:
+        emissions = list(self.local_emissions)
+
+        for shard, name, offset, size in sections:
+            with self.attach(shard, name).buf[offset:offset + size] as payload:
+                for order, message, indices in pickle.loads(payload):
+                    emissions.append((order, message, [self.nodes[index] for index in indices]))
+
+        # One emission per emitter and step, so the order alone sorts them
+        emissions.sort(key=lambda emission: emission[0])
+
+        for _, message, receivers in emissions:
+            for receiver in receivers:
+                receiver.receive_message(message)
+
+        self.local_emissions = []
+        self.medium.release_idle_nodes(self.busy_nodes)
+
+        metrics = self.medium.metrics
+        metrics_totals = (metrics.transmissions, metrics.duplicates, metrics.false_drops, metrics.deliveries) if metrics is not None else None
+        return (len(self.medium.busy_nodes), self.get_queue_depths(), metrics_totals)
+
+
+    # The outbox of each other worker is attached once, and again whenever it grows
+    def attach(self, shard: int, name: str) -> SharedMemory:
+        inbox = self.inboxes.get(shard)
+
+        if inbox is None or inbox.name != name:
+            if inbox is not None:
+                inbox.close()
+
+            inbox = SharedMemory(name=name)
+            self.inboxes[shard] = inbox
+
+        return inbox
+
+
+    def get_queue_depths(self) -> Tuple[int, int, int]:
+        input_queue_depth = 0
+        output_queue_depth = 0
+        max_queue_depth = 0
+
+        for node in self.medium.busy_nodes:
+            input_queue_depth += len(node.input_queue)
+            output_queue_depth += len(node.output_queue)
+            max_queue_depth = max(max_queue_depth, len(node.input_queue), len(node.output_queue))
+
+        return (input_queue_depth, output_queue_depth, max_queue_depth)
+
+
+    def close(self) -> None:
+        for inbox in self.inboxes.values():
+            inbox.close()
+
+        self.outbox.close()
+        self.outbox.unlink()
+
+
+def run_worker(connection: Connection) -> None:
+    ShardWorker(connection).run()
+
+
+from message import Message
+from node import Node
+from point import Point
@@ -1,111 +1,480 @@
 from __future__ import annotations
+import copy
 import logging
+import os
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
 
-import yaml
+from duplicate_filter import DuplicateFilter, ExactFilter, audited
+from nodes_file import FileWatcher, NodesFileReader, NODE_TYPES, UNBOUNDED_QUEUE, is_records_file, columns_from_bytes, columns_to_bytes, definition_to_columns, dump_yaml
 
 
 NODES_FILE = 'src/nodes.yml'
 
+ENGINES = ('objects', 'arrays', 'events', 'sharded')
+
+# The ideal medium delivers every emission in range, the others drop the ones that collide
+RADIO_MODELS = ('ideal', 'collisions', 'sinr')
+
+# Id, position, power, online and the options to create a node with
+ParsedNode = Tuple[int, 'Point', int, bool, Dict]
+
 
 class Simulation:
 
-    def __init__(self) -> None:
-        self.previous_nodes_file_hash: str = None
-        self.refresh()
+    def __init__(
+            self,
+            nodes_file: str = NODES_FILE,
+            engine: str = 'objects',
+            duplicate_filter: Callable[[], DuplicateFilter] = ExactFilter,
+            audit_duplicate_filters: bool = False,
+            nodes_definition: List[Dict] = None,
+            collect_metrics: bool = False,
+            event_options: Dict = None,
+            shards: int = None,
+            radio_model: str = 'ideal',
+            radio_options: Dict = None) -> None:
+
+        if engine not in ENGINES:
+            raise ValueError(f'Unknown engine "{engine}"')
+
+        if radio_model not in RADIO_MODELS:
+            raise ValueError(f'Unknown radio model "{radio_model}"')
+
+        # Only the objects engine has steps in which every busy node emits at once
+        if radio_model != 'ideal' and engine != 'objects':
+            raise ValueError('Radio models need the objects engine')
+
+        self.nodes_file = nodes_file
+        self.engine = engine
+        self.collect_metrics = collect_metrics
+
+        # Airtime, processing time and propagation delay of the events engine
+        self.event_options = event_options or {}
+
+        # SINR threshold and path loss exponent of the radio model
+        self.radio_model = radio_model
+        self.radio_options = radio_options or {}
+
+        # Worker processes of the sharded engine
+        self.shards = shards or os.cpu_count() or 1
+
+        # Audited filters count the new messages an approximate filter drops, at the cost of an exact copy of the ids
+        self.audit_duplicate_filters = audit_duplicate_filters
+        self.node_options = {
+            'duplicate_filter': audited(duplicate_filter) if audit_duplicate_filters else duplicate_filter,
+        }
+
+        self.nodes_file_watcher: FileWatcher = None
+        self.nodes_file_reader = NodesFileReader()
+        self.trace: TraceRecorder = None
+
+        # Engines that hold the node states while they run (arrays and sharded), written back to the nodes by `synchronize_nodes`
+        self.state_engine: ArrayFloodingEngine | ShardedEngine = None
+
+        if nodes_definition is not None:
+            self.load(nodes_definition)
+        else:
+            self.refresh()
 
 
-    def get_nodes_file_hash(self) -> str:
-        import hashlib
+    # Edits of the nodes file are applied to the running network instead of reloading it
+    def refresh_if_nodes_file_changed(self) -> None:
+        if self.nodes_file_watcher is None:
+            self.nodes_file_watcher = FileWatcher(self.nodes_file)
 
-        BUF_SIZE = 65536
+        contents = self.nodes_file_watcher.poll()
 
-        sha1 = hashlib.sha1()
+        if contents is not None:
+            self.apply_nodes(*self.read_nodes_file(contents))
 
-        with open(NODES_FILE, 'rb') as nodes_file:
-            while data := nodes_file.read(BUF_SIZE):
-                sha1.update(data)
 
-        return sha1.hexdigest()
+    def refresh(self) -> None:
+        with open(self.nodes_file, 'rb') as nodes_file:
+            contents = nodes_file.read()
 
+        self.load_nodes(*self.read_nodes_file(contents))
 
-    def refresh_if_nodes_file_changed(self) -> None:
-        if self.previous_nodes_file_hash != self.get_nodes_file_hash():
-            self.refresh()
+        if self.nodes_file_watcher is None:
+            self.nodes_file_watcher = FileWatcher(self.nodes_file)
 
+        self.nodes_file_watcher.mark_read(contents)
 
-    def refresh(self) -> None:
+
+    # The format is chosen by the extension of the nodes file
+    def read_nodes_file(self, contents: bytes) -> Tuple[type, Iterable[ParsedNode]]:
+        if is_records_file(self.nodes_file):
+            columns = columns_from_bytes(contents, self.nodes_file)
+            return (get_columns_node_class(columns), self.parse_columns(columns))
+
+        nodes_definition = self.nodes_file_reader.read(contents)
+        return (get_node_class(nodes_definition), map(self.parse_node, nodes_definition))
+
+
+    def load(self, nodes_definition: List[Dict]) -> None:
+        self.load_nodes(get_node_class(nodes_definition), map(self.parse_node, nodes_definition))
+
+
+    def load_nodes(self, node_class: type, parsed_nodes: Iterable[ParsedNode]) -> None:
         self.step = 0
 
         self.medium = Medium()
+        self.metrics = Metrics() if self.collect_metrics else None
+        self.medium.metrics = self.metrics
+        self.medium.trace = self.trace
+
+        self.NodeClass = node_class
+
+        # Nodes moved at the start of every step, which are not part of snapshots
+        self.mobility_models: Dict[Node, MobilityModel] = {}
+
+        for node_id, node_pos, node_power, node_is_online, node_options in parsed_nodes:
+            self.medium.add_node(self.NodeClass(node_id, node_pos, node_power, node_is_online, self.medium, **node_options))
+
+        self.default_power = self.medium.find_node_by_id(0).power
+
+        if self.state_engine is not None:
+            self.state_engine.close()
+
+        self.state_engine = None
+
+        if self.engine == 'arrays':
+            if self.NodeClass is not FloodingNode:
+                raise ValueError('The arrays engine only supports flooding networks')
+
+            from array_engine import ArrayFloodingEngine
+            self.state_engine = ArrayFloodingEngine(self.medium)
+
+        # Imported here, as multiprocessing and shared memory take longer to load than the rest of the simulation
+        if self.engine == 'sharded':
+            from sharded_engine import ShardedEngine
+            self.state_engine = ShardedEngine(self.medium, self.shards)
+
+        self.event_engine = None
+
+        if self.engine == 'events':
+            from event_engine import EventEngine
+            self.event_engine = EventEngine(self.medium, **self.event_options)
+
+        self.radio = None
+
+        if self.radio_model != 'ideal':
+            from radio import RadioModel
+            self.radio = RadioModel(self.medium, self.radio_model, **self.radio_options)
+
+        logging.info(f'Simulation initialized')
 
-        nodes_definition = yaml.safe_load(open(NODES_FILE, 'r'))
-        self.previous_nodes_file_hash = self.get_nodes_file_hash()
 
-        network_type = nodes_definition[0]['type']
+    # Only nodes whose definition changed are touched, so the step, the metrics and the messages
+    # held by the other nodes survive. Nodes with other queue settings are replaced.
+    def apply(self, nodes_definition: List[Dict]) -> None:
+        self.apply_nodes(get_node_class(nodes_definition), map(self.parse_node, nodes_definition))
 
-        self.NodeClass = None
 
-        if network_type == 'flooding':
-            self.NodeClass = FloodingNode
-        elif network_type == 'routing':
-            self.NodeClass = RoutingNode
+    def apply_nodes(self, node_class: type, parsed_nodes: Iterable[ParsedNode]) -> None:
+        if node_class is not self.NodeClass:
+            self.load_nodes(node_class, parsed_nodes)
+            return
+
+        nodes_by_id = dict(self.medium.nodes_by_id)
+        changes = 0
+
+        for node_id, node_pos, node_power, node_is_online, node_options in parsed_nodes:
+            node = nodes_by_id.pop(node_id, None)
+
+            queue_settings = (node_options.get('queue_capacity'), node_options.get('drop_policy', DROP_TAIL))
+
+            if node is not None and (node.queue_capacity, node.drop_policy) == queue_settings:
+                if node.pos.x != node_pos.x or node.pos.y != node_pos.y:
+                    node.pos = node_pos
+                    changes += 1
+
+                if node.power != node_power:
+                    node.power = node_power
+                    changes += 1
+
+                if node.online != node_is_online:
+                    node.online = node_is_online
+                    changes += 1
+
+                continue
+
+            if node is not None:
+                self.medium.remove_node(node)
+
+            self.medium.add_node(self.NodeClass(node_id, node_pos, node_power, node_is_online, self.medium, **node_options))
+            changes += 1
+
+        for node in nodes_by_id.values():
+            self.medium.remove_node(node)
+            changes += 1
+
+        self.default_power = self.medium.find_node_by_id(0).power
+        logging.info(f'Nodes file changes applied to {changes} node attributes')
+
+
+    def parse_node(self, node: Dict) -> ParsedNode:
+        node_id = int(node['id'])
+        node_pos = Point(int(node['pos']['x']), int(node['pos']['y']))
+        node_power = int(node['power'])
+        node_status = str(node['status'])
+
+        node_is_online: bool = None
+
+        if node_status == 'online':
+            node_is_online = True
+        elif node_status == 'offline':
+            node_is_online = False
         else:
             raise ValueError()
 
-        for node in nodes_definition:
-            if node['type'] != network_type:
-                raise ValueError()
+        node_options = dict(self.node_options)
 
-        for node in nodes_definition:
-            node_id = int(node['id'])
-            node_pos = Point(int(node['pos']['x']), int(node['pos']['y']))
-            node_power = int(node['power'])
-            node_status = str(node['status'])
+        if 'queue_capacity' in node:
+            node_options['queue_capacity'] = int(node['queue_capacity'])
+            node_options['drop_policy'] = str(node.get('drop_policy', DROP_TAIL))
 
-            node_is_online: bool = None
+        return (node_id, node_pos, node_power, node_is_online, node_options)
 
-            if node_status == 'online':
-                node_is_online = True
-            elif node_status == 'offline':
-                node_is_online = False
-            else:
-                raise ValueError()
 
-            self.medium.add_node(self.NodeClass(node_id, node_pos, node_power, node_is_online, self.medium))
+    def parse_columns(self, columns: np.ndarray) -> Iterator[ParsedNode]:
+        rows = zip(
+            columns['id'].tolist(),
+            columns['x'].tolist(),
+            columns['y'].tolist(),
+            columns['power'].tolist(),
+            columns['online'].tolist(),
+            columns['queue_capacity'].tolist(),
+            columns['drop_policy'].tolist())
 
-        self.default_power = self.medium.find_node_by_id(0).power
+        for node_id, x, y, power, online, queue_capacity, drop_policy in rows:
+            node_options = dict(self.node_options)
 
-        logging.info(f'Simulation initialized')
+            if queue_capacity != UNBOUNDED_QUEUE:
+                node_options['queue_capacity'] = queue_capacity
+                node_options['drop_policy'] = DROP_POLICIES[drop_policy]
+
+            yield (node_id, Point(x, y), power, online == 1, node_options)
 
 
     def save(self) -> None:
-        with open(NODES_FILE, 'w') as nodes_file:
-            nodes_file.write(yaml.dump([node.to_dict() for node in self.medium.nodes]))
-        logging.info(f'Nodes saved in "{NODES_FILE}"')
+        if is_records_file(self.nodes_file):
+            contents = columns_to_bytes(definition_to_columns([node.to_dict() for node in self.medium.nodes]))
+        else:
+            contents = dump_yaml([node.to_dict() for node in self.medium.nodes])
+
+        with open(self.nodes_file, 'wb') as nodes_file:
+            nodes_file.write(contents)
+
+        if self.nodes_file_watcher is not None:
+            self.nodes_file_watcher.mark_read(contents)
+
+        logging.info(f'Nodes saved in "{self.nodes_file}"')
+
+
+    def inject_new_message(self) -> Message:
+        node = self.medium.find_node_by_id(0)
+        self.medium.step = self.step
+
+        if self.trace is not None:
+            self.update_trace()
+
+        if self.state_engine is not None:
+            message = self.state_engine.inject_message(node)
+        else:
+            message = node.create_message()
+
+        if self.metrics is not None and message is not None:
+            self.metrics.record_injection(message, self.step)
+
+        if self.trace is not None and message is not None:
+            self.trace.record(INJECTED, node.id, message.id)
+
+        return message
 
 
-    def inject_new_message(self) -> None:
-        self.medium.find_node_by_id(0).create_message()
+    def is_delivered(self, message: FloodingMessage) -> bool:
+        destination = self.medium.find_node_by_id(message.destination_id)
+
+        if destination is None:
+            return False
+
+        if self.state_engine is not None:
+            return self.state_engine.has_consumed(destination, message.id)
+
+        return destination.consumed_message_ids.peek(message.id)
 
 
     def run_step(self) -> None:
         logging.info(f'Running step #{self.step}')
+        self.medium.step = self.step
+
+        if self.metrics is not None:
+            self.metrics.begin_step(self.step)
+
+        if len(self.mobility_models) > 0:
+            self.move_nodes()
+
+        if self.trace is not None:
+            self.update_trace()
+            self.trace.record(STEP, -1, -1)
+
+        if self.state_engine is not None:
+            self.state_engine.run_step()
+        elif self.event_engine is not None:
+            # Each step runs the events of one time unit
+            self.event_engine.run_until(self.step + 1)
+        else:
+            busy_nodes = self.medium.get_busy_nodes()
 
-        for node in self.medium.nodes:
-            node.process_next_message()
+            for node in busy_nodes:
+                node.process_next_message()
 
-        for node in self.medium.nodes:
-            node.emit_next_message()
+            for node in busy_nodes:
+                node.emit_next_message()
+
+            if self.radio is not None:
+                self.radio.resolve()
+
+            self.medium.release_idle_nodes(busy_nodes)
+
+        if self.metrics is not None:
+            self.metrics.end_step(*self.get_queue_depths())
 
         self.step += 1
 
 
+    def set_mobility(self, node: Node, model: MobilityModel) -> None:
+        if model is None:
+            self.mobility_models.pop(node, None)
+        else:
+            self.mobility_models[node] = model
+
+
+    # Positions are rounded like the ones in the nodes files, and only nodes that change cell touch the grid
+    def move_nodes(self) -> None:
+        removed_nodes = []
+
+        for node, model in self.mobility_models.items():
+            if node not in self.medium.node_orders:
+                removed_nodes.append(node)
+                continue
+
+            x, y = model.advance(self.step)
+            x, y = round(x), round(y)
+
+            if node.pos.x != x or node.pos.y != y:
+                node.pos = Point(x, y)
+
+        for node in removed_nodes:
+            del self.mobility_models[node]
+
+
+    def get_queue_depths(self) -> Tuple[int, int, int]:
+        if self.state_engine is not None:
+            return self.state_engine.get_queue_depths()
+
+        input_queue_depth = 0
+        output_queue_depth = 0
+        max_queue_depth = 0
+
+        # Only busy nodes hold messages that can still move
+        for node in self.medium.busy_nodes:
+            input_queue_depth += len(node.input_queue)
+            output_queue_depth += len(node.output_queue)
+            max_queue_depth = max(max_queue_depth, len(node.input_queue), len(node.output_queue))
+
+        return (input_queue_depth, output_queue_depth, max_queue_depth)
+
+
+    def snapshot(self) -> Snapshot:
+        from snapshot import Snapshot
+        return Snapshot.capture(self)
+
+
+    def restore(self, snapshot: Snapshot) -> None:
+        snapshot.restore(self)
+
+
+    # Forks keep the options of this simulation and share the immutable messages of the snapshot
+    def fork(self, snapshot: Snapshot = None) -> Simulation:
+        if snapshot is None:
+            snapshot = self.snapshot()
+
+        simulation = copy.copy(self)
+        simulation.trace = None
+        simulation.state_engine = None
+        simulation.restore(snapshot)
+        return simulation
+
+
+    def start_trace(self, path: str) -> None:
+        # Nodes stepped by the sharded engine's workers cannot reach the recorder
+        if self.engine == 'sharded':
+            raise ValueError('The sharded engine does not record traces')
+
+        self.stop_trace()
+        self.trace = TraceRecorder(path)
+        self.medium.trace = self.trace
+        logging.info(f'Recording trace in "{path}"')
+
+
+    def stop_trace(self) -> None:
+        if self.trace is not None:
+            self.trace.close()
+            logging.info(f'Trace saved in "{self.trace.path}"')
+
+        self.trace = None
+        self.medium.trace = None
+
+
+    # Edits made between steps reach the trace before the next event, as a new snapshot or as node changes
+    def update_trace(self) -> None:
+        self.trace.step = self.step
+
+        if self.trace.is_outdated(self.medium):
+            self.synchronize_nodes()
+            self.trace.record_snapshot(self.medium)
+        else:
+            self.trace.record_changes()
+
+
+    def is_quiescent(self) -> bool:
+        if self.state_engine is not None:
+            return self.state_engine.is_quiescent()
+
+        if self.event_engine is not None:
+            return self.event_engine.is_quiescent()
+
+        return len(self.medium.busy_nodes) <= 0
+
+
+    @property
+    def false_drops(self) -> int:
+        self.synchronize_nodes()
+        return sum(node.false_drops for node in self.medium.nodes)
+
+
+    def run_until_quiescent(self, max_steps: int = None) -> int:
+        steps = 0
+
+        while not self.is_quiescent() and (max_steps is None or steps < max_steps):
+            self.run_step()
+            steps += 1
+
+        return steps
+
+
+    def synchronize_nodes(self) -> None:
+        if self.state_engine is not None:
+            self.state_engine.store()
+
+
     def remove_node(self, node: Node) -> None:
-        self.medium.nodes.remove(node)
+        self.medium.remove_node(node)
 
 
     def clear_all_nodes(self) -> None:
-        self.medium.nodes = []
+        self.medium.clear()
 
 
     def create_node(self, pos: Point) -> None:
@@ -114,13 +483,43 @@ class Simulation:
             pos,
             self.default_power,
             True,
-            self.medium)
+            self.medium,
+            **self.node_options)
 
         self.medium.add_node(node)
 
 
 
+def get_node_class(nodes_definition: List[Dict]) -> type:
+    network_type = nodes_definition[0]['type']
+
+    if network_type == 'flooding':
+        node_class = FloodingNode
+    elif network_type == 'routing':
+        node_class = RoutingNode
+    else:
+        raise ValueError()
+
+    for node in nodes_definition:
+        if node['type'] != network_type:
+            raise ValueError()
+
+    return node_class
+
+
+def get_columns_node_class(columns: np.ndarray) -> type:
+    node_types = set(columns['type'].tolist())
+
+    if len(node_types) != 1 or max(node_types) >= len(NODE_TYPES):
+        raise ValueError()
+
+    return get_node_class([{'type': NODE_TYPES[node_types.pop()]}])
+
 
 from medium import Medium
+from message import Message, FloodingMessage
+from message_queue import DROP_TAIL, DROP_POLICIES
+from metrics import Metrics
 from node import Node, FloodingNode, RoutingNode
 from point import Point
+from tracing import TraceRecorder, STEP, INJECTED
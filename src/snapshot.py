@@ -0,0 +1,207 @@
+from __future__ import annotations
+from contextlib import contextmanager
+import gc
+import pickle
+import zlib
+from typing import Dict, Iterator, List, Tuple
+
+
+SNAPSHOT_FORMAT = 'mesh-snapshot'
+SNAPSHOT_VERSION = 1
+
+MESSAGE_KEYS = ('input_queue', 'output_queue', 'pending_messages', 'sent_messages', 'unacked_messages', 'unsent_acks', 'ready_acks')
+
+
+# Plain data only: the topology as a nodes definition, one state per node in the same order and
+# the messages, which are immutable and therefore shared by every simulation restored from it
+class Snapshot:
+
+    def __init__(
+            self,
+            step: int,
+            default_power: int,
+            nodes_definition: List[Dict],
+            node_states: List[Dict],
+            metrics_state: Dict = None,
+            event_state: Dict = None) -> None:
+
+        self.step = step
+        self.default_power = default_power
+        self.nodes_definition = nodes_definition
+        self.node_states = node_states
+        self.metrics_state = metrics_state
+
+        # Pending events and clock of the events engine, with the messages still travelling
+        self.event_state = event_state
+
+
+    @classmethod
+    def capture(cls, simulation: Simulation) -> Snapshot:
+        simulation.synchronize_nodes()
+        nodes = simulation.medium.nodes
+
+        with paused_gc():
+            return cls(
+                simulation.step,
+                simulation.default_power,
+                [node.to_dict() for node in nodes],
+                [node.get_state() for node in nodes],
+                simulation.metrics.get_state() if simulation.metrics is not None else None,
+                simulation.event_engine.get_state() if simulation.event_engine is not None else None)
+
+
+    def restore(self, simulation: Simulation) -> None:
+        with paused_gc():
+            simulation.load(self.nodes_definition)
+            simulation.step = self.step
+            simulation.default_power = self.default_power
+
+            for node, state in zip(simulation.medium.nodes, self.node_states):
+                node.set_state(state)
+
+            if simulation.metrics is not None and self.metrics_state is not None:
+                simulation.metrics = Metrics.from_state(self.metrics_state)
+                simulation.medium.metrics = simulation.metrics
+
+            # Nodes woke the new events engine at time 0 when their states were set. Snapshots of the
+            # step engines have no events to restore, so it starts at their step.
+            if simulation.event_engine is not None:
+                simulation.event_engine.set_state(self.event_state or {
+                    'time': float(self.step),
+                    'events': [],
+                    'processor_free_at': {},
+                    'radio_free_at': {},
+                })
+
+            # The arrays and sharded engines were built from the empty nodes that `load` created
+            if simulation.state_engine is not None:
+                simulation.state_engine.load()
+
+
+    def save(self, path: str) -> None:
+        messages: List[Tuple[str, Dict]] = []
+        message_indices: Dict[int, int] = {}
+
+        with paused_gc():
+            node_states = [encode_messages(state, messages, message_indices) for state in self.node_states]
+            event_state = encode_event_messages(self.event_state, messages, message_indices) if self.event_state is not None else None
+
+        data = {
+            'format': SNAPSHOT_FORMAT,
+            'version': SNAPSHOT_VERSION,
+            'step': self.step,
+            'default_power': self.default_power,
+            'nodes': self.nodes_definition,
+            'messages': messages,
+            'node_states': node_states,
+            'metrics': self.metrics_state,
+            'events': event_state,
+        }
+
+        with open(path, 'wb') as snapshot_file:
+            snapshot_file.write(zlib.compress(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL), 1))
+
+
+    @classmethod
+    def load(cls, path: str) -> Snapshot:
+        with open(path, 'rb') as snapshot_file, paused_gc():
+            data = pickle.loads(zlib.decompress(snapshot_file.read()))
+
+        if not isinstance(data, dict) or data.get('format') != SNAPSHOT_FORMAT:
+            raise ValueError(f'"{path}" is not a snapshot file')
+
+        if data['version'] != SNAPSHOT_VERSION:
+            raise ValueError(f'"{path}" has an unsupported snapshot version {data["version"]}')
+
+        with paused_gc():
+            messages = [decode_message(message) for message in data['messages']]
+            node_states = [decode_messages(state, messages) for state in data['node_states']]
+            event_state = data.get('events')
+
+            if event_state is not None:
+                event_state = decode_event_messages(event_state, messages)
+
+        return cls(data['step'], data['default_power'], data['nodes'], node_states, data['metrics'], event_state)
+
+
+# Restoring allocates lots of long-lived objects at once, collecting in between only wastes time
+@contextmanager
+def paused_gc() -> Iterator[None]:
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+
+    try:
+        yield
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+# Messages held by nodes are written once in a shared table and referenced by index, keeping them shared after loading
+def encode_messages(state: Dict, messages: List[Tuple[str, Dict]], message_indices: Dict[int, int]) -> Dict:
+    encoded_state = dict(state)
+
+    for key in MESSAGE_KEYS:
+        if key not in state:
+            continue
+
+        encoded_state[key] = tuple(encode_message(message, messages, message_indices) for message in state[key])
+
+    return encoded_state
+
+
+def encode_message(message: Message, messages: List[Tuple[str, Dict]], message_indices: Dict[int, int]) -> int:
+    index = message_indices.get(id(message))
+
+    if index is None:
+        index = len(messages)
+        message_indices[id(message)] = index
+        messages.append((type(message).__name__, message.get_fields()))
+
+    return index
+
+
+# Only receptions carry a message, the other events reference none
+def encode_event_messages(state: Dict, messages: List[Tuple[str, Dict]], message_indices: Dict[int, int]) -> Dict:
+    events = [
+        (time, kind, node_index, encode_message(message, messages, message_indices) if message is not None else None)
+        for time, kind, node_index, message in state['events']
+    ]
+
+    return dict(state, events=events)
+
+
+def decode_event_messages(state: Dict, messages: List[Message]) -> Dict:
+    events = [
+        (time, kind, node_index, messages[index] if index is not None else None)
+        for time, kind, node_index, index in state['events']
+    ]
+
+    return dict(state, events=events)
+
+
+def decode_messages(state: Dict, messages: List[Message]) -> Dict:
+    decoded_state = dict(state)
+
+    for key in MESSAGE_KEYS:
+        if key in state:
+            decoded_state[key] = tuple(messages[index] for index in state[key])
+
+    return decoded_state
+
+
+def decode_message(encoded_message: Tuple[str, Dict]) -> Message:
+    type_name, fields = encoded_message
+
+    if type_name not in MESSAGE_TYPES:
+        raise ValueError(f'Unknown message type "{type_name}"')
+
+    return MESSAGE_TYPES[type_name].from_fields(fields)
+
+
+from message import Message, FloodingMessage, RoutingMessage
+from metrics import Metrics
+from simulation import Simulation
+
+
+MESSAGE_TYPES = {message_class.__name__: message_class for message_class in (Message, FloodingMessage, RoutingMessage)}
@@ -0,0 +1,191 @@
+from __future__ import annotations
+import argparse
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import random
+from typing import Dict, Iterator, List, Set
+
+from duplicate_filter import DUPLICATE_FILTERS, FILTER_CAPACITY, FALSE_POSITIVE_RATE, filter_factory
+from headless import Runner
+from simulation import Simulation, ENGINES
+from topologies import TOPOLOGIES, generate_topology
+
+
+DEFAULT_OUTPUT = 'sweep.jsonl'
+
+# Runs go to pool workers, which are daemonic and cannot start the sharded engine's own workers.
+# They already use every core anyway.
+POOLED_ENGINES = tuple(engine for engine in ENGINES if engine != 'sharded')
+
+PARAMETERS = (
+    'topology',
+    'nodes',
+    'power',
+    'spacing',
+    'offline_fraction',
+    'messages',
+    'interval',
+    'engine',
+    'duplicate_filter',
+    'filter_capacity',
+    'false_positive_rate',
+    'seed',
+)
+
+
+def run_key(run: Dict) -> str:
+    return json.dumps([run[parameter] for parameter in PARAMETERS])
+
+
+def build_runs(args: argparse.Namespace) -> Iterator[Dict]:
+    for topology, node_count, power, spacing, offline_fraction, interval, run_index in itertools.product(
+            args.topologies,
+            args.sizes,
+            args.powers,
+            args.spacings,
+            args.offline_fractions,
+            args.intervals,
+            range(args.runs)):
+
+        yield {
+            'topology': topology,
+            'nodes': node_count,
+            'power': power,
+            'spacing': spacing,
+            'offline_fraction': offline_fraction,
+            'messages': args.messages,
+            'interval': interval,
+            'engine': args.engine,
+            'duplicate_filter': args.duplicate_filter,
+            'filter_capacity': args.filter_capacity,
+            'false_positive_rate': args.false_positive_rate,
+            'seed': args.seed + run_index,
+            'max_steps': args.max_steps,
+        }
+
+
+def take_nodes_offline(nodes_definition: List[Dict], offline_fraction: float, rng: random.Random) -> None:
+    # The source and the destination stay online, otherwise the run says nothing about the network
+    candidates = nodes_definition[1:-1]
+
+    for node in rng.sample(candidates, round(len(candidates) * offline_fraction)):
+        node['status'] = 'offline'
+
+
+def simulate(run: Dict) -> Dict:
+    logging.disable(logging.CRITICAL)
+
+    rng = random.Random(run['seed'])
+    # Without a spacing each topology uses its own default
+    options = {'spacing': run['spacing']} if run['spacing'] is not None else {}
+    nodes_definition = generate_topology(run['topology'], run['nodes'], power=run['power'], seed=run['seed'], **options)
+    take_nodes_offline(nodes_definition, run['offline_fraction'], rng)
+
+    simulation = Simulation(
+        engine=run['engine'],
+        duplicate_filter=filter_factory(run['duplicate_filter'], run['filter_capacity'], run['false_positive_rate']),
+        audit_duplicate_filters=run['duplicate_filter'] != 'exact',
+        nodes_definition=nodes_definition)
+
+    runner = Runner(simulation, run['messages'], run['interval'])
+    runner.run(None, run['max_steps'])
+
+    result = dict(run)
+    result['key'] = run_key(run)
+    result.update(runner.stats())
+    return result
+
+
+def load_completed_keys(output_path: str) -> Set[str]:
+    completed_keys = set()
+
+    if not os.path.exists(output_path):
+        return completed_keys
+
+    with open(output_path, 'r') as output_file:
+        for line in output_file:
+            # A killed sweep may leave a truncated last line behind, that run is simply redone
+            try:
+                completed_keys.add(json.loads(line)['key'])
+            except (ValueError, KeyError):
+                continue
+
+    return completed_keys
+
+
+def has_truncated_last_line(output_path: str) -> bool:
+    if os.path.getsize(output_path) <= 0:
+        return False
+
+    with open(output_path, 'rb') as output_file:
+        output_file.seek(-1, os.SEEK_END)
+        return output_file.read(1) != b'\n'
+
+
+def summarize(output_path: str) -> None:
+    groups: Dict[str, List[Dict]] = {}
+
+    with open(output_path, 'r') as output_file:
+        for line in output_file:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+
+            # Results of sweeps without a spacing axis lack it
+            group = json.dumps([result.get(parameter) for parameter in PARAMETERS if parameter != 'seed'])
+            groups.setdefault(group, []).append(result)
+
+    for group, results in sorted(groups.items()):
+        delivery_ratio = sum(result['delivery_ratio'] for result in results) / len(results)
+        latencies = [result['mean_latency'] for result in results if result['mean_latency'] is not None]
+        mean_latency = f'{sum(latencies) / len(latencies):.2f}' if len(latencies) > 0 else '-'
+        # Results of sweeps from before the duplicate filter option lack it
+        false_drops = sum(result.get('false_drops', 0) for result in results) / len(results)
+        print(f'{group}: runs={len(results)} delivery_ratio={delivery_ratio:.3f} mean_latency={mean_latency} false_drops={false_drops:.1f}')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Run seeded simulations over a parameter grid in parallel')
+    parser.add_argument('--topologies', nargs='+', choices=sorted(TOPOLOGIES), default=['random'])
+    parser.add_argument('--sizes', nargs='+', type=int, default=[100])
+    parser.add_argument('--powers', nargs='+', type=int, default=[4])
+    parser.add_argument('--spacings', nargs='+', type=float, default=[None], help='distances between neighbouring nodes, independent of the power (default: each topology\'s own)')
+    parser.add_argument('--offline-fractions', nargs='+', type=float, default=[0.0])
+    parser.add_argument('--intervals', nargs='+', type=int, default=[1], help='steps between injected messages')
+    parser.add_argument('--messages', type=int, default=10, help='messages injected per run')
+    parser.add_argument('--runs', type=int, default=10, help='seeded runs per parameter combination')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--engine', choices=POOLED_ENGINES, default='objects')
+    parser.add_argument('--duplicate-filter', choices=DUPLICATE_FILTERS, default='exact', help='how nodes remember the messages they have seen, lru and bloom ones are audited to count false drops (default: exact)')
+    parser.add_argument('--filter-capacity', type=int, default=FILTER_CAPACITY, help=f'lru and bloom filters: message ids remembered per filter (default: {FILTER_CAPACITY})')
+    parser.add_argument('--false-positive-rate', type=float, default=FALSE_POSITIVE_RATE, help=f'bloom filter: share of new messages taken for duplicates (default: {FALSE_POSITIVE_RATE})')
+    parser.add_argument('--max-steps', type=int, default=10000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help=f'results file, one JSON line per run (default: {DEFAULT_OUTPUT})')
+    args = parser.parse_args()
+
+    completed_keys = load_completed_keys(args.output)
+    runs = [run for run in build_runs(args) if run_key(run) not in completed_keys]
+
+    print(f'{len(completed_keys)} runs already in "{args.output}", {len(runs)} to go')
+
+    with open(args.output, 'a') as output_file, multiprocessing.Pool(args.workers) as pool:
+        if has_truncated_last_line(args.output):
+            output_file.write('\n')
+
+        for i, result in enumerate(pool.imap_unordered(simulate, runs), start=1):
+            output_file.write(json.dumps(result) + '\n')
+            output_file.flush()
+
+            if i % 100 == 0 or i == len(runs):
+                print(f'{i}/{len(runs)} runs done')
+
+    summarize(args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+from __future__ import annotations
+import argparse
+import math
+import random
+from typing import Callable, Dict, List, Tuple
+
+import yaml
+
+
+Position = Tuple[int, int]
+
+# Layouts are built from a spacing between nodes that does not depend on their power, so sweeping the power
+# changes the number of neighbours and sweeping the spacing changes the density. For the scattered layouts it
+# is the side of the area each node gets, which puts pi * (power / spacing) ** 2 nodes in range on average.
+
+
+def node_definition(node_id: int, pos: Position, power: int, network_type: str) -> Dict:
+    return {
+        'id': node_id,
+        'pos': {
+            'x': pos[0],
+            'y': pos[1],
+        },
+        'power': power,
+        'status': 'online',
+        'type': network_type,
+    }
+
+
+# Ids follow the given order, so node 0 (the source) and the highest id (the destination) are at both ends
+def build_definition(positions: List[Position], power: int, network_type: str) -> List[Dict]:
+    return [node_definition(node_id, pos, power, network_type) for node_id, pos in enumerate(positions)]
+
+
+def grid_topology(node_count: int, power: int = 2, network_type: str = 'flooding', seed: int = 0, spacing: float = 2) -> List[Dict]:
+    columns = math.ceil(math.sqrt(node_count))
+    positions = [(round((i % columns) * spacing), -round((i // columns) * spacing)) for i in range(node_count)]
+    return build_definition(positions, power, network_type)
+
+
+def line_topology(node_count: int, power: int = 2, network_type: str = 'flooding', seed: int = 0, spacing: float = 2) -> List[Dict]:
+    positions = [(round(i * spacing), 0) for i in range(node_count)]
+    return build_definition(positions, power, network_type)
+
+
+def ring_topology(node_count: int, power: int = 4, network_type: str = 'flooding', seed: int = 0, spacing: float = 3) -> List[Dict]:
+    radius = max(spacing, node_count * spacing / (2 * math.pi))
+
+    positions = [
+        (round(radius * math.cos(2 * math.pi * i / node_count)), round(radius * math.sin(2 * math.pi * i / node_count)))
+        for i in range(node_count)]
+
+    # The destination goes to the opposite side of the ring instead of next to node 0
+    opposite = node_count // 2
+    positions[opposite], positions[-1] = positions[-1], positions[opposite]
+
+    return build_definition(positions, power, network_type)
+
+
+def random_geometric_topology(
+        node_count: int,
+        power: int = 4,
+        network_type: str = 'flooding',
+        seed: int = 0,
+        spacing: float = 2) -> List[Dict]:
+
+    rng = random.Random(seed)
+    side = spacing * math.sqrt(node_count)
+
+    positions = [(round(rng.uniform(0, side)), round(rng.uniform(0, side))) for _ in range(node_count)]
+    positions.sort()
+
+    return build_definition(positions, power, network_type)
+
+
+def clustered_topology(
+        node_count: int,
+        power: int = 4,
+        network_type: str = 'flooding',
+        seed: int = 0,
+        spacing: float = 2,
+        cluster_size: int = 50) -> List[Dict]:
+
+    rng = random.Random(seed)
+    cluster_count = max(1, node_count // cluster_size)
+    cluster_radius = spacing * math.sqrt(min(cluster_size, node_count) / math.pi)
+
+    # Cluster centres follow a random walk, so neighbouring clusters overlap and the whole layout stays connected
+    centres = [(0.0, 0.0)]
+
+    for _ in range(cluster_count - 1):
+        angle = rng.uniform(-math.pi / 2, math.pi / 2)
+        last_x, last_y = centres[-1]
+        centres.append((last_x + cluster_radius * math.cos(angle), last_y + cluster_radius * math.sin(angle)))
+
+    positions = []
+
+    for i in range(node_count):
+        centre_x, centre_y = centres[i * cluster_count // node_count]
+        positions.append((round(rng.gauss(centre_x, cluster_radius / 2)), round(rng.gauss(centre_y, cluster_radius / 2))))
+
+    # Gaussian outliers make bad endpoints, so the source and destination are the nodes closest to the first and last centres
+    move_closest_to(positions, centres[0], 0)
+    move_closest_to(positions, centres[-1], len(positions) - 1)
+
+    return build_definition(positions, power, network_type)
+
+
+def bridge_topology(
+        node_count: int,
+        power: int = 4,
+        network_type: str = 'flooding',
+        seed: int = 0,
+        spacing: float = 2,
+        bridge_length: int = 5) -> List[Dict]:
+
+    rng = random.Random(seed)
+    bridge_length = min(bridge_length, node_count)
+    side_count = (node_count - bridge_length) // 2
+    side = spacing * math.sqrt(max(side_count, 1))
+
+    left = [(round(rng.uniform(-side, 0)), round(rng.uniform(-side / 2, side / 2))) for _ in range(side_count)]
+    bridge = [(round(i * spacing), 0) for i in range(1, bridge_length + 1)]
+    offset = round((bridge_length + 1) * spacing)
+    right = [(round(offset + rng.uniform(0, side)), round(rng.uniform(-side / 2, side / 2))) for _ in range(node_count - side_count - bridge_length)]
+
+    # The bridge ends touch the nearest node of each side
+    left.sort()
+    right.sort()
+
+    if len(left) > 0:
+        left[-1] = (0, 0)
+
+    if len(right) > 0:
+        right[0] = (offset, 0)
+
+    return build_definition(left + bridge + right, power, network_type)
+
+
+def move_closest_to(positions: List[Position], target: Tuple[float, float], index: int) -> None:
+    closest = min(range(len(positions)), key=lambda i: (positions[i][0] - target[0]) ** 2 + (positions[i][1] - target[1]) ** 2)
+    positions[index], positions[closest] = positions[closest], positions[index]
+
+
+TOPOLOGIES: Dict[str, Callable[..., List[Dict]]] = {
+    'grid': grid_topology,
+    'line': line_topology,
+    'ring': ring_topology,
+    'random': random_geometric_topology,
+    'clustered': clustered_topology,
+    'bridge': bridge_topology,
+}
+
+
+def generate_topology(kind: str, node_count: int, **options) -> List[Dict]:
+    if kind not in TOPOLOGIES:
+        raise ValueError(f'Unknown topology "{kind}"')
+
+    return TOPOLOGIES[kind](node_count, **options)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a nodes file with a synthetic topology')
+    parser.add_argument('kind', choices=sorted(TOPOLOGIES))
+    parser.add_argument('node_count', type=int)
+    parser.add_argument('--power', type=int, default=None)
+    parser.add_argument('--spacing', type=float, default=None, help='distance between neighbouring nodes, independent of the power')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--type', dest='network_type', choices=('flooding', 'routing'), default='flooding')
+    parser.add_argument('--output', default='-', help='nodes file to write (default: stdout)')
+    args = parser.parse_args()
+
+    options = {'network_type': args.network_type, 'seed': args.seed}
+
+    if args.power is not None:
+        options['power'] = args.power
+
+    if args.spacing is not None:
+        options['spacing'] = args.spacing
+
+    nodes_definition = generate_topology(args.kind, args.node_count, **options)
+    nodes_yaml = yaml.dump(nodes_definition, Dumper=getattr(yaml, 'CSafeDumper', yaml.SafeDumper))
+
+    if args.output == '-':
+        print(nodes_yaml, end='')
+    else:
+        with open(args.output, 'w') as nodes_file:
+            nodes_file.write(nodes_yaml)
@@ -0,0 +1,171 @@
+from __future__ import annotations
+import struct
+from typing import Dict, Iterable
+
+
+TRACE_FILE = 'trace.bin'
+
+TRACE_MAGIC = b'MESHTRC\x00'
+# Version 2 added the node change events, so version 1 traces still read fine
+TRACE_VERSION = 2
+
+# Every record is (step, event, node id, value). The value is the message id for message
+# events and the node field being described for topology events.
+HEADER = struct.Struct('<8sII')
+RECORD = struct.Struct('<IBxxxii')
+
+STEP = 0
+SNAPSHOT = 1
+NODE_X = 2
+NODE_Y = 3
+NODE_POWER = 4
+NODE_STATUS = 5
+QUEUED = 6
+INJECTED = 7
+RECEIVED = 8
+DROPPED = 9
+EVICTED = 10
+PROCESSED = 11
+EMITTED = 12
+DELIVERED = 13
+COLLIDED = 14
+MOVED_X = 15
+MOVED_Y = 16
+POWER_CHANGED = 17
+STATUS_CHANGED = 18
+
+EVENT_NAMES = (
+    'step',
+    'snapshot',
+    'node_x',
+    'node_y',
+    'node_power',
+    'node_status',
+    'queued',
+    'injected',
+    'received',
+    'dropped',
+    'evicted',
+    'processed',
+    'emitted',
+    'delivered',
+    'collided',
+    'moved_x',
+    'moved_y',
+    'power_changed',
+    'status_changed',
+)
+
+WRITE_BUFFER_SIZE = 1 << 20
+
+# Steps between full snapshots while nodes keep changing, so replays seeking back do not start far behind
+KEYFRAME_INTERVAL = 1000
+
+
+def record_dtype():
+    import numpy as np
+
+    return np.dtype({
+        'names': ['step', 'event', 'node_id', 'value'],
+        'formats': ['<u4', 'u1', '<i4', '<i4'],
+        'offsets': [0, 4, 8, 12],
+        'itemsize': RECORD.size,
+    })
+
+
+class TraceRecorder:
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.file = open(path, 'wb', buffering=WRITE_BUFFER_SIZE)
+        self.file.write(HEADER.pack(TRACE_MAGIC, TRACE_VERSION, RECORD.size))
+
+        self.step = 0
+
+        # What the latest snapshot recorded: nodes added or removed since then need a new one
+        self.medium: Medium = None
+        self.node_count: int = None
+        self.next_node_order: int = None
+        self.snapshot_step = 0
+        self.changed_since_snapshot = False
+
+        # Filled by the medium while recording, and written as changes before the next event
+        self.moved_nodes: Dict[Node, None] = {}
+        self.edited_nodes: Dict[Node, None] = {}
+
+
+    def record(self, event: int, node_id: int, value: int) -> None:
+        self.file.write(RECORD.pack(self.step, event, node_id, value))
+
+
+    # Bulk variant for the arrays engine, which already has the node and message ids as arrays
+    def record_many(self, event: int, node_ids: Iterable[int], values: Iterable[int]) -> None:
+        import numpy as np
+
+        node_ids = np.asarray(node_ids)
+
+        if len(node_ids) <= 0:
+            return
+
+        records = np.zeros(len(node_ids), dtype=record_dtype())
+        records['step'] = self.step
+        records['event'] = event
+        records['node_id'] = node_ids
+        records['value'] = values
+        self.file.write(records.tobytes())
+
+
+    def is_outdated(self, medium: Medium) -> bool:
+        if medium is not self.medium or len(medium.node_orders) != self.node_count or medium.next_node_order != self.next_node_order:
+            return True
+
+        changing = self.changed_since_snapshot or len(self.moved_nodes) > 0 or len(self.edited_nodes) > 0
+        return changing and self.step - self.snapshot_step >= KEYFRAME_INTERVAL
+
+
+    # Only the fields that changed, so moving nodes cost two records each instead of a whole snapshot
+    def record_changes(self) -> None:
+        for node in self.moved_nodes:
+            self.record(MOVED_X, node.id, int(node.pos.x))
+            self.record(MOVED_Y, node.id, int(node.pos.y))
+
+        for node in self.edited_nodes:
+            self.record(POWER_CHANGED, node.id, node.power)
+            self.record(STATUS_CHANGED, node.id, 1 if node.online else 0)
+
+        if len(self.moved_nodes) > 0 or len(self.edited_nodes) > 0:
+            self.changed_since_snapshot = True
+            self.moved_nodes = {}
+            self.edited_nodes = {}
+
+
+    # The whole topology and the input queues are written again when nodes are added or removed, and
+    # periodically while they change, so a replay can start from the latest snapshot instead of from
+    # the beginning of the trace
+    def record_snapshot(self, medium: Medium) -> None:
+        self.record(SNAPSHOT, -1, len(medium.nodes))
+
+        for node in medium.nodes:
+            self.record(NODE_X, node.id, int(node.pos.x))
+            self.record(NODE_Y, node.id, int(node.pos.y))
+            self.record(NODE_POWER, node.id, node.power)
+            self.record(NODE_STATUS, node.id, 1 if node.online else 0)
+
+            for message in node.input_queue:
+                self.record(QUEUED, node.id, message.id)
+
+        self.medium = medium
+        self.node_count = len(medium.nodes)
+        self.next_node_order = medium.next_node_order
+        self.snapshot_step = self.step
+        self.changed_since_snapshot = False
+        self.moved_nodes = {}
+        self.edited_nodes = {}
+
+
+    def close(self) -> None:
+        self.file.close()
+
+
+from medium import Medium
+from node import Node
@@ -0,0 +1,31 @@
+from duplicate_filter import AuditedFilter, BloomFilter, filter_factory
+from simulation import Simulation
+from topologies import generate_topology
+
+
+def test_peek_does_not_count_as_a_lookup() -> None:
+    duplicate_filter = AuditedFilter(BloomFilter(capacity=4, false_positive_rate=0.5))
+
+    for message_id in range(4):
+        duplicate_filter.add(message_id)
+
+    assert not any(duplicate_filter.peek(message_id) for message_id in range(4, 1000))
+    assert duplicate_filter.false_positives == 0
+
+
+# Small, loose filters drop some new messages, which the metrics and the filters must agree on
+def test_false_drops_match_metrics() -> None:
+    simulation = Simulation(
+        nodes_definition=generate_topology('random', 100, power=4, seed=1),
+        duplicate_filter=filter_factory('bloom', 16, 0.3),
+        audit_duplicate_filters=True,
+        collect_metrics=True)
+
+    for step in range(400):
+        if step < 100:
+            simulation.inject_new_message()
+
+        simulation.run_step()
+
+    assert simulation.false_drops > 0
+    assert simulation.metrics.summary()['false_drops'] == simulation.false_drops
@@ -0,0 +1,17 @@
+from simulation import Simulation
+from topologies import generate_topology
+
+
+# Cached links hold the emitters and their receivers, which must not outlive the nodes
+def test_clear_drops_cached_links() -> None:
+    simulation = Simulation(nodes_definition=generate_topology('random', 50, power=4, seed=1), radio_model='collisions')
+    simulation.inject_new_message()
+
+    for _ in range(10):
+        simulation.run_step()
+
+    assert len(simulation.radio.links) > 0
+
+    simulation.clear_all_nodes()
+    assert simulation.radio.links == {}
+    assert simulation.radio.emissions == []
@@ -0,0 +1,55 @@
+import pytest
+
+from node import ROUTE_REQUEST_TIMEOUT, ROUTE_REQUEST_RETRIES
+from simulation import Simulation
+from topologies import line_topology
+
+
+def run_until_quiescent(simulation: Simulation, max_steps: int = 20000) -> None:
+    for _ in range(max_steps):
+        simulation.run_step()
+
+        if simulation.is_quiescent():
+            return
+
+    raise AssertionError(f'not quiescent after {max_steps} steps')
+
+
+# Round trips along these lines take several request timeouts
+@pytest.mark.parametrize('node_count', [160, 200])
+def test_long_line_delivers(node_count: int) -> None:
+    simulation = Simulation(nodes_definition=line_topology(node_count, network_type='routing'), collect_metrics=True)
+    simulation.inject_new_message()
+    run_until_quiescent(simulation)
+
+    summary = simulation.metrics.summary()
+    assert summary['delivered'] == 1
+    assert summary['transmissions'] < 10 * (node_count - 1)
+
+
+def test_late_reply_delivers_waiting_messages() -> None:
+    simulation = Simulation(nodes_definition=line_topology(6, network_type='routing'), collect_metrics=True)
+    destination = simulation.medium.find_node_by_id(5)
+    destination.online = False
+    simulation.inject_new_message()
+
+    # Back after several retries, but before the last one times out
+    for _ in range(ROUTE_REQUEST_TIMEOUT * (2 ** ROUTE_REQUEST_RETRIES - 1)):
+        simulation.run_step()
+
+    destination.online = True
+    run_until_quiescent(simulation)
+
+    assert simulation.metrics.summary()['delivered'] == 1
+
+
+def test_unreachable_destination_gives_up() -> None:
+    simulation = Simulation(nodes_definition=line_topology(6, network_type='routing'), collect_metrics=True)
+    simulation.medium.find_node_by_id(5).online = False
+    simulation.inject_new_message()
+    run_until_quiescent(simulation)
+
+    origin = simulation.medium.find_node_by_id(0)
+    assert simulation.metrics.summary()['delivered'] == 0
+    assert origin.pending_messages == {}
+    assert origin.request_retries == {}
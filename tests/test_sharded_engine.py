@@ -0,0 +1,47 @@
+from typing import List, Tuple
+
+from mobility import random_waypoints
+from simulation import Simulation
+from topologies import generate_topology
+
+
+def run(engine: str, network_type: str) -> Tuple[List, List, List]:
+    nodes_definition = [dict(node, type=network_type) for node in generate_topology('random', 200, power=4, seed=5)]
+    simulation = Simulation(engine=engine, nodes_definition=nodes_definition, collect_metrics=True, shards=2)
+
+    for node, model in random_waypoints(list(simulation.medium.nodes), 0.2, 0.5, 1.0, 0, 2).items():
+        simulation.set_mobility(node, model)
+
+    worker_ids = []
+
+    for step in range(150):
+        if step % 5 == 0:
+            simulation.inject_new_message()
+
+        if step == 40:
+            simulation.medium.find_node_by_id(17).online = False
+            simulation.medium.find_node_by_id(40).power = 6
+
+        if step == 80:
+            simulation.medium.find_node_by_id(17).online = True
+
+        simulation.run_step()
+
+        if simulation.state_engine is not None:
+            worker_ids.append([worker.pid for worker, _ in simulation.state_engine.workers])
+
+    if simulation.state_engine is not None:
+        simulation.state_engine.close()
+
+    return simulation.metrics.step_rows, simulation.metrics.delivery_rows, worker_ids
+
+
+# Moves, toggles and power changes reach the workers without restarting them, and the runs stay identical
+def test_changes_reach_workers() -> None:
+    for network_type in ('flooding', 'routing'):
+        step_rows, delivery_rows, _ = run('objects', network_type)
+        sharded_step_rows, sharded_delivery_rows, worker_ids = run('sharded', network_type)
+
+        assert sharded_step_rows == step_rows
+        assert sharded_delivery_rows == delivery_rows
+        assert all(ids == worker_ids[0] for ids in worker_ids)
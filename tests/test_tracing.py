@@ -0,0 +1,56 @@
+from typing import Dict
+
+import numpy as np
+
+from medium import Medium
+from mobility import random_waypoints
+from replay import Timeline, read_trace
+from simulation import Simulation
+from topologies import generate_topology
+from tracing import KEYFRAME_INTERVAL, MOVED_Y, SNAPSHOT
+
+
+def node_states(medium: Medium) -> Dict:
+    return {node.id: (int(node.pos.x), int(node.pos.y), node.power, node.online, len(node.input_queue)) for node in medium.nodes}
+
+
+# Moves reach the trace as changes, with a keyframe now and then, and replays still match the run frame by frame
+def test_moving_nodes_replay(tmp_path) -> None:
+    simulation = Simulation(nodes_definition=generate_topology('random', 60, power=4, seed=2))
+
+    for node, model in random_waypoints(list(simulation.medium.nodes), 0.5, 0.5, 1.0, 0, 1).items():
+        simulation.set_mobility(node, model)
+
+    expected = []
+    move_nodes = simulation.move_nodes
+
+    # Frames show the network after the moves of their step
+    def move_and_capture() -> None:
+        move_nodes()
+        expected.append(node_states(simulation.medium))
+
+    simulation.move_nodes = move_and_capture
+    simulation.start_trace(str(tmp_path / 'trace.bin'))
+
+    for step in range(KEYFRAME_INTERVAL + 200):
+        if step % 50 == 0:
+            simulation.inject_new_message()
+
+        if step == 300:
+            node = simulation.medium.find_node_by_id(5)
+            node.online = False
+            node.power = 6
+
+        simulation.run_step()
+
+    simulation.stop_trace()
+
+    records = read_trace(str(tmp_path / 'trace.bin'))
+    assert np.count_nonzero(records['event'] == SNAPSHOT) == 2
+    assert np.count_nonzero(records['event'] == MOVED_Y) > 0
+
+    timeline = Timeline(records)
+
+    for frame in (len(expected) - 1, 0, 299, 300, KEYFRAME_INTERVAL - 1, KEYFRAME_INTERVAL + 1, 700):
+        timeline.seek(frame)
+        assert node_states(timeline.medium) == expected[frame]